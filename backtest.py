@@ -0,0 +1,231 @@
+import argparse
+import io
+import json
+import time
+from collections import defaultdict
+
+import boto3
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+# Walk-forward (rolling-origin) backtest nad obrađenim skupom podataka:
+# model se trenira na prozoru od train_window redova, predviđa narednih
+# test_window redova, pa se početak pomera za step redova.
+#
+#   python backtest.py --bucket stock-data-607282882839-us-east-1 \
+#       --dataset training/processed/AAPL.csv --model random_forest \
+#       --train-window 5000 --test-window 500 --step 500 --refit-every 4
+
+TARGET_COLUMN = 'close'
+# Feature kolone su sve kolone skupa osim vremena bara i cilja, kao u trenerima
+NON_FEATURE_COLUMNS = ['t', 'date', TARGET_COLUMN]
+
+# Tipovi processed skupa: 't' (epoch ms) kao int64, ostalo kao float32; stariji
+# skupovi imaju YYYY-MM-DD kolonu 'date' i float64 vrednosti
+CSV_DTYPES = defaultdict(lambda: 'float32', t='int64', date='object')
+
+MODELS = {
+    'linear_regression': lambda: LinearRegression(),
+    'decision_tree': lambda: DecisionTreeRegressor(max_depth=10, random_state=42),
+    'random_forest': lambda: RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42, n_jobs=-1),
+}
+
+# Kompresija se prepoznaje po ekstenziji ključa (.gz, .zst)
+def compression_for(file_key):
+    if file_key.endswith('.gz'):
+        return 'gzip'
+    if file_key.endswith('.zst'):
+        return 'zstd'
+    return None
+
+def feature_columns(data):
+    return [column for column in data.columns if column not in NON_FEATURE_COLUMNS]
+
+# Skup se čita iz S3 ako je zadat bucket, inače sa lokalnog diska
+def load_dataset(dataset, bucket_name=None, s3_client=None):
+    if bucket_name:
+        s3_client = s3_client or boto3.client('s3')
+        body = s3_client.get_object(Bucket=bucket_name, Key=dataset)['Body']
+        source = io.BytesIO(body.read()) if dataset.endswith('.parquet') else body
+    else:
+        source = dataset
+    if dataset.endswith('.parquet'):
+        data = pd.read_parquet(source)
+        return data.astype({column: 'float32' for column in data.columns if data[column].dtype == 'float64'})
+    return pd.read_csv(source, dtype=CSV_DTYPES, compression=compression_for(dataset))
+
+# Vreme barova za izveštaj: UTC timestamp iz 't', ili datum starijih skupova
+def bar_times(data):
+    if 't' in data.columns:
+        return pd.to_datetime(data['t'], unit='ms').to_numpy()
+    return data['date'].to_numpy()
+
+# Granice foldova kao nizovi: trening [train_start, train_end), test [train_end, test_end).
+# Sa expanding=True svaki trening prozor počinje od prvog reda.
+def walk_forward_folds(rows, train_window, test_window, step, expanding=False):
+    for name, value in (('train_window', train_window), ('test_window', test_window), ('step', step)):
+        if value < 1:
+            raise ValueError(f"{name} mora biti najmanje 1, dobijeno {value}")
+    if train_window + test_window > rows:
+        raise ValueError(f"{rows} redova nije dovoljno za train_window={train_window} i test_window={test_window}")
+    train_end = np.arange(train_window, rows - test_window + 1, step)
+    train_start = np.zeros_like(train_end) if expanding else train_end - train_window
+    return train_start, train_end, train_end + test_window
+
+# Linearna regresija za sve foldove odjednom. X'X i X'y svakog prozora su
+# razlike prefiksnih suma na granicama foldova, pa se redovi zajednički za više
+# prozora sabiraju samo jednom. Kolone se pre toga centriraju i skaliraju, da
+# razlike velikih suma ne gube preciznost.
+def fit_linear_folds(X, y, train_start, train_end):
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    Z = np.hstack([np.ones((len(X), 1)), (X - mean) / scale])
+    y_mean = y.mean()
+
+    boundaries = np.unique(np.concatenate([[0], train_start, train_end]))
+    gram = np.zeros((len(boundaries), Z.shape[1], Z.shape[1]))
+    moment = np.zeros((len(boundaries), Z.shape[1]))
+    for i in range(1, len(boundaries)):
+        segment = slice(boundaries[i - 1], boundaries[i])
+        gram[i] = gram[i - 1] + Z[segment].T @ Z[segment]
+        moment[i] = moment[i - 1] + Z[segment].T @ (y[segment] - y_mean)
+
+    start = np.searchsorted(boundaries, train_start)
+    end = np.searchsorted(boundaries, train_end)
+    fold_gram = gram[end] - gram[start]
+    fold_moment = moment[end] - moment[start]
+    try:
+        coef = np.linalg.solve(fold_gram, fold_moment[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        coef = np.einsum('fij,fj->fi', np.linalg.pinv(fold_gram), fold_moment)
+
+    # Vraćanje u originalne jedinice: predikcija = intercept + X @ weights
+    weights = coef[:, 1:] / scale
+    intercept = coef[:, 0] + y_mean - weights @ mean
+    return intercept, weights
+
+def predict_linear_folds(X, intercept, weights, train_end, test_end):
+    fold_ids = np.repeat(np.arange(len(train_end)), test_end - train_end)
+    rows = np.concatenate([np.arange(a, b) for a, b in zip(train_end, test_end)])
+    predictions = intercept[fold_ids] + np.einsum('ij,ij->i', X[rows], weights[fold_ids])
+    return rows, fold_ids, predictions
+
+# Opšti modeli se treniraju na pogledima nad jednom float32 matricom. Sa
+# refit_every=k jedan istrenirani model predviđa k uzastopnih foldova.
+def predict_model_folds(model, X, y, train_start, train_end, test_end, refit_every=1):
+    rows, fold_ids, predictions = [], [], []
+    fitted = None
+    for fold in range(len(train_end)):
+        if fitted is None or fold % refit_every == 0:
+            fitted = clone(model).fit(X[train_start[fold]:train_end[fold]], y[train_start[fold]:train_end[fold]])
+        test_rows = np.arange(train_end[fold], test_end[fold])
+        rows.append(test_rows)
+        fold_ids.append(np.full(len(test_rows), fold))
+        predictions.append(fitted.predict(X[train_end[fold]:test_end[fold]]))
+    return np.concatenate(rows), np.concatenate(fold_ids), np.concatenate(predictions)
+
+# Metrike po foldu preko bincount-a nad svim test redovima odjednom.
+# Smer je pogođen kada predikcija i stvarna vrednost idu na istu stranu od
+# poslednje poznate cene (close prethodnog reda).
+def fold_metrics(actual, predicted, previous, fold_ids, folds):
+    counts = np.bincount(fold_ids, minlength=folds)
+    errors = predicted - actual
+    sse = np.bincount(fold_ids, errors ** 2, minlength=folds)
+    actual_sum = np.bincount(fold_ids, actual, minlength=folds)
+    actual_squares = np.bincount(fold_ids, actual ** 2, minlength=folds)
+    total = actual_squares - actual_sum ** 2 / counts
+    hits = np.sign(predicted - previous) == np.sign(actual - previous)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'rows': counts,
+            'mse': sse / counts,
+            'rmse': np.sqrt(sse / counts),
+            'mae': np.bincount(fold_ids, np.abs(errors), minlength=folds) / counts,
+            'r2': np.where(total > 0, 1 - sse / total, np.nan),
+            'directional_accuracy': np.bincount(fold_ids, hits, minlength=folds) / counts,
+        }
+
+def run_backtest(data, model, train_window, test_window, step, expanding=False, refit_every=1):
+    X = data[feature_columns(data)].to_numpy(dtype=np.float64)
+    y = data[TARGET_COLUMN].to_numpy(dtype=np.float64)
+    train_start, train_end, test_end = walk_forward_folds(len(X), train_window, test_window, step, expanding)
+
+    start = time.perf_counter()
+    if type(model) is LinearRegression and model.fit_intercept:
+        intercept, weights = fit_linear_folds(X, y, train_start, train_end)
+        rows, fold_ids, predictions = predict_linear_folds(X, intercept, weights, train_end, test_end)
+    else:
+        rows, fold_ids, predictions = predict_model_folds(
+            model, np.ascontiguousarray(X, dtype=np.float32), y, train_start, train_end, test_end, refit_every
+        )
+    metrics = fold_metrics(y[rows], predictions, y[rows - 1], fold_ids, len(train_end))
+    elapsed = time.perf_counter() - start
+
+    dates = bar_times(data)
+    folds = pd.DataFrame({
+        'fold': np.arange(len(train_end)),
+        'train_from': dates[train_start],
+        'train_to': dates[train_end - 1],
+        'test_from': dates[train_end],
+        'test_to': dates[test_end - 1],
+        **metrics,
+    })
+    errors = predictions - y[rows]
+    summary = {
+        'folds': len(train_end),
+        'predictions': len(rows),
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'mae': float(np.mean(np.abs(errors))),
+        'directional_accuracy': float(np.mean(np.sign(predictions - y[rows - 1]) == np.sign(y[rows] - y[rows - 1]))),
+        'seconds': elapsed,
+        'folds_per_second': len(train_end) / elapsed if elapsed > 0 else float('inf'),
+    }
+    return folds, summary
+
+# Prozori, korak i refit_every su broj redova ili foldova, najmanje 1
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"mora biti najmanje 1, dobijeno {value}")
+    return number
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', required=True, help='S3 ključ (uz --bucket) ili lokalna putanja obrađenog skupa')
+    parser.add_argument('--bucket')
+    parser.add_argument('--model', default='linear_regression', choices=sorted(MODELS))
+    parser.add_argument('--model-key', help='joblib model iz S3 (uz --bucket); koriste se njegovi hiperparametri')
+    parser.add_argument('--train-window', type=positive_int, required=True)
+    parser.add_argument('--test-window', type=positive_int, required=True)
+    parser.add_argument('--step', type=positive_int)
+    parser.add_argument('--expanding', action='store_true', help='trening prozor uvek počinje od prvog reda')
+    parser.add_argument('--refit-every', type=positive_int, default=1, help='broj foldova koje jedan model predviđa pre ponovnog treniranja')
+    parser.add_argument('--output', help='CSV fajl za metrike po foldu')
+    args = parser.parse_args()
+
+    data = load_dataset(args.dataset, args.bucket)
+    if args.model_key:
+        model_path = '/tmp/backtest_model.joblib'
+        boto3.client('s3').download_file(args.bucket, args.model_key, model_path)
+        model = joblib.load(model_path)
+    else:
+        model = MODELS[args.model]()
+
+    folds, summary = run_backtest(
+        data, model, args.train_window, args.test_window, args.step or args.test_window,
+        args.expanding, args.refit_every
+    )
+    print(folds.to_string(index=False, max_rows=20))
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        folds.to_csv(args.output, index=False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# Summarizes the metric lines the Lambdas write to their logs (metrics.py in
+# each lambda/*/src) into per-stage percentiles, split into cold and warm
+# invocations. Input is any captured log text: CloudWatch exports, `aws logs
+# tail` output or local runs; lines without a metric record are ignored.
+#
+#   aws logs tail /aws/lambda/<function> --since 1d > prediction.log
+#   python benchmarks/aggregate_metrics.py prediction.log
+#   python benchmarks/aggregate_metrics.py --stage fetch --function data_collection_and_processing *.log
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+from common import percentile, print_table
+
+MARKER = '{"metric": '
+
+
+def read_records(lines):
+    for line in lines:
+        start = line.find(MARKER)
+        if start < 0:
+            continue
+        try:
+            yield json.loads(line[start:])
+        except json.JSONDecodeError:
+            continue
+
+
+def warmth(record):
+    if record.get('cold_start') is None:
+        return '-'
+    return 'cold' if record['cold_start'] else 'warm'
+
+
+def format_number(value, digits=1):
+    if value is None or value != value:
+        return '-'
+    return f'{value:.{digits}f}'
+
+
+def stage_rows(records):
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record.get('function'), record['stage'], warmth(record))].append(record)
+
+    rows = []
+    for (function, stage, warm), group in sorted(groups.items(), key=lambda item: tuple(map(str, item[0]))):
+        milliseconds = [record['seconds'] * 1000 for record in group]
+        sizes = [record['bytes'] for record in group if record.get('bytes') is not None]
+        rows.append({
+            'function': function,
+            'stage': stage,
+            'start': warm,
+            'count': len(group),
+            'errors': sum(1 for record in group if record.get('error')),
+            'p50_ms': format_number(percentile(milliseconds, 50)),
+            'p90_ms': format_number(percentile(milliseconds, 90)),
+            'p99_ms': format_number(percentile(milliseconds, 99)),
+            'max_ms': format_number(max(milliseconds)),
+            'total_s': format_number(sum(milliseconds) / 1000, 2),
+            'p50_mb': format_number(percentile(sizes, 50) / 2 ** 20, 2) if sizes else '-',
+            'max_rss_growth_mb': format_number(max(record.get('peak_rss_growth_mb') or 0 for record in group)),
+        })
+    return rows
+
+
+def invocation_rows(records):
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record.get('function'), warmth(record))].append(record)
+
+    rows = []
+    for (function, warm), group in sorted(groups.items(), key=lambda item: tuple(map(str, item[0]))):
+        milliseconds = [record['seconds'] * 1000 for record in group]
+        remaining = [record['remaining_ms'] for record in group if record.get('remaining_ms') is not None]
+        rows.append({
+            'function': function,
+            'start': warm,
+            'count': len(group),
+            'failed': sum(1 for record in group if (record.get('status_code') or 0) >= 400),
+            'p50_ms': format_number(percentile(milliseconds, 50)),
+            'p90_ms': format_number(percentile(milliseconds, 90)),
+            'p99_ms': format_number(percentile(milliseconds, 99)),
+            'max_ms': format_number(max(milliseconds)),
+            'max_rss_mb': format_number(max(record.get('peak_rss_mb') or 0 for record in group)),
+            'min_remaining_ms': min(remaining) if remaining else '-',
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('logs', nargs='*', help='log files; stdin when omitted')
+    parser.add_argument('--function', help='only this Lambda, e.g. data_prediction')
+    parser.add_argument('--stage', action='append', default=[], help='only these stages')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    stages, invocations = [], []
+    for path in args.logs or ['-']:
+        source = sys.stdin if path == '-' else open(path, encoding='utf-8', errors='replace')
+        try:
+            for record in read_records(source):
+                if args.function and record.get('function') != args.function:
+                    continue
+                if record['metric'] == 'stage' and (not args.stage or record['stage'] in args.stage):
+                    stages.append(record)
+                elif record['metric'] == 'invocation':
+                    invocations.append(record)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+    summary = {'invocations': invocation_rows(invocations), 'stages': stage_rows(stages)}
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    if not stages and not invocations:
+        print('No metric lines found')
+        return
+    if summary['invocations']:
+        print_table(summary['invocations'], list(summary['invocations'][0]))
+        print()
+    if summary['stages']:
+        print_table(summary['stages'], list(summary['stages'][0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+# Cold start of each Lambda: module import time and first/second invocation
+# latency, every run in a fresh interpreter, against a local S3 stand-in and a
+# stubbed Polygon/SageMaker. With --ref the same scenarios also run against the
+# Lambda sources of an older commit, e.g. to compare eager and lazy imports.
+#
+#   python benchmarks/bench_cold_start.py --repeat 5
+#   python benchmarks/bench_cold_start.py --repeat 5 --ref <commit>
+#
+# The child process must not import boto3, pandas etc. before the Lambda module
+# does, so only the standard library and the local stand-ins are imported at the
+# top here.
+import argparse
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from local_s3 import LocalS3
+from local_sagemaker import LocalSageMaker
+
+BUCKET = 'stock-data-bench'
+
+HEAVY_MODULES = ['requests', 'numpy', 'pandas', 'pyarrow', 'joblib', 'sklearn']
+
+LAMBDAS = {
+    'data_collection_and_processing': 'lambda/data_collection_and_processing/src/index.py',
+    'data_prediction': 'lambda/data_prediction/src/index.py',
+    'sagemaker_training': 'lambda/sagemaker_training/src/index.py',
+}
+
+
+class FakeResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+# Runs in the fresh interpreter: import, swap the AWS/Polygon clients for
+# local stand-ins, invoke twice, print one JSON line
+def child(spec):
+    os.environ.update(spec['env'])
+    sys.path.insert(0, os.path.dirname(spec['source']))
+
+    start = time.perf_counter()
+    module = importlib.import_module('index')
+    import_seconds = time.perf_counter() - start
+    after_import = loaded_heavy_modules()
+
+    module.s3 = LocalS3(spec['s3_root'])
+    if hasattr(module, 'http'):
+        with open(spec['polygon_body'], 'rb') as f:
+            body = f.read()
+        module.http.get = lambda url, timeout=None: FakeResponse(spec['polygon_status'], body)
+    if hasattr(module, 'sagemaker'):
+        module.sagemaker = LocalSageMaker()
+
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        response = module.handler(spec['event'], None)
+        timings.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        'import_seconds': import_seconds,
+        'first_seconds': timings[0],
+        'second_seconds': timings[1],
+        'status_code': response['statusCode'],
+        'after_import': after_import,
+        'after_invocation': loaded_heavy_modules(),
+    }))
+
+
+def run_child(spec):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', json.dumps(spec)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def prepare_s3(workdir, rows):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.linear_model import LinearRegression
+
+    import joblib
+    from common import load_source
+    from synthetic import FEATURE_COLUMNS, polygon_results, processed_frame
+
+    s3_root = os.path.join(workdir, 's3')
+    s3 = LocalS3(s3_root)
+    data = processed_frame(rows, seed=1)
+    s3.put_object(Bucket=BUCKET, Key='training/processed/bench.csv', Body=data.to_csv(index=False))
+
+    trainer = load_source('linear_regression_train', 'docker/linear_regression/src/train.py')
+    linear = LinearRegression().fit(data[FEATURE_COLUMNS], data['close'])
+    for name, model in [('linear_regression', linear), ('random_forest', RandomForestRegressor(n_estimators=20, max_depth=8, random_state=42).fit(data[FEATURE_COLUMNS], data['close']))]:
+        path = os.path.join(workdir, f'{name}.joblib')
+        joblib.dump(model, path)
+        s3.upload_file(path, BUCKET, f'training/models/{name}_model.joblib')
+    compact_path = os.path.join(workdir, 'linear_regression.compact')
+    trainer.export_compact_model(linear, compact_path)
+    s3.upload_file(compact_path, BUCKET, 'training/models/linear_regression_model.compact')
+
+    polygon_body = os.path.join(workdir, 'polygon.json')
+    with open(polygon_body, 'w') as f:
+        json.dump({'results': polygon_results(rows, seed=1, timespan='day')}, f)
+    return s3_root, polygon_body
+
+
+def prediction_event(model_key):
+    return {'body': json.dumps({'test_data_key': 'training/processed/bench.csv', 'model_key': model_key})}
+
+
+SCENARIOS = [
+    ('data_collection_and_processing', 'polygon_error', {'body': json.dumps({'stock_symbol': 'AAPL'})}, 500),
+    ('data_collection_and_processing', 'csv', {'body': json.dumps({'stock_symbol': 'AAPL'})}, 200),
+    ('data_collection_and_processing', 'parquet', {'body': json.dumps({'stock_symbol': 'AAPL', 'output_format': 'parquet'})}, 200),
+    ('data_prediction', 'invalid_input', {'body': 'not json'}, 200),
+    ('data_prediction', 'compact_linear', prediction_event('training/models/linear_regression_model.compact'), 200),
+    ('data_prediction', 'joblib_linear', prediction_event('training/models/linear_regression_model.joblib'), 200),
+    ('data_prediction', 'joblib_random_forest', prediction_event('training/models/random_forest_model.joblib'), 200),
+    ('sagemaker_training', 'five_jobs', {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': 'training/processed/bench.csv'}}}]}, 200),
+]
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--ref', help='also measure the Lambda sources at this git commit')
+    args = parser.parse_args()
+
+    if args.child:
+        child(json.loads(args.child))
+        return
+
+    from common import REPO_ROOT, print_table
+
+    workdir = tempfile.mkdtemp(prefix='bench-cold-start-')
+    trees = {'current': REPO_ROOT}
+    if args.ref:
+        ref_root = os.path.join(workdir, 'ref')
+        os.makedirs(ref_root)
+        archive = subprocess.run(['git', '-C', REPO_ROOT, 'archive', args.ref, 'lambda'], check=True, capture_output=True).stdout
+        subprocess.run(['tar', '-x', '-C', ref_root], input=archive, check=True)
+        trees = {args.ref: ref_root, **trees}
+
+    try:
+        s3_root, polygon_body = prepare_s3(workdir, args.rows)
+        rows = []
+        for function, scenario, event, polygon_status in SCENARIOS:
+            for tree, root in trees.items():
+                runs = []
+                for run in range(args.repeat):
+                    runs.append(run_child({
+                        'source': os.path.join(root, LAMBDAS[function]),
+                        's3_root': s3_root,
+                        'polygon_body': polygon_body,
+                        'polygon_status': polygon_status,
+                        'event': event,
+                        'env': {
+                            'AWS_DEFAULT_REGION': 'us-east-1',
+                            'BUCKET_NAME': BUCKET,
+                            'S3_BUCKET': BUCKET,
+                            'METRICS_ENABLED': '0',
+                            'MODEL_CACHE_DIR': os.path.join(workdir, 'models', f'{tree}-{scenario}-{run}'),
+                        },
+                    }))
+                import_ms = median([result['import_seconds'] for result in runs]) * 1000
+                first_ms = median([result['first_seconds'] for result in runs]) * 1000
+                rows.append({
+                    'lambda': function,
+                    'scenario': scenario,
+                    'tree': tree,
+                    'status': runs[0]['status_code'],
+                    'import_ms': f'{import_ms:.0f}',
+                    'first_ms': f'{first_ms:.0f}',
+                    'cold_total_ms': f'{import_ms + first_ms:.0f}',
+                    'warm_ms': f"{median([result['second_seconds'] for result in runs]) * 1000:.1f}",
+                    'loaded_at_import': ','.join(runs[0]['after_import']) or '-',
+                    'loaded_after_call': ','.join(runs[0]['after_invocation']) or '-',
+                })
+        print_table(rows, list(rows[0]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Joblib vs compact (memory-mapped NumPy) model artifacts: file size, load time,
+# batch prediction time, and the largest deviation from model.predict.
+#
+#   python benchmarks/bench_compact_models.py --rows 5000 --predict-rows 100000
+import argparse
+import os
+import shutil
+import tempfile
+
+import joblib
+import numpy as np
+
+from common import load_source, percentile, print_table, timed
+from synthetic import FEATURE_COLUMNS, processed_frame
+
+TRAINERS = {
+    'linear_regression': 'docker/linear_regression/src/train.py',
+    'decision_tree': 'docker/decision_tree_regression/src/train.py',
+    'random_forest': 'docker/random_forest_regression/src/train.py',
+}
+
+
+def build_model(name, trainer):
+    if name == 'linear_regression':
+        return trainer.LinearRegression()
+    if name == 'decision_tree':
+        return trainer.DecisionTreeRegressor(max_depth=10, random_state=42)
+    return trainer.RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42, n_jobs=-1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5000, help='training rows')
+    parser.add_argument('--predict-rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-compact-')
+    compact_model = load_source('compact_model', 'lambda/data_prediction/src/compact_model.py')
+
+    train_data = processed_frame(args.rows, seed=1)
+    test_data = processed_frame(args.predict_rows, seed=2)[FEATURE_COLUMNS]
+
+    rows = []
+    for name, path in TRAINERS.items():
+        trainer = load_source(f'{name}_train', path)
+        model = build_model(name, trainer).fit(train_data[FEATURE_COLUMNS], train_data['close'])
+        if hasattr(model, 'n_jobs'):
+            model.n_jobs = 1
+
+        joblib_path = os.path.join(workdir, f'{name}.joblib')
+        compact_path = os.path.join(workdir, f'{name}.compact')
+        joblib.dump(model, joblib_path)
+        trainer.export_compact_model(model, compact_path)
+
+        joblib_load = [timed(joblib.load, joblib_path)[0] for _ in range(args.repeat)]
+        compact_load = [timed(compact_model.load, compact_path)[0] for _ in range(args.repeat)]
+
+        loaded = compact_model.load(compact_path)
+        expected = model.predict(test_data)
+        joblib_predict = [timed(model.predict, test_data)[0] for _ in range(args.repeat)]
+        compact_predict = []
+        for _ in range(args.repeat):
+            elapsed, actual = timed(loaded.predict, test_data)
+            compact_predict.append(elapsed)
+
+        rows.append({
+            'model': name,
+            'joblib_kb': os.path.getsize(joblib_path) // 1024,
+            'compact_kb': os.path.getsize(compact_path) // 1024,
+            'joblib_load_ms': f'{percentile(joblib_load, 50) * 1000:.2f}',
+            'compact_load_ms': f'{percentile(compact_load, 50) * 1000:.2f}',
+            'joblib_predict_ms': f'{percentile(joblib_predict, 50) * 1000:.1f}',
+            'compact_predict_ms': f'{percentile(compact_predict, 50) * 1000:.1f}',
+            'max_abs_diff': f'{np.max(np.abs(actual - expected)):.2e}',
+        })
+
+    print_table(rows, list(rows[0]))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Cold vs warm latency of the prediction Lambda's model cache against a local S3
+# stand-in.
+#
+#   python benchmarks/bench_model_cache.py --rows 2000 --warm 20 --latency 0.02
+import argparse
+import os
+import shutil
+import tempfile
+
+import joblib
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+from common import api_event, load_source, percentile, print_table, timed
+from local_s3 import LocalS3
+from synthetic import FEATURE_COLUMNS, processed_frame
+
+BUCKET = 'stock-data-bench'
+
+MODELS = {
+    'linear_regression': lambda: LinearRegression(),
+    'decision_tree': lambda: DecisionTreeRegressor(max_depth=10, random_state=42),
+    'random_forest': lambda: RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42, n_jobs=-1),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--warm', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated S3 request latency (s)')
+    parser.add_argument('--bandwidth', type=float, default=50e6, help='simulated S3 bandwidth (bytes/s)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-model-cache-')
+    os.environ['BUCKET_NAME'] = BUCKET
+    os.environ['MODEL_CACHE_DIR'] = os.path.join(workdir, 'models')
+    # Per-stage metric lines from the Lambdas would drown the table
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    s3 = LocalS3(os.path.join(workdir, 's3'), latency=args.latency, bandwidth=args.bandwidth)
+
+    data = processed_frame(args.rows, seed=1)
+    s3.put_object(Bucket=BUCKET, Key='training/processed/bench.csv', Body=data.to_csv(index=False))
+
+    for name, build in MODELS.items():
+        model = build().fit(data[FEATURE_COLUMNS], data['close'])
+        path = os.path.join(workdir, f'{name}.joblib')
+        joblib.dump(model, path)
+        s3.upload_file(path, BUCKET, f'training/models/{name}_model.joblib')
+
+    prediction = load_source('prediction_index', 'lambda/data_prediction/src/index.py', s3)
+
+    rows = []
+    for name in MODELS:
+        model_key = f'training/models/{name}_model.joblib'
+        event = api_event({'test_data_key': 'training/processed/bench.csv', 'model_key': model_key})
+
+        # Cold: empty in-process cache and no file in /tmp
+        prediction.model_cache.cache.clear()
+        shutil.rmtree(os.environ['MODEL_CACHE_DIR'], ignore_errors=True)
+        cold, response = timed(prediction.handler, event, None)
+        assert response['statusCode'] == 200, response
+
+        warm = []
+        for _ in range(args.warm):
+            elapsed, response = timed(prediction.handler, event, None)
+            assert response['statusCode'] == 200, response
+            warm.append(elapsed)
+
+        rows.append({
+            'model': name,
+            'size_kb': s3.head_object(Bucket=BUCKET, Key=model_key)['ContentLength'] // 1024,
+            'cold_ms': f'{cold * 1000:.1f}',
+            'warm_p50_ms': f'{percentile(warm, 50) * 1000:.1f}',
+            'warm_p95_ms': f'{percentile(warm, 95) * 1000:.1f}',
+            'speedup': f'{cold / percentile(warm, 50):.1f}x',
+        })
+
+    print_table(rows, ['model', 'size_kb', 'cold_ms', 'warm_p50_ms', 'warm_p95_ms', 'speedup'])
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
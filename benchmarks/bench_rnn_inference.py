@@ -0,0 +1,95 @@
+# Keras vs the prediction Lambda's NumPy forward pass for the LSTM and GRU
+# models: artifact size, load time, batch prediction time and the largest
+# deviation from model.predict, for float32 and int8 compact exports.
+#
+#   python benchmarks/bench_rnn_inference.py --rows 3000 --predict-rows 50000
+import argparse
+import os
+import shutil
+import tempfile
+
+import joblib
+import numpy as np
+
+from common import load_source, percentile, print_table, timed
+from synthetic import FEATURE_COLUMNS, processed_frame
+
+TRAINERS = {
+    'lstm': 'docker/lstm/src/train.py',
+    'gru': 'docker/gru/src/train.py',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=3000, help='training rows')
+    parser.add_argument('--predict-rows', type=int, default=50000)
+    parser.add_argument('--window', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-rnn-')
+    compact_model = load_source('compact_model', 'lambda/data_prediction/src/compact_model.py')
+
+    train_data = processed_frame(args.rows, seed=1, timespan='minute')
+    test_data = processed_frame(args.predict_rows, seed=2, timespan='minute')[FEATURE_COLUMNS]
+    X = test_data.to_numpy(dtype=np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(X, args.window, axis=0)[:len(X) - args.window].transpose(0, 2, 1)
+
+    rows = []
+    try:
+        for name, path in TRAINERS.items():
+            trainer = load_source(f'{name}_train', path)
+            trainer.WINDOW_SIZE = args.window
+            model = trainer.fit_model(train_data[FEATURE_COLUMNS], train_data['close'])
+            # The network sees standardized features and predicts a standardized close
+            scaler = model.scaler
+            scaled_windows = trainer.standardize(windows, scaler['feature_mean'], scaler['feature_scale'])
+
+            joblib_path = os.path.join(workdir, f'{name}.joblib')
+            joblib.dump(model, joblib_path)
+            keras_predict = []
+            for _ in range(args.repeat):
+                elapsed, expected = timed(model.predict, scaled_windows, batch_size=4096, verbose=0)
+                keras_predict.append(elapsed)
+            expected = expected[:, 0] * scaler['target_scale'] + scaler['target_mean']
+            scale = np.abs(expected).max()
+            rows.append({
+                'model': name,
+                'artifact': 'joblib (keras)',
+                'kb': os.path.getsize(joblib_path) // 1024,
+                'load_ms': f'{percentile([timed(joblib.load, joblib_path)[0] for _ in range(args.repeat)], 50) * 1000:.1f}',
+                'predict_ms': f'{percentile(keras_predict, 50) * 1000:.1f}',
+                'windows_per_s': int(len(windows) / percentile(keras_predict, 50)),
+                'max_abs_diff': '-',
+                'max_rel_diff': '-',
+            })
+
+            for quantized in (False, True):
+                compact_path = os.path.join(workdir, f'{name}{"_int8" if quantized else ""}.compact')
+                trainer.export_compact_model(model, compact_path, quantized=quantized)
+                loaded = compact_model.load(compact_path)
+                compact_predict = []
+                for _ in range(args.repeat):
+                    elapsed, actual = timed(loaded.predict, test_data)
+                    compact_predict.append(elapsed)
+                difference = np.abs(actual[args.window:] - expected)
+                rows.append({
+                    'model': name,
+                    'artifact': 'compact int8' if quantized else 'compact float32',
+                    'kb': os.path.getsize(compact_path) // 1024,
+                    'load_ms': f'{percentile([timed(compact_model.load, compact_path)[0] for _ in range(args.repeat)], 50) * 1000:.1f}',
+                    'predict_ms': f'{percentile(compact_predict, 50) * 1000:.1f}',
+                    'windows_per_s': int(len(windows) / percentile(compact_predict, 50)),
+                    'max_abs_diff': f'{difference.max():.2e}',
+                    'max_rel_diff': f'{difference.max() / scale:.2e}',
+                })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f'{len(windows)} windows of {args.window} bars x {len(FEATURE_COLUMNS)} features')
+    print_table(rows, list(rows[0]))
+
+
+if __name__ == '__main__':
+    main()
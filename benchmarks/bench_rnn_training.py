@@ -0,0 +1,79 @@
+# LSTM/GRU training before and after input scaling: raw features for a fixed
+# number of epochs vs standardized features and target with a time-ordered
+# validation tail, early stopping and the best checkpoint restored. Reports
+# epochs run, wall time, time to the best epoch and RMSE on held-out bars that
+# neither run trained or validated on.
+#
+#   python benchmarks/bench_rnn_training.py --rows 5000 --epochs 10
+import argparse
+
+import numpy as np
+
+from common import load_source, print_table
+from synthetic import FEATURE_COLUMNS, processed_frame
+
+TRAINERS = {
+    'lstm': 'docker/lstm/src/train.py',
+    'gru': 'docker/gru/src/train.py',
+}
+
+
+def identity_scaler(X, y, feature_names, statistics):
+    return {
+        'feature_mean': [0.0] * len(feature_names),
+        'feature_scale': [1.0] * len(feature_names),
+        'target_mean': 0.0,
+        'target_scale': 1.0,
+    }
+
+
+# Holdout predictions go through the compact export, which applies the scaler
+# from its header as the prediction Lambda does
+def holdout_rmse(trainer, compact_model, model, holdout, path):
+    trainer.export_compact_model(model, path)
+    predictions = compact_model.load(path).predict(holdout[FEATURE_COLUMNS])
+    errors = predictions[trainer.WINDOW_SIZE:] - holdout['close'].to_numpy(dtype=np.float64)[trainer.WINDOW_SIZE:]
+    return float(np.sqrt(np.mean(np.square(errors))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5000, help='training rows')
+    parser.add_argument('--holdout', type=int, default=1000, help='bars after the training rows used for RMSE')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--patience', type=int, default=2)
+    parser.add_argument('--window', type=int, default=30)
+    args = parser.parse_args()
+
+    data = processed_frame(args.rows + args.holdout, seed=1, timespan='minute')
+    train_data, holdout = data.iloc[:args.rows], data.iloc[args.rows:]
+    compact_model = load_source('compact_model', 'lambda/data_prediction/src/compact_model.py')
+
+    rows = []
+    for name, path in TRAINERS.items():
+        for variant in ('raw, fixed epochs', 'standardized, early stopping'):
+            trainer = load_source(f'{name}_train', path)
+            trainer.WINDOW_SIZE = args.window
+            trainer.EPOCHS = args.epochs
+            trainer.PATIENCE = args.patience
+            if variant.startswith('raw'):
+                trainer.make_scaler = identity_scaler
+                trainer.VALIDATION_FRACTION = 0
+            model = trainer.fit_model(train_data[FEATURE_COLUMNS], train_data['close'])
+            report = model.training_report
+            rows.append({
+                'model': name,
+                'variant': variant,
+                'epochs': report['epochs'],
+                'best_epoch': report['best_epoch'],
+                'train_s': f"{report['train_seconds']:.1f}",
+                'to_best_s': f"{report['seconds_to_best']:.1f}",
+                'holdout_rmse': f'{holdout_rmse(trainer, compact_model, model, holdout, f"/tmp/bench_{name}.compact"):.4f}',
+            })
+
+    print(f'{args.rows} training rows, {args.holdout} holdout bars, windows of {args.window}, at most {args.epochs} epochs')
+    print_table(rows, list(rows[0]))
+
+
+if __name__ == '__main__':
+    main()
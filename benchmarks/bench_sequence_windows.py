@@ -0,0 +1,78 @@
+# Memory and throughput of LSTM/GRU sequence preparation: the old copied window
+# array vs strided views fed through tf.data, on synthetic minute bars.
+#
+#   python benchmarks/bench_sequence_windows.py --rows 200000 --window 60
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from common import load_source, print_table, timed
+from synthetic import FEATURE_COLUMNS, processed_frame
+
+
+def peak_memory(function, *args):
+    tracemalloc.start()
+    try:
+        elapsed, result = timed(function, *args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def copied_windows(X, y, window_size):
+    windows = np.array([X[i:i + window_size] for i in range(len(X) - window_size)])
+    return windows, y[window_size:]
+
+
+def drain(batches):
+    windows = 0
+    for batch, _ in batches:
+        windows += len(batch)
+    return windows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--window', type=int, default=60)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--skip-copy', action='store_true', help='skip the copied baseline (for very large --rows)')
+    args = parser.parse_args()
+
+    trainer = load_source('gru_train', 'docker/gru/src/train.py')
+    data = processed_frame(args.rows, seed=3, timespan='minute')
+    X = data[FEATURE_COLUMNS].to_numpy(dtype=np.float32)
+    y = data['close'].to_numpy(dtype=np.float32)
+    window_count = len(X) - args.window
+
+    rows = []
+    if not args.skip_copy:
+        elapsed, peak, (windows, targets) = peak_memory(copied_windows, X, y, args.window)
+        rows.append({'pipeline': 'copied windows', 'peak_mb': f'{peak / 1e6:.1f}', 'seconds': f'{elapsed:.2f}',
+                     'windows_per_s': f'{window_count / elapsed:,.0f}'})
+
+        # Same windows and targets in the same order as the copied array
+        first = next(trainer.window_batches(X, y, args.window, 4096, shuffle=False)())
+        assert np.array_equal(first[0], windows[:4096]) and np.array_equal(first[1], targets[:4096])
+        del windows, targets
+
+    batches = trainer.window_batches(X, y, args.window, args.batch_size)
+    elapsed, peak, drained = peak_memory(drain, batches())
+    assert drained == window_count
+    rows.append({'pipeline': 'strided batches', 'peak_mb': f'{peak / 1e6:.1f}', 'seconds': f'{elapsed:.2f}',
+                 'windows_per_s': f'{window_count / elapsed:,.0f}'})
+
+    dataset = trainer.make_dataset(X, y, args.window, args.batch_size)
+    elapsed, drained = timed(drain, dataset.as_numpy_iterator())
+    assert drained == window_count
+    rows.append({'pipeline': 'tf.data (prefetch)', 'peak_mb': '-', 'seconds': f'{elapsed:.2f}',
+                 'windows_per_s': f'{window_count / elapsed:,.0f}'})
+
+    print(f'feature matrix: {X.nbytes / 1e6:.1f} MB, {window_count:,} windows of {args.window}')
+    print_table(rows, ['pipeline', 'peak_mb', 'seconds', 'windows_per_s'])
+
+
+if __name__ == '__main__':
+    main()
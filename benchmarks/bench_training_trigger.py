@@ -0,0 +1,110 @@
+# Training jobs and wall time of the sagemaker_training Lambda for a burst of
+# processed uploads, against local S3 and SageMaker stand-ins with simulated API
+# latency: every upload as its own event, the burst as one SQS batch (coalesced
+# into a combined manifest), and the same burst re-ingested under new keys.
+#
+#   python benchmarks/bench_training_trigger.py --uploads 8 --latency 0.05
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+from common import load_source, print_table, timed
+from local_s3 import LocalS3
+from local_sagemaker import LocalSageMaker
+from synthetic import processed_frame
+
+BUCKET = 'stock-data-bench'
+
+
+def s3_record(key):
+    return {'eventSource': 'aws:s3', 's3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}}
+
+
+def utc_date(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).date().isoformat()
+
+
+# S3 notifications delivered through SQS, as the CDK stack wires them
+def sqs_event(keys):
+    return {'Records': [{'eventSource': 'aws:sqs', 'body': json.dumps({'Records': [s3_record(key)]})} for key in keys]}
+
+
+# Uploads of one dataset (symbol, timespan), each with the statistics JSON the
+# collection Lambda writes next to a processed file, so a batch of them is
+# coalesced into one run
+def upload_burst(s3, uploads, rows, tag):
+    keys = []
+    for index in range(uploads):
+        file_name = f'stock_data_BENCH_{tag}_{index}.csv'
+        data = processed_frame(rows, seed=index)
+        s3.put_object(Bucket=BUCKET, Key=f'training/processed/{file_name}', Body=data.to_csv(index=False))
+        s3.put_object(Bucket=BUCKET, Key=f'training/statistics/{file_name}.json', Body=json.dumps({
+            'processed_file': f'training/processed/{file_name}',
+            'stock_symbol': 'BENCH', 'multiplier': 1, 'timespan': 'day', 'time_column': 't', 'rows': len(data),
+            'min_date': utc_date(data['t'].iloc[0]), 'max_date': utc_date(data['t'].iloc[-1]),
+            'min_t': int(data['t'].iloc[0]), 'max_t': int(data['t'].iloc[-1]), 'stats': {},
+        }))
+        keys.append(f'training/processed/{file_name}')
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uploads', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated S3/SageMaker request latency (s)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-training-trigger-')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    # Per-stage metric lines from the Lambdas would drown the table
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    for model_name in ('LINEAR_REGRESSION', 'DECISION_TREE_REGRESSION', 'RANDOM_FOREST_REGRESSION', 'LSTM', 'GRU'):
+        os.environ.setdefault(f'{model_name}_SAGEMAKER_IMAGE_URI', f'local/{model_name.lower()}')
+    training = load_source('training_index', 'lambda/sagemaker_training/src/index.py', LocalS3(workdir))
+
+    def run(s3, sagemaker, events):
+        training.s3 = s3
+        training.sagemaker = sagemaker
+        responses = [training.handler(event, None) for event in events]
+        assert all(response['statusCode'] == 200 for response in responses), responses
+        return responses
+
+    rows = []
+    try:
+        for scenario in ['per_upload', 'sqs_batch', 'sqs_batch_reingest']:
+            s3 = LocalS3(os.path.join(workdir, scenario), latency=args.latency)
+            sagemaker = LocalSageMaker(latency=args.latency)
+            keys = upload_burst(s3, args.uploads, args.rows, 'first')
+
+            if scenario == 'per_upload':
+                events = [{'Records': [s3_record(key)]} for key in keys]
+            else:
+                events = [sqs_event(keys)]
+            if scenario == 'sqs_batch_reingest':
+                run(s3, sagemaker, events)
+                sagemaker.set_status('Completed')
+                events = [sqs_event(upload_burst(s3, args.uploads, args.rows, 'again'))]
+
+            jobs_before = len(sagemaker.jobs)
+            elapsed, responses = timed(run, s3, sagemaker, events)
+            runs = [run_result for response in responses for run_result in json.loads(response['body'])['runs']]
+            rows.append({
+                'scenario': scenario,
+                'uploads': len(keys),
+                'invocations': len(events),
+                'jobs_created': len(sagemaker.jobs) - jobs_before,
+                'jobs_skipped': sum(len(run_result['skipped']) for run_result in runs),
+                'wall_ms': f'{elapsed * 1000:.0f}',
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(rows, list(rows[0]))
+
+
+if __name__ == '__main__':
+    main()
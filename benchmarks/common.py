@@ -0,0 +1,65 @@
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+import time
+
+import boto3
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Every Lambda and trainer is a module named index/train inside its own image, so
+# they are loaded under distinct names here with their src directory on sys.path.
+# Any boto3.client(...) made at import time gets the given stand-in client.
+def load_source(name, relative_path, s3_client=None):
+    path = os.path.join(REPO_ROOT, relative_path)
+    src_dir = os.path.dirname(path)
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+
+    with patched_boto3(s3_client):
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+# Trainers create their S3 client inside each call, so calls into them run
+# with boto3.client patched as well.
+@contextlib.contextmanager
+def patched_boto3(s3_client=None):
+    original_client = boto3.client
+    if s3_client is not None:
+        boto3.client = lambda *args, **kwargs: s3_client
+    try:
+        yield
+    finally:
+        boto3.client = original_client
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return float('nan')
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def print_table(rows, columns):
+    widths = [max(len(column), *(len(f'{row[column]}') for row in rows)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(f'{row[column]}'.ljust(width) for column, width in zip(columns, widths)))
+
+
+def api_event(body):
+    return {'body': json.dumps(body)}
@@ -0,0 +1,133 @@
+import json
+import re
+import threading
+import zlib
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from synthetic import STEP_MS, ohlcv_arrays
+
+AGGREGATES_PATH = re.compile(r'^/v2/aggs/ticker/([^/]+)/range/(\d+)/([a-z]+)/([^/]+)/([^/]+)$')
+MAX_LIMIT = 50000
+
+
+def epoch_ms(value):
+    if value.isdigit():
+        return int(value)
+    return int(datetime.combine(date.fromisoformat(value), datetime.min.time(), timezone.utc).timestamp() * 1000)
+
+
+# Bars are generated in blocks of this many steps, aligned to the epoch
+BLOCK_STEPS = 10000
+
+
+# One block of a symbol's series; the seed comes from the symbol and the block
+@lru_cache(maxsize=256)
+def block(symbol, step, index):
+    bars = ohlcv_arrays(BLOCK_STEPS, seed=[zlib.crc32(symbol.encode()), index])
+    bars['t'] = (index * BLOCK_STEPS + np.arange(BLOCK_STEPS, dtype=np.int64)) * step
+    return bars
+
+
+# Every bar of [from, to] (whole UTC days, around the clock) for one symbol. A
+# bar depends only on the symbol and its time, so every request sees the same
+# series, whatever range it asks for
+@lru_cache(maxsize=64)
+def series(symbol, multiplier, timespan, from_ms, to_ms):
+    step = STEP_MS[timespan] * multiplier
+    first = -(-from_ms // step)
+    count = max(0, (to_ms + STEP_MS['day'] - 1) // step - first + 1)
+    indexes = range(first // BLOCK_STEPS, (first + max(count, 1) - 1) // BLOCK_STEPS + 1)
+    blocks = [block(symbol, step, index) for index in indexes]
+    offset = first - indexes[0] * BLOCK_STEPS
+    return {name: np.concatenate([bars[name] for bars in blocks])[offset:offset + count] for name in blocks[0]}
+
+
+def page(bars, cursor, limit):
+    end = min(cursor + limit, len(bars['t']))
+    return [
+        {'o': o, 'h': h, 'l': l, 'c': c, 'v': v, 't': t}
+        for o, h, l, c, v, t in zip(
+            bars['open'][cursor:end].tolist(), bars['high'][cursor:end].tolist(), bars['low'][cursor:end].tolist(),
+            bars['close'][cursor:end].tolist(), bars['volume'][cursor:end].tolist(), bars['t'][cursor:end].tolist()
+        )
+    ], end
+
+
+# Local HTTP stand-in for Polygon's aggregates endpoint, serving synthetic
+# minute/hour/day bars with next_url pagination (cursor = row offset). Point the
+# collection Lambda at it with POLYGON_API_URL=server.url.
+class FakePolygon:
+    def __init__(self, host='127.0.0.1', port=0):
+        self.requests = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def respond(self, path, query):
+        match = AGGREGATES_PATH.match(path)
+        if not match:
+            return 404, {'status': 'NOT_FOUND', 'error': f'Unknown path {path}'}
+        symbol, multiplier, timespan, from_value, to_value = match.groups()
+        if timespan not in STEP_MS:
+            return 400, {'status': 'ERROR', 'error': f'Unsupported timespan {timespan}'}
+
+        bars = series(symbol, int(multiplier), timespan, epoch_ms(from_value), epoch_ms(to_value))
+        limit = min(int(query.get('limit', [5000])[0]), MAX_LIMIT)
+        cursor = int(query.get('cursor', [0])[0])
+        results, end = page(bars, cursor, limit)
+        body = {'ticker': symbol, 'status': 'OK', 'resultsCount': len(results), 'results': results}
+        if end < len(bars['t']):
+            body['next_url'] = f'{self.url}{path}?cursor={end}&limit={limit}'
+        return 200, body
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the pooled session of the collection Lambda expects
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, body = fake.respond(url.path, parse_qs(url.query))
+                content = json.dumps(body).encode()
+                with fake.lock:
+                    fake.requests += 1
+                    fake.bytes += len(content)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
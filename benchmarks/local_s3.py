@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+# Filesystem-backed stand-in for the subset of the boto3 S3 client the pipeline
+# uses. Objects live under root/<bucket>/<key>. latency (seconds per request) and
+# bandwidth (bytes per second) simulate the network for benchmarks.
+class LocalS3:
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self, root, latency=0.0, bandwidth=None):
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.uploads = {}
+        self.requests = 0
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, key)
+
+    def _network(self, size=0):
+        self.requests += 1
+        delay = self.latency
+        if self.bandwidth:
+            delay += size / self.bandwidth
+        if delay:
+            time.sleep(delay)
+
+    def _etag(self, path):
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return f'"{digest.hexdigest()}"'
+
+    def _existing(self, bucket, key):
+        path = self._path(bucket, key)
+        if not os.path.isfile(path):
+            raise NoSuchKey(f'{bucket}/{key}')
+        return path
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(Body)
+        self._network(len(Body))
+        return {'ETag': self._etag(path)}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self._existing(Bucket, Key)
+        with open(path, 'rb') as f:
+            body = f.read()
+        self._network(len(body))
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body), 'ETag': self._etag(path)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = self._existing(Bucket, Key)
+        self._network()
+        return {
+            'ContentLength': os.path.getsize(path),
+            'ETag': self._etag(path),
+            'LastModified': datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc),
+        }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if os.path.isfile(path):
+            os.remove(path)
+        self._network()
+        return {}
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        path = self._existing(Bucket, Key)
+        self._network(os.path.getsize(path))
+        shutil.copyfile(path, Filename)
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f.read())
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read())
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        bucket_root = os.path.join(self.root, Bucket)
+        contents = []
+        for directory, _, files in os.walk(bucket_root):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                key = os.path.relpath(path, bucket_root).replace(os.sep, '/')
+                if key.startswith(Prefix) and '.multipart' not in key:
+                    contents.append({
+                        'Key': key,
+                        'Size': os.path.getsize(path),
+                        'ETag': self._etag(path),
+                        'LastModified': datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc),
+                    })
+        self._network()
+        contents.sort(key=lambda item: item['Key'])
+        return {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': False}
+
+    def get_paginator(self, operation_name):
+        client = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                yield getattr(client, operation_name)(**kwargs)
+
+        return Paginator()
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        self._network()
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        self._network(len(Body))
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        parts = self.uploads.pop(UploadId)
+        body = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+        return self.put_object(Bucket=Bucket, Key=Key, Body=body)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self.uploads.pop(UploadId, None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600, **kwargs):
+        return 'file://' + self._path(Params['Bucket'], Params['Key'])
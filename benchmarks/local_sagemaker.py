@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+class ValidationException(Exception):
+    pass
+
+
+# In-memory stand-in for the SageMaker client calls the training Lambda makes.
+# Created jobs start in `status` (InProgress by default); set_status moves them
+# on. latency (seconds per request) simulates the API round trip.
+class LocalSageMaker:
+    class exceptions:
+        ValidationException = ValidationException
+
+    def __init__(self, latency=0.0, status='InProgress'):
+        self.latency = latency
+        self.status = status
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def _network(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create_training_job(self, TrainingJobName, **kwargs):
+        self._network()
+        with self.lock:
+            if TrainingJobName in self.jobs:
+                raise ValidationException(f'Training job {TrainingJobName} already exists')
+            self.jobs[TrainingJobName] = {'TrainingJobName': TrainingJobName, 'TrainingJobStatus': self.status, **kwargs}
+        return {'TrainingJobArn': f'arn:aws:sagemaker:local:000000000000:training-job/{TrainingJobName}'}
+
+    def describe_training_job(self, TrainingJobName):
+        self._network()
+        with self.lock:
+            if TrainingJobName not in self.jobs:
+                raise ValidationException(f'Requested resource not found: {TrainingJobName}')
+            return dict(self.jobs[TrainingJobName])
+
+    def set_status(self, status, TrainingJobName=None):
+        with self.lock:
+            for name, job in self.jobs.items():
+                if TrainingJobName in (None, name):
+                    job['TrainingJobStatus'] = status
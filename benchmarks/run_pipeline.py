@@ -0,0 +1,251 @@
+# The whole pipeline on one machine: the collection Lambda fetches synthetic bars
+# from a fake Polygon server (benchmarks/fake_polygon.py) into a filesystem S3
+# stand-in, the training Lambda turns the processed uploads into training jobs
+# (SageMaker stand-in), every job runs its trainer against the same S3, and the
+# prediction Lambda scores the collected datasets with the trained models.
+# Reports end-to-end latency and per-stage throughput.
+#
+#   python benchmarks/run_pipeline.py --symbols 8 --bars 50k --timespan minute
+#   python benchmarks/run_pipeline.py --symbols 4 --layout partitioned --multi-model
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import REPO_ROOT, load_source, patched_boto3, print_table, timed
+from fake_polygon import FakePolygon
+from local_s3 import LocalS3
+from local_sagemaker import LocalSageMaker
+from synthetic import STEP_MS
+
+BUCKET = 'stock-data-bench'
+
+TRAINERS = {
+    'linear_regression': 'docker/linear_regression/src/train.py',
+    'decision_tree': 'docker/decision_tree_regression/src/train.py',
+    'random_forest': 'docker/random_forest_regression/src/train.py',
+    'lstm': 'docker/lstm/src/train.py',
+    'gru': 'docker/gru/src/train.py',
+}
+MULTI_MODEL_TRAINER = 'docker/multi_model/src/train.py'
+
+# Image URI env var the training Lambda reads for each model
+IMAGE_VARIABLES = {
+    'linear_regression': 'LINEAR_REGRESSION_SAGEMAKER_IMAGE_URI',
+    'decision_tree': 'DECISION_TREE_REGRESSION_SAGEMAKER_IMAGE_URI',
+    'random_forest': 'RANDOM_FOREST_REGRESSION_SAGEMAKER_IMAGE_URI',
+    'lstm': 'LSTM_SAGEMAKER_IMAGE_URI',
+    'gru': 'GRU_SAGEMAKER_IMAGE_URI',
+}
+
+# Artifacts the prediction Lambda loads for each model
+PREDICTION_MODEL_KEYS = {
+    'linear_regression': 'training/models/linear_regression_model.compact',
+    'decision_tree': 'training/models/decision_tree_model.compact',
+    'random_forest': 'training/models/random_forest_model.compact',
+    'lstm': 'training/models/lstm_model.compact',
+    'gru': 'training/models/gru_model.compact',
+}
+
+
+def parse_size(value):
+    multipliers = {'k': 1000, 'm': 1000000}
+    suffix = value[-1].lower()
+    return int(float(value[:-1]) * multipliers[suffix]) if suffix in multipliers else int(value)
+
+
+# Whole UTC days covering at least `bars` bars; the fake server fills every
+# bar of every day, so the count is rounded up to a whole day
+def date_range(start, bars, timespan):
+    per_day = max(1, STEP_MS['day'] // STEP_MS[timespan])
+    days = max(1, -(-bars // per_day))
+    first = date.fromisoformat(start)
+    return first.isoformat(), (first + timedelta(days=days - 1)).isoformat()
+
+
+def body_of(response, stage):
+    body = json.loads(response['body'])
+    if response['statusCode'] != 200:
+        raise RuntimeError(f'{stage} failed with {response["statusCode"]}: {body}')
+    return body
+
+
+def stage_row(stage, seconds, items, rows, size):
+    return {
+        'stage': stage,
+        'seconds': round(seconds, 3),
+        'items': items,
+        'rows': rows,
+        'rows_per_s': int(rows / seconds) if seconds else 0,
+        'mb': round(size / 1e6, 2),
+        'mb_per_s': round(size / 1e6 / seconds, 2) if seconds else 0,
+    }
+
+
+def collect(collection, args, from_date, to_date):
+    request = {
+        'stock_symbols': [f'SYM{index}' for index in range(args.symbols)],
+        'timespan': args.timespan,
+        'from': from_date,
+        'to': to_date,
+        'output_format': args.output_format,
+        'layout': args.layout,
+        'stream': args.stream,
+        'max_concurrency': args.concurrency,
+    }
+    body = body_of(collection.handler({'body': json.dumps(request)}, None), 'collect')
+    failed = [item for item in body['results'] if item['statusCode'] != 200]
+    if failed:
+        raise RuntimeError(f'collect failed for {len(failed)} symbols: {failed[0]}')
+    return body['results']
+
+
+# Processed uploads as S3 notifications, delivered through SQS in one batch as
+# the CDK stack wires them
+def upload_event(keys):
+    records = [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}} for key in keys]
+    return {'Records': [{'eventSource': 'aws:sqs', 'body': json.dumps({'Records': records})}]}
+
+
+# Runs one SageMaker job the way its container would: its environment set, the
+# trainer imported fresh and its entry point called against the local S3
+def run_job(job, s3, index):
+    environment = job['Environment']
+    model = job['AlgorithmSpecification']['TrainingImage'].split('/', 1)[1]
+    previous = {name: os.environ.get(name) for name in environment}
+    os.environ.update(environment)
+    try:
+        # Its spawned workers import the trainer by module name, so the multi
+        # model trainer runs as its own process, on the same local S3 directory
+        if model == 'multi_model':
+            subprocess.run(
+                [sys.executable, os.path.join(REPO_ROOT, MULTI_MODEL_TRAINER), '--local-s3', s3.root, 'train'], check=True
+            )
+            return environment['MODELS'].split(',')
+        with patched_boto3(s3):
+            trainer = load_source(f'{model}_job_{index}', TRAINERS[model], s3)
+            trainer.train()
+            return [model]
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=4)
+    parser.add_argument('--bars', default='20k', help='bars per symbol, rounded up to whole days')
+    parser.add_argument('--timespan', default='minute', choices=sorted(STEP_MS))
+    parser.add_argument('--start', default='2024-01-02', help='first date of the collected range')
+    parser.add_argument('--models', default='linear_regression,decision_tree', help=f'any of {",".join(TRAINERS)}')
+    parser.add_argument('--multi-model', action='store_true', help='one multi_model job instead of one job per model')
+    parser.add_argument('--output-format', default='csv', choices=['csv', 'parquet'])
+    parser.add_argument('--layout', default='file', choices=['file', 'partitioned'])
+    parser.add_argument('--stream', action='store_true', help='collect page by page (stream mode)')
+    parser.add_argument('--concurrency', type=int, default=8, help='symbols collected at once')
+    parser.add_argument('--output', help='also write the results as JSON to this path')
+    args = parser.parse_args()
+
+    models = args.models.split(',')
+    unknown = [model for model in models if model not in TRAINERS]
+    if unknown:
+        parser.error(f'unknown models: {unknown}')
+    bars = parse_size(args.bars)
+    from_date, to_date = date_range(args.start, bars, args.timespan)
+
+    workdir = tempfile.mkdtemp(prefix='run-pipeline-')
+    s3 = LocalS3(os.path.join(workdir, 's3'))
+    sagemaker = LocalSageMaker(status='InProgress')
+    polygon = FakePolygon().start()
+
+    # The Lambdas read their configuration at import time
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    # Per-stage metric lines from the Lambdas would drown the table
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    os.environ.update({
+        'POLYGON_API_URL': polygon.url,
+        'POLYGON_API_KEY': 'local',
+        'POLYGON_MAX_CONCURRENCY': str(args.concurrency),
+        'S3_BUCKET': BUCKET,
+        'BUCKET_NAME': BUCKET,
+        'MODEL_CACHE_DIR': os.path.join(workdir, 'model-cache'),
+    })
+    for model, variable in IMAGE_VARIABLES.items():
+        os.environ.pop(variable, None)
+        if model in models:
+            os.environ[variable] = f'local/{model}'
+    if args.multi_model:
+        os.environ['MULTI_MODEL_SAGEMAKER_IMAGE_URI'] = 'local/multi_model'
+    else:
+        os.environ.pop('MULTI_MODEL_SAGEMAKER_IMAGE_URI', None)
+
+    rows = []
+    try:
+        collection = load_source('collection_index', 'lambda/data_collection_and_processing/src/index.py', s3)
+        training = load_source('training_index', 'lambda/sagemaker_training/src/index.py', s3)
+        training.sagemaker = sagemaker
+        prediction = load_source('prediction_index', 'lambda/data_prediction/src/index.py', s3)
+
+        pipeline_start = time.perf_counter()
+
+        seconds, results = timed(collect, collection, args, from_date, to_date)
+        collected_rows = sum(item['rows'] for item in results)
+        # Training and prediction read a partitioned dataset through its manifest
+        dataset_keys = [item['manifest_key'] if args.layout == 'partitioned' else item['processed_file_key'] for item in results]
+        rows.append(stage_row('collect', seconds, len(results), collected_rows, polygon.bytes))
+        rows[-1]['polygon_requests'] = polygon.requests
+        processed_bytes = sum(item['processed_file_compressed_size'] for item in results)
+
+        seconds, response = timed(training.handler, upload_event(dataset_keys), None)
+        runs = body_of(response, 'trigger')['runs']
+        jobs = [sagemaker.jobs[name] for run in runs for name in run['submitted']]
+        rows.append(stage_row('trigger', seconds, len(jobs), collected_rows, processed_bytes))
+
+        start = time.perf_counter()
+        trained = []
+        for index, job in enumerate(jobs):
+            trained.extend(run_job(job, s3, index))
+            sagemaker.set_status('Completed', job['TrainingJobName'])
+        seconds = time.perf_counter() - start
+        rows.append(stage_row('train', seconds, len(trained), collected_rows * len(trained), processed_bytes * len(jobs)))
+
+        model_keys = {model: PREDICTION_MODEL_KEYS[model] for model in trained if model in PREDICTION_MODEL_KEYS}
+        skipped = [model for model in trained if model not in model_keys]
+        if skipped:
+            print(f'Not predicted (no artifact the prediction Lambda loads): {", ".join(skipped)}')
+        predicted_rows = 0
+        if model_keys:
+            request = {'test_data_keys': dataset_keys, 'model_keys': model_keys}
+            seconds, response = timed(prediction.handler, {'body': json.dumps(request)}, None)
+            body = body_of(response, 'predict')
+            if body['errors']:
+                raise RuntimeError(f'predict failed: {body["errors"][0]}')
+            predicted_rows = body['rows']
+            rows.append(stage_row('predict', seconds, len(model_keys), predicted_rows * len(model_keys), processed_bytes))
+
+        seconds = time.perf_counter() - pipeline_start
+        rows.append(stage_row('end_to_end', seconds, args.symbols, collected_rows, polygon.bytes))
+    finally:
+        polygon.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f'{args.symbols} symbols x {bars} {args.timespan} bars ({from_date} - {to_date}), '
+          f'{args.output_format}/{args.layout}, models: {",".join(models)}{" (multi_model)" if args.multi_model else ""}')
+    print_table(rows, ['stage', 'seconds', 'items', 'rows', 'rows_per_s', 'mb', 'mb_per_s'])
+    print(f'Polygon: {polygon.requests} requests, {polygon.bytes / 1e6:.1f} MB served; {predicted_rows} predicted rows')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'arguments': vars(args), 'stages': rows}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+# Stage-by-stage benchmark of the whole pipeline on deterministic synthetic
+# OHLCV data, against a local S3 stand-in. Results are written as JSON and can
+# be compared with a saved baseline; a slowdown beyond --threshold on any stage
+# makes the run exit non-zero.
+#
+#   python benchmarks/run_suite.py --sizes 1k,100k --save-baseline benchmarks/baseline.json
+#   python benchmarks/run_suite.py --sizes 1k,100k --baseline benchmarks/baseline.json
+#
+# Stages whose cost grows faster than the data (tree fits, sequence model fits)
+# or that need the whole Polygon payload in memory (decode, parse) are capped by
+# STAGE_LIMITS; raise a cap with
+# --limit stage=rows, e.g. --limit fit.random_forest=10m.
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from common import load_source, patched_boto3, percentile, print_table, timed
+from local_s3 import LocalS3
+from synthetic import FEATURE_COLUMNS, ohlcv_arrays, polygon_results, processed_frame
+
+BUCKET = 'stock-data-bench'
+
+TRAINERS = {
+    'linear_regression': 'docker/linear_regression/src/train.py',
+    'decision_tree': 'docker/decision_tree_regression/src/train.py',
+    'random_forest': 'docker/random_forest_regression/src/train.py',
+    'lstm': 'docker/lstm/src/train.py',
+    'gru': 'docker/gru/src/train.py',
+}
+SEQUENCE_MODELS = ['lstm', 'gru']
+
+STAGE_LIMITS = {
+    'decode': 1_000_000,
+    'parse': 1_000_000,
+    'fit.linear_regression': 10_000_000,
+    'fit.decision_tree': 1_000_000,
+    'fit.random_forest': 10_000,
+    'fit.lstm': 1_000,
+    'fit.gru': 1_000,
+}
+
+SLOW_STAGE_SECONDS = 10
+
+# Many windows per indicator plus every extra indicator, for indicators.wide
+WIDE_FEATURES = {
+    'sma': [5, 10, 20, 50, 100, 200], 'ema': [5, 12, 26, 50], 'rsi': [7, 14, 21], 'volatility': [10, 20, 50],
+    'macd': [[12, 26, 9]], 'bollinger': [[20, 2]], 'atr': [14], 'obv': True, 'vwap': [20], 'stochastic': [[14, 3]],
+}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def size_label(rows):
+    if rows >= 1_000_000 and rows % 1_000_000 == 0:
+        return f'{rows // 1_000_000}m'
+    if rows >= 1_000 and rows % 1_000 == 0:
+        return f'{rows // 1_000}k'
+    return str(rows)
+
+
+class Suite:
+    def __init__(self, repeat, limits):
+        self.repeat = repeat
+        self.limits = limits
+        self.results = {}
+
+    def allowed(self, stage, rows):
+        return rows <= self.limits.get(stage, float('inf'))
+
+    # Median of up to `repeat` runs; big inputs and slow stages run once
+    def run(self, stage, rows, function, *args):
+        if not self.allowed(stage, rows):
+            return None
+        repeat = self.repeat if rows < 1_000_000 else 1
+        times = []
+        result = None
+        while len(times) < repeat:
+            elapsed, result = timed(function, *args)
+            times.append(elapsed)
+            if elapsed > SLOW_STAGE_SECONDS:
+                break
+        seconds = percentile(times, 50)
+        self.results[f'{stage}@{size_label(rows)}'] = {
+            'stage': stage,
+            'rows': rows,
+            'seconds': seconds,
+            'rows_per_second': rows / seconds if seconds > 0 else None,
+            'repeat': len(times),
+        }
+        print(f'{stage:<36} {size_label(rows):>6} {seconds * 1000:>12.2f} ms')
+        return result
+
+
+def serialize_csv(collection, processed):
+    buffer = io.BytesIO()
+    collection.write_processed_chunk(buffer, processed, 'csv', None, None, None)
+    return buffer.getvalue()
+
+
+def serialize_parquet(collection, processed):
+    buffer = io.BytesIO()
+    parquet_writer, _ = collection.write_processed_chunk(buffer, processed, 'parquet', 'zstd', None, None)
+    parquet_writer.close()
+    return buffer.getvalue()
+
+
+def drain(batches):
+    return sum(len(batch) for batch, _ in batches)
+
+
+def run_size(suite, rows, s3, collection, indicators, prediction, compact_model, trainers, workdir):
+    # Collection Lambda: JSON decoding and validation, indicators, serialization
+    if suite.allowed('parse', rows):
+        content = json.dumps({'results': polygon_results(rows, seed=rows % 997, timespan='minute')}).encode()
+        response = SimpleNamespace(content=content, json=lambda: json.loads(content))
+        data = suite.run('decode', rows, collection.decode_json, response) if suite.allowed('decode', rows) else json.loads(content)
+        suite.run('parse', rows, collection.parse_results, data, 'minute')
+        del content, response, data
+
+    bars = ohlcv_arrays(rows, seed=rows % 997, timespan='minute')
+    close = bars['close']
+    suite.run('indicators.sma', rows, lambda: indicators.window_sums(close, 14) / 14)
+    suite.run('indicators.ema', rows, indicators.ema, close, 14)
+    suite.run('indicators.all', rows, indicators.compute_features, bars)
+    suite.run('indicators.wide', rows, indicators.compute_features, bars, WIDE_FEATURES)
+
+    processed = processed_frame(rows, seed=rows % 997, timespan='minute')
+    csv_body = suite.run('serialize.csv', rows, serialize_csv, collection, processed)
+    parquet_body = suite.run('serialize.parquet', rows, serialize_parquet, collection, processed)
+
+    # Trainers: dataset parsing from (local) S3
+    s3.put_object(Bucket=BUCKET, Key=f'bench/{rows}.csv', Body=csv_body)
+    s3.put_object(Bucket=BUCKET, Key=f'bench/{rows}.parquet', Body=parquet_body)
+    del csv_body, parquet_body
+    loader = next(iter(trainers.values()), None)
+    columns = FEATURE_COLUMNS + ['close']
+    if loader is not None:
+        with patched_boto3(s3):
+            suite.run('load_csv_from_s3', rows, loader.load_dataset_from_s3, BUCKET, f'bench/{rows}.csv', columns)
+            suite.run('load_parquet_from_s3', rows, loader.load_dataset_from_s3, BUCKET, f'bench/{rows}.parquet', columns)
+
+    X = processed[FEATURE_COLUMNS]
+    y = processed['close']
+
+    # LSTM/GRU windowing: one epoch of batches from the strided view
+    for name in SEQUENCE_MODELS:
+        if name in trainers:
+            trainer = trainers[name]
+            features = X.to_numpy(dtype=np.float32)
+            target = y.to_numpy(dtype=np.float32)
+            suite.run(f'windows.{name}', rows, lambda: drain(trainer.window_batches(features, target, trainer.WINDOW_SIZE, trainer.BATCH_SIZE)()))
+
+    # Model fits, then predict in the prediction Lambda
+    for name, trainer in trainers.items():
+        model = suite.run(f'fit.{name}', rows, trainer.fit_model, X, y)
+        if model is None or name in SEQUENCE_MODELS:
+            continue
+        suite.run(f'predict.{name}', rows, prediction.predict, model, X)
+
+        if hasattr(trainer, 'export_compact_model'):
+            path = os.path.join(workdir, f'{name}.compact')
+            trainer.export_compact_model(model, path)
+            suite.run(f'predict_compact.{name}', rows, prediction.predict, compact_model.load(path), X)
+
+
+def compare(results, baseline, threshold):
+    rows = []
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get('results', {}).get(key)
+        if base is None:
+            continue
+        ratio = result['seconds'] / base['seconds'] if base['seconds'] > 0 else float('inf')
+        status = 'regression' if ratio > threshold else ('faster' if ratio < 1 / threshold else 'ok')
+        if status == 'regression':
+            regressions.append(key)
+        rows.append({
+            'stage': key,
+            'baseline_ms': f"{base['seconds'] * 1000:.2f}",
+            'current_ms': f"{result['seconds'] * 1000:.2f}",
+            'ratio': f'{ratio:.2f}',
+            'status': status,
+        })
+    if rows:
+        print_table(rows, ['stage', 'baseline_ms', 'current_ms', 'ratio', 'status'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1k,100k,10m', help='comma separated bar counts, e.g. 1k,100k,10m')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--models', default=','.join(TRAINERS), help='trainers to fit and predict with')
+    parser.add_argument('--limit', action='append', default=[], help='stage=rows cap override, e.g. fit.random_forest=1m')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'latest.json'))
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--save-baseline', help='also write the results to this path')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+
+    limits = dict(STAGE_LIMITS)
+    for item in args.limit:
+        stage, rows = item.split('=')
+        limits[stage] = parse_size(rows)
+
+    workdir = tempfile.mkdtemp(prefix='bench-suite-')
+    os.environ['BUCKET_NAME'] = BUCKET
+    os.environ['MODEL_CACHE_DIR'] = os.path.join(workdir, 'models')
+    # Per-stage metric lines from the Lambdas would drown the table
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    s3 = LocalS3(os.path.join(workdir, 's3'))
+
+    collection = load_source('collection_index', 'lambda/data_collection_and_processing/src/index.py', s3)
+    indicators = load_source('indicators', 'lambda/data_collection_and_processing/src/indicators.py')
+    prediction = load_source('prediction_index', 'lambda/data_prediction/src/index.py', s3)
+    compact_model = load_source('compact_model', 'lambda/data_prediction/src/compact_model.py')
+
+    trainers = {}
+    for name in args.models.split(','):
+        try:
+            trainers[name] = load_source(f'{name}_train', TRAINERS[name])
+        except ImportError as e:
+            # TensorFlow is only needed for the sequence models
+            print(f'Skipping {name}: {e}')
+
+    suite = Suite(args.repeat, limits)
+    try:
+        for rows in [parse_size(size) for size in args.sizes.split(',')]:
+            run_size(suite, rows, s3, collection, indicators, prediction, compact_model, trainers, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sizes': args.sizes,
+            'repeat': args.repeat,
+        },
+        'results': suite.results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {path}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(suite.results, baseline, args.threshold)
+        if regressions:
+            raise SystemExit(f'{len(regressions)} stage(s) slower than {args.threshold}x the baseline: {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+FEATURE_COLUMNS = ['open', 'high', 'low', 'volume', 'sma_14', 'ema_14', 'rsi', 'volatility']
+PROCESSED_COLUMNS = ['t', 'open', 'high', 'low', 'close', 'volume', 'sma_14', 'ema_14', 'rsi', 'volatility']
+
+START_MS = 1704067200000  # 2024-01-01T00:00:00Z
+STEP_MS = {'minute': 60000, 'hour': 3600000, 'day': 86400000}
+
+
+# Deterministic OHLCV random walk as Polygon aggregate results:
+# [{'o', 'h', 'l', 'c', 'v', 't'}, ...]
+def polygon_results(n, seed=0, timespan='minute', start_ms=START_MS):
+    bars = ohlcv_arrays(n, seed, timespan, start_ms)
+    return [
+        {'o': o, 'h': h, 'l': l, 'c': c, 'v': v, 't': t}
+        for o, h, l, c, v, t in zip(
+            bars['open'].tolist(), bars['high'].tolist(), bars['low'].tolist(),
+            bars['close'].tolist(), bars['volume'].tolist(), bars['t'].tolist()
+        )
+    ]
+
+
+def ohlcv_arrays(n, seed=0, timespan='minute', start_ms=START_MS):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0, 0.001, n)
+    close = 150.0 * np.exp(np.cumsum(returns))
+    open_ = np.concatenate([[150.0], close[:-1]])
+    spread = np.abs(rng.normal(0.0, 0.0005, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.integers(1000, 100000, n).astype(np.float64)
+    t = start_ms + np.arange(n, dtype=np.int64) * STEP_MS[timespan]
+    return {
+        'open': np.round(open_, 4), 'high': np.round(high, 4), 'low': np.round(low, 4),
+        'close': np.round(close, 4), 'volume': volume, 't': t,
+    }
+
+
+# Processed dataset as written by the collection Lambda, without calling it
+def processed_frame(n, seed=0, timespan='day'):
+    bars = ohlcv_arrays(n + 13, seed, timespan)
+    df = pd.DataFrame({column: bars[column] for column in ['open', 'high', 'low', 'close', 'volume']})
+    df['t'] = bars['t']
+    close = df['close']
+    delta = close.diff(1)
+    gain = delta.where(delta > 0, 0).rolling(14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+    df['sma_14'] = close.rolling(14).mean()
+    df['ema_14'] = close.ewm(span=14, adjust=False).mean()
+    df['rsi'] = 100 - (100 / (1 + gain / loss))
+    df['volatility'] = close.rolling(14).std()
+    # Stored dtypes of the collection Lambda: int64 time, float32 values
+    df = df.dropna().reset_index(drop=True)[PROCESSED_COLUMNS]
+    return df.astype({column: 'int64' if column == 't' else 'float32' for column in PROCESSED_COLUMNS})
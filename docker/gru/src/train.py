@@ -1,61 +1,313 @@
 import os
+import sys
+import math
+import time
 import argparse
+import tempfile
 import boto3
-import pandas as pd
-import io
+import json
+import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import GRU, Dense
+from tensorflow.keras.callbacks import Callback, EarlyStopping, ModelCheckpoint
 import numpy as np
 import joblib
 
-def load_csv_from_s3(bucket_name, file_key):
-    s3_client = boto3.client('s3')
-    csv_obj = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-    
-    body = csv_obj['Body'].read().decode('utf-8')
-    data = pd.read_csv(io.StringIO(body))
-    
-    return data
-    
-def upload_model_to_s3(model, bucket_name, model_key):
-    s3_client = boto3.client('s3')
-    
-    # Save the model to a local file
-    model_local_path = '/tmp/gru_model.joblib'
-    joblib.dump(model, model_local_path)
-    
-    # Upload the model to S3
-    with open(model_local_path, 'rb') as model_file:
-        s3_client.upload_fileobj(model_file, bucket_name, model_key)
-    
-    
-    print(f"Model uploaded to s3://{bucket_name}/{model_key}")
+# Modules shared by the trainers sit next to train.py in the image and in
+# docker/shared in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'shared'))
+import compact_export
+import training_data
+
+TARGET_COLUMN = 'close'
+# The dataset declares its features: every column the collection Lambda wrote
+# besides the bar time and the target (see its features.py)
+NON_FEATURE_COLUMNS = ['t', 'date', TARGET_COLUMN]
+
+# Sequence length and batch size can be set per training job
+WINDOW_SIZE = int(os.getenv('WINDOW_SIZE', '60'))
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '32'))
+
+# The last VALIDATION_FRACTION of the windows (the most recent bars) is held out.
+# Training stops once the validation loss has not improved for PATIENCE epochs,
+# or has reached TARGET_LOSS, and keeps the weights of the best epoch. Losses
+# are MSE of the standardized target, so TARGET_LOSS=0.01 means an RMSE of a
+# tenth of the close price's standard deviation.
+EPOCHS = int(os.getenv('EPOCHS', '10'))
+PATIENCE = int(os.getenv('PATIENCE', '2'))
+VALIDATION_FRACTION = float(os.getenv('VALIDATION_FRACTION', '0.1'))
+TARGET_LOSS = float(os.getenv('TARGET_LOSS')) if os.getenv('TARGET_LOSS') else None
+# Best weights are checkpointed here (e.g. SageMaker's /opt/ml/checkpoints); a temporary directory by default
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR') or None
+
+MODEL_KEY = 'training/models/gru_model.joblib'
+# Weights for the prediction Lambda's NumPy forward pass, as float32 and as int8
+COMPACT_MODEL_KEY = 'training/models/gru_model.compact'
+QUANTIZED_MODEL_KEY = 'training/models/gru_model_int8.compact'
+# Epochs, losses and time to the best and to the target loss
+REPORT_KEY = 'training/models/gru_training_report.json'
+
+# Partitioned datasets (the dataset's manifest as FILE_KEY) are read only for
+# the partitions overlapping [FROM_DATE, TO_DATE] (see training_data.py)
+FROM_DATE = os.getenv('FROM_DATE') or None
+TO_DATE = os.getenv('TO_DATE') or None
+
+def load_dataset_from_s3(bucket_name, file_key, columns=None):
+    return training_data.load_dataset(boto3.client('s3'), bucket_name, file_key, columns, FROM_DATE, TO_DATE)
+
+# Column statistics gathered at ingestion, or None when the dataset has none
+def load_statistics(bucket_name, file_key):
+    return training_data.load_statistics(boto3.client('s3'), bucket_name, file_key, FROM_DATE, TO_DATE)
+
+def feature_columns(data):
+    return [column for column in data.columns if column not in NON_FEATURE_COLUMNS]
+
+# (rows - window_size, window_size, features) view over X; nothing is copied
+def sliding_windows(X, window_size):
+    windows = np.lib.stride_tricks.sliding_window_view(X, window_size, axis=0)
+    return windows[:len(X) - window_size].transpose(0, 2, 1)
+
+# Shuffled batches of windows and their next-step targets. Only one batch is
+# materialised at a time, so memory scales with the feature matrix.
+def window_batches(X, y, window_size, batch_size, shuffle=True, seed=42):
+    windows = sliding_windows(X, window_size)
+    targets = y[window_size:]
+    rng = np.random.default_rng(seed)
+
+    def batches():
+        order = rng.permutation(len(windows)) if shuffle else np.arange(len(windows))
+        for start in range(0, len(order), batch_size):
+            index = order[start:start + batch_size]
+            yield windows[index], targets[index]
+
+    return batches
+
+# Streaming input for Keras: batches are cut from the strided view while the
+# previous one trains. The known batch count keeps Keras progress and epochs exact.
+def make_dataset(X, y, window_size, batch_size, shuffle=True):
+    signature = (
+        tf.TensorSpec(shape=(None, window_size, X.shape[1]), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32),
+    )
+    dataset = tf.data.Dataset.from_generator(
+        window_batches(X, y, window_size, batch_size, shuffle),
+        output_signature=signature
+    )
+    batch_count = -(-(len(X) - window_size) // batch_size)
+    dataset = dataset.apply(tf.data.experimental.assert_cardinality(batch_count))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+# Symmetric int8 with one float32 scale per output column
+def quantize(weights):
+    scale = np.abs(weights).max(axis=0) / 127
+    scale[scale == 0] = 1
+    return np.round(weights / scale).astype(np.int8), scale.astype(np.float32)
+
+# Stacked recurrent layers and the Dense head as plain arrays, in Keras' gate
+# order and weight layout. The prediction Lambda implements only the default
+# activations, so anything else is refused here rather than mispredicted there.
+def export_compact_model(model, path, quantized=False):
+    recurrent_layers = model.layers[:-1]
+    arrays = {}
+    layers = []
+    for index, layer in enumerate(recurrent_layers):
+        config = layer.get_config()
+        if config['activation'] != 'tanh' or config['recurrent_activation'] != 'sigmoid' or not config.get('reset_after', True):
+            raise ValueError(f"Layer {layer.name} cannot be exported: only tanh/sigmoid activations are supported")
+        kernel, recurrent_kernel, bias = layer.get_weights()
+        arrays[f'layer{index}_kernel'] = kernel
+        arrays[f'layer{index}_recurrent_kernel'] = recurrent_kernel
+        arrays[f'layer{index}_bias'] = bias
+        layers.append({'units': config['units'], 'return_sequences': config['return_sequences']})
+    arrays['dense_kernel'], arrays['dense_bias'] = model.layers[-1].get_weights()
+
+    if quantized:
+        for name in [name for name in arrays if name.endswith('kernel')]:
+            arrays[name], arrays[f'{name}_scale'] = quantize(arrays[name])
+    arrays = {name: array.astype(np.int8 if array.dtype == np.int8 else np.float32) for name, array in arrays.items()}
+
+    header = {
+        'kind': 'rnn',
+        'cell': 'gru',
+        'feature_names': list(model.feature_names),
+        'window_size': int(model.input_shape[1]),
+        'layers': layers,
+        'quantization': 'int8' if quantized else None,
+        # Standardization the network was trained on (make_scaler)
+        'feature_mean': [float(value) for value in model.scaler['feature_mean']],
+        'feature_scale': [float(value) for value in model.scaler['feature_scale']],
+        'target_mean': float(model.scaler['target_mean']),
+        'target_scale': float(model.scaler['target_scale']),
+    }
+    compact_export.write_compact_model(path, header, arrays)
+
+# Mean and standard deviation of a column: from the ingestion statistics when
+# they cover it, otherwise from the values themselves
+def column_scaler(values, column, statistics):
+    stats = (statistics or {}).get(column)
+    if stats and stats['count']:
+        mean, std = stats['mean'], math.sqrt(stats['m2'] / stats['count'])
+    else:
+        mean, std = float(np.mean(values, dtype=np.float64)), float(np.std(values, dtype=np.float64))
+    return mean, std if std > 0 else 1.0
+
+# Features and the target are standardized, so volume (millions) and RSI (0-100)
+# reach the network on the same scale. The prediction Lambda applies the same
+# scaler from the compact model's header.
+def make_scaler(X, y, feature_names, statistics):
+    features = [column_scaler(X[:, index], name, statistics) for index, name in enumerate(feature_names)]
+    target_mean, target_scale = column_scaler(y, TARGET_COLUMN, statistics)
+    return {
+        'feature_mean': [mean for mean, _ in features],
+        'feature_scale': [scale for _, scale in features],
+        'target_mean': target_mean,
+        'target_scale': target_scale,
+    }
+
+def standardize(values, mean, scale):
+    return ((values - np.asarray(mean)) / np.asarray(scale)).astype(np.float32)
+
+# Per-epoch losses and wall time; stops training once the monitored loss
+# reaches target_loss
+class TrainingProgress(Callback):
+    def __init__(self, target_loss=None):
+        super().__init__()
+        self.target_loss = target_loss
+        self.history = []
+        self.seconds_to_target = None
+
+    def on_train_begin(self, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        seconds = time.perf_counter() - self.start
+        val_loss = float(logs['val_loss']) if 'val_loss' in logs else None
+        self.history.append({'epoch': epoch + 1, 'seconds': round(seconds, 3), 'loss': float(logs['loss']), 'val_loss': val_loss})
+        loss = float(logs['loss']) if val_loss is None else val_loss
+        if self.target_loss is not None and self.seconds_to_target is None and loss <= self.target_loss:
+            self.seconds_to_target = round(seconds, 3)
+            self.model.stop_training = True
+
+    def report(self, target_scale):
+        monitor = 'loss' if self.history[0]['val_loss'] is None else 'val_loss'
+        best = min(self.history, key=lambda epoch: epoch[monitor])
+        return {
+            'epochs': len(self.history),
+            'max_epochs': EPOCHS,
+            'monitor': monitor,
+            'best_epoch': best['epoch'],
+            'best_loss': best[monitor],
+            # RMSE in price units
+            'best_rmse': math.sqrt(best[monitor]) * target_scale,
+            'seconds_to_best': best['seconds'],
+            'target_loss': self.target_loss,
+            'seconds_to_target': self.seconds_to_target,
+            'train_seconds': self.history[-1]['seconds'],
+            'history': self.history,
+        }
+
+def fit_model(X, y, statistics=None):
+    # Feature kolone se pamte za export, redom kojim model dobija ulaz
+    feature_names = list(X.columns) if hasattr(X, 'columns') else [f'x{index}' for index in range(np.shape(X)[1])]
 
-def train(data):
     # Priprema podataka
-    X = data[['open', 'high', 'low', 'volume', 'sma_14', 'ema_14', 'rsi', 'volatility']].values
-    y = data['close'].values
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+    scaler = make_scaler(X, y, feature_names, statistics)
+    X = standardize(X, scaler['feature_mean'], scaler['feature_scale'])
+    y = standardize(y, scaler['target_mean'], scaler['target_scale'])
+
+    # Validacioni skup je vremenski poslednji deo prozora; njegovi prozori
+    # počinju window_size redova pre prvog validacionog cilja
+    validation_windows = int((len(X) - WINDOW_SIZE) * VALIDATION_FRACTION)
+    split = len(X) - validation_windows
+    validation = None
+    if validation_windows > 0 and split > WINDOW_SIZE:
+        validation = make_dataset(X[split - WINDOW_SIZE:], y[split - WINDOW_SIZE:], WINDOW_SIZE, BATCH_SIZE, shuffle=False)
+        X, y = X[:split], y[:split]
     
-    # Pretvaranje podataka u sekvencijalni oblik
-    X = np.array([X[i:i+60] for i in range(len(X)-60)])  # 60 minuta unazad
-    y = y[60:]
+    # Sekvence se prave kao pogledi nad X i pune se batch po batch (60 minuta unazad po defaultu)
+    dataset = make_dataset(X, y, WINDOW_SIZE, BATCH_SIZE)
     
     # Definisanje GRU modela
     model = Sequential([
-        GRU(50, return_sequences=True, input_shape=(X.shape[1], X.shape[2])),
+        GRU(50, return_sequences=True, input_shape=(WINDOW_SIZE, X.shape[1])),
         GRU(50),
         Dense(1)
     ])
     model.compile(optimizer='adam', loss='mse')
-    
+
+    progress = TrainingProgress(TARGET_LOSS)
+    callbacks = [progress]
+    if validation is not None:
+        if CHECKPOINT_DIR:
+            os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        checkpoint_path = os.path.join(tempfile.mkdtemp(prefix='gru-', dir=CHECKPOINT_DIR), 'best.weights.h5')
+        callbacks += [
+            EarlyStopping(monitor='val_loss', patience=PATIENCE),
+            ModelCheckpoint(checkpoint_path, monitor='val_loss', save_best_only=True, save_weights_only=True),
+        ]
+
     # Treniranje modela
-    model.fit(X, y, epochs=10, batch_size=32)
+    model.fit(dataset, validation_data=validation, epochs=EPOCHS, verbose=2, callbacks=callbacks)
+    if validation is not None:
+        model.load_weights(checkpoint_path)
+    model.feature_names = feature_names
+    model.scaler = scaler
+    model.training_report = progress.report(scaler['target_scale'])
     
-    # Define the S3 key for the model
-    model_key = 'training/models/gru_model.joblib'
-    
-    # Upload the trained model to S3
-    upload_model_to_s3(model, bucket_name, model_key)
+    return model
+
+# Model files written locally, keyed by their S3 key
+def write_artifacts(model, directory):
+    model_local_path = os.path.join(directory, 'gru_model.joblib')
+    joblib.dump(model, model_local_path)
+
+    compact_local_path = os.path.join(directory, 'gru_model.compact')
+    export_compact_model(model, compact_local_path)
+    quantized_local_path = os.path.join(directory, 'gru_model_int8.compact')
+    export_compact_model(model, quantized_local_path, quantized=True)
+
+    report_local_path = os.path.join(directory, 'gru_training_report.json')
+    with open(report_local_path, 'w') as report_file:
+        json.dump(model.training_report, report_file, indent=2)
+
+    return {
+        MODEL_KEY: model_local_path,
+        COMPACT_MODEL_KEY: compact_local_path,
+        QUANTIZED_MODEL_KEY: quantized_local_path,
+        REPORT_KEY: report_local_path,
+    }
+
+def upload_artifacts_to_s3(artifacts, bucket_name):
+    s3_client = boto3.client('s3')
+
+    for model_key, model_local_path in artifacts.items():
+        with open(model_local_path, 'rb') as model_file:
+            s3_client.upload_fileobj(model_file, bucket_name, model_key)
+        print(f"Model uploaded to s3://{bucket_name}/{model_key}")
+
+def train():
+    file_key = os.getenv('FILE_KEY')
+    bucket_name = os.getenv('BUCKET_NAME')
+
+    # Load the dataset from S3
+    data = load_dataset_from_s3(bucket_name, file_key)
+    statistics = load_statistics(bucket_name, file_key)
+
+    model = fit_model(data[feature_columns(data)], data[TARGET_COLUMN], statistics)
+    report = model.training_report
+    print(
+        f"Best {report['monitor']} {report['best_loss']:.5f} (RMSE {report['best_rmse']:.4f}) at epoch "
+        f"{report['best_epoch']} of {report['epochs']}, after {report['seconds_to_best']:.1f} s"
+    )
+    if report['target_loss'] is not None:
+        reached = 'not reached' if report['seconds_to_target'] is None else f"reached after {report['seconds_to_target']:.1f} s"
+        print(f"Target loss {report['target_loss']} {reached}")
+
+    # Upload the trained model and its compact exports to S3
+    upload_artifacts_to_s3(write_artifacts(model, '/tmp'), bucket_name)
 
 if __name__ == '__main__':
     train()
\ No newline at end of file
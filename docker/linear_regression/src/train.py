@@ -1,54 +1,85 @@
 import os
+import sys
 import argparse
 import boto3
-import pandas as pd
-import io
+import numpy as np
 from sklearn.linear_model import LinearRegression
 import joblib
 
-def load_csv_from_s3(bucket_name, file_key):
-    s3_client = boto3.client('s3')
-    csv_obj = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-    
-    body = csv_obj['Body'].read().decode('utf-8')
-    data = pd.read_csv(io.StringIO(body))
-    
-    return data
-    
-def upload_model_to_s3(model, bucket_name, model_key):
-    s3_client = boto3.client('s3')
-    
-    # Save the model to a local file
-    model_local_path = '/tmp/linear_regression_model.joblib'
+# Modules shared by the trainers sit next to train.py in the image and in
+# docker/shared in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'shared'))
+import compact_export
+import training_data
+
+TARGET_COLUMN = 'close'
+# The dataset declares its features: every column the collection Lambda wrote
+# besides the bar time and the target (see its features.py)
+NON_FEATURE_COLUMNS = ['t', 'date', TARGET_COLUMN]
+
+MODEL_KEY = 'training/models/linear_regression_model.joblib'
+# Compact export for fast, scikit-learn free inference in the prediction Lambda
+COMPACT_MODEL_KEY = 'training/models/linear_regression_model.compact'
+
+# Partitioned datasets (the dataset's manifest as FILE_KEY) are read only for
+# the partitions overlapping [FROM_DATE, TO_DATE] (see training_data.py)
+FROM_DATE = os.getenv('FROM_DATE') or None
+TO_DATE = os.getenv('TO_DATE') or None
+
+def load_dataset_from_s3(bucket_name, file_key, columns=None):
+    return training_data.load_dataset(boto3.client('s3'), bucket_name, file_key, columns, FROM_DATE, TO_DATE)
+
+def feature_columns(data):
+    return [column for column in data.columns if column not in NON_FEATURE_COLUMNS]
+
+# Coefficients and intercept in the prediction Lambda's compact format
+def export_compact_model(model, path):
+    arrays = {
+        'coef': np.asarray(model.coef_, dtype=np.float64).reshape(-1),
+        'intercept': np.array([model.intercept_], dtype=np.float64),
+    }
+    compact_export.write_compact_model(path, {'kind': 'linear', 'feature_names': list(model.feature_names_in_)}, arrays)
+
+def fit_model(X, y):
+    # Create and train the linear regression model. The dataset is float32, but
+    # least squares over the closely correlated price features needs float64.
+    model = LinearRegression()
+    model.fit(X.astype(np.float64), y.astype(np.float64))
+    return model
+
+# Model files written locally, keyed by their S3 key
+def write_artifacts(model, directory):
+    model_local_path = os.path.join(directory, 'linear_regression_model.joblib')
     joblib.dump(model, model_local_path)
-    
-    # Upload the model to S3
-    with open(model_local_path, 'rb') as model_file:
-        s3_client.upload_fileobj(model_file, bucket_name, model_key)
-    
-    
-    print(f"Model uploaded to s3://{bucket_name}/{model_key}")
+
+    compact_local_path = os.path.join(directory, 'linear_regression_model.compact')
+    export_compact_model(model, compact_local_path)
+
+    return {MODEL_KEY: model_local_path, COMPACT_MODEL_KEY: compact_local_path}
+
+def upload_artifacts_to_s3(artifacts, bucket_name):
+    s3_client = boto3.client('s3')
+
+    for model_key, model_local_path in artifacts.items():
+        with open(model_local_path, 'rb') as model_file:
+            s3_client.upload_fileobj(model_file, bucket_name, model_key)
+        print(f"Model uploaded to s3://{bucket_name}/{model_key}")
 
 def train():
     file_key = os.getenv('FILE_KEY')
     bucket_name = os.getenv('BUCKET_NAME')
 
     # Load the dataset from S3
-    data = load_csv_from_s3(bucket_name, file_key)
+    data = load_dataset_from_s3(bucket_name, file_key)
     
     # Feature selection and target variable
-    X = data[['open', 'high', 'low', 'volume', 'sma_14', 'ema_14', 'rsi', 'volatility']]
-    y = data['close']
+    X = data[feature_columns(data)]
+    y = data[TARGET_COLUMN]
 
-    # Create and train the linear regression model
-    model = LinearRegression()
-    model.fit(X_train, y_train)
+    model = fit_model(X, y)
 
-    # Define the S3 key for the model
-    model_key = 'training/models/linear_regression_model.joblib'
-    
-    # Upload the trained model to S3
-    upload_model_to_s3(model, bucket_name, model_key)
+    # Upload the trained model and its compact export to S3
+    upload_artifacts_to_s3(write_artifacts(model, '/tmp'), bucket_name)
 
 if __name__ == '__main__':
-    train()
+    train()
\ No newline at end of file
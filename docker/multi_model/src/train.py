@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import contextlib
+import tempfile
+import importlib
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import boto3
+import numpy as np
+import pandas as pd
+
+# Modules shared by the trainers sit next to train.py in the image and in
+# docker/shared in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'shared'))
+import training_data
+import walk_forward_search
+
+# Trains several models from one download of the dataset. Every model is trained
+# by its own trainer module (docker/<model>/src/train.py), which exposes
+# fit_model(X, y) and write_artifacts(model, directory). The image copies the
+# trainers under /opt/ml/code/trainers with the same layout as the repository,
+# and the modules they share (docker/shared) next to this file.
+
+TARGET_COLUMN = 'close'
+# The dataset declares its features: every column the collection Lambda wrote
+# besides the bar time and the target (see its features.py)
+NON_FEATURE_COLUMNS = ['t', 'date', TARGET_COLUMN]
+
+# Model registry: model name -> trainer directory
+MODELS = {
+    'linear_regression': 'linear_regression',
+    'decision_tree': 'decision_tree_regression',
+    'random_forest': 'random_forest_regression',
+    'lstm': 'lstm',
+    'gru': 'gru',
+}
+
+BUNDLED_TRAINERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trainers')
+REPO_TRAINERS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TRAINERS_DIR = os.getenv(
+    'TRAINERS_DIR',
+    BUNDLED_TRAINERS_DIR if os.path.isdir(BUNDLED_TRAINERS_DIR) else REPO_TRAINERS_DIR
+)
+
+# The sequence models need more rows than their longest window
+MIN_ROWS = 100
+
+# Models whose fit_model scales its inputs with the dataset's column statistics
+SCALED_MODELS = ('lstm', 'gru')
+
+RUNS_PREFIX = 'training/runs/'
+
+def feature_columns(data):
+    return [column for column in data.columns if column not in NON_FEATURE_COLUMNS]
+
+# Raises ValueError when the dataset cannot be trained on
+def validate_dataset(data):
+    if TARGET_COLUMN not in data.columns:
+        raise ValueError(f"Dataset has no {TARGET_COLUMN} column")
+    features = feature_columns(data)
+    if not features:
+        raise ValueError("Dataset has no feature columns")
+    if len(data) < MIN_ROWS:
+        raise ValueError(f"Dataset has {len(data)} rows, at least {MIN_ROWS} are needed")
+
+    values = data[features + [TARGET_COLUMN]].to_numpy()
+    if not np.isfinite(values).all():
+        bad_rows = int((~np.isfinite(values)).any(axis=1).sum())
+        raise ValueError(f"Dataset has {bad_rows} rows with missing or infinite values")
+
+# Hyperparameters of one model reach the job as <MODEL>__<NAME> (e.g.
+# LSTM__WINDOW_SIZE), since two models may set the same name differently. They
+# are set under their plain names while that model loads and trains, and the
+# shared search module is reloaded so its settings follow; the previous values
+# come back afterwards, as a worker process may train another model next.
+@contextlib.contextmanager
+def model_environment(model_name):
+    prefix = f'{model_name.upper()}__'
+    settings = {name[len(prefix):]: value for name, value in os.environ.items() if name.startswith(prefix)}
+    previous = {name: os.environ.get(name) for name in settings}
+    os.environ.update(settings)
+    importlib.reload(walk_forward_search)
+    try:
+        yield settings
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        importlib.reload(walk_forward_search)
+
+def load_trainer(model_name):
+    path = os.path.join(TRAINERS_DIR, MODELS[model_name], 'src', 'train.py')
+    spec = importlib.util.spec_from_file_location(f'{model_name}_trainer', path)
+    trainer = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(trainer)
+    return trainer
+
+# Runs in a worker process. The feature matrix and target are memory-mapped
+# read-only from the .npy files the parent wrote, so every worker shares the
+# same pages instead of holding its own copy.
+def train_model(model_name, matrix_path, target_path, artifact_dir, features, statistics=None):
+    with model_environment(model_name):
+        return train_with_settings(model_name, matrix_path, target_path, artifact_dir, features, statistics)
+
+def train_with_settings(model_name, matrix_path, target_path, artifact_dir, features, statistics=None):
+    timings = {}
+    start = time.perf_counter()
+    trainer = load_trainer(model_name)
+    X = pd.DataFrame(np.load(matrix_path, mmap_mode='r'), columns=features, copy=False)
+    y = pd.Series(np.load(target_path, mmap_mode='r'), name=TARGET_COLUMN, copy=False)
+    timings['setup_seconds'] = time.perf_counter() - start
+
+    # Models with a hyperparameter search run it in this worker, fold after
+    # fold, since the models already train in parallel; the results go back
+    # to the parent, which uploads them
+    search = None
+    if walk_forward_search.SEARCH_MODE and hasattr(trainer, 'search_hyperparameters'):
+        start = time.perf_counter()
+        params, results = trainer.search_hyperparameters(X, y, workers=1)
+        search = {'params': params, 'results': results}
+        timings['search_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if model_name in SCALED_MODELS:
+        model = trainer.fit_model(X, y, statistics)
+    elif search is not None:
+        model = trainer.fit_model(X, y, params=search['params'])
+    else:
+        model = trainer.fit_model(X, y)
+    timings['fit_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model_dir = os.path.join(artifact_dir, model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    artifacts = trainer.write_artifacts(model, model_dir)
+    timings['write_seconds'] = time.perf_counter() - start
+
+    return {'artifacts': artifacts, 'timings': timings, 'search': search}
+
+def train_models(s3_client, bucket_name, file_key, model_names=None, max_workers=None, from_date=None, to_date=None):
+    model_names = list(model_names or MODELS)
+    unknown = [model_name for model_name in model_names if model_name not in MODELS]
+    if unknown:
+        raise ValueError(f"Unknown models: {unknown}")
+
+    run_id = str(uuid.uuid4())
+    run = {'run_id': run_id, 'file_key': file_key, 'from_date': from_date, 'to_date': to_date, 'models': {}, 'timings': {}}
+    workdir = tempfile.mkdtemp(prefix='training-')
+    total_start = time.perf_counter()
+    try:
+        # Load and validate the dataset once for all models
+        start = time.perf_counter()
+        data = training_data.load_dataset(s3_client, bucket_name, file_key, None, from_date, to_date)
+        statistics = training_data.load_statistics(s3_client, bucket_name, file_key, from_date, to_date)
+        run['timings']['load_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        validate_dataset(data)
+        matrix_path = os.path.join(workdir, 'features.npy')
+        target_path = os.path.join(workdir, 'target.npy')
+        features = feature_columns(data)
+        # Kept in the dataset's float32; trainers that need float64 cast themselves
+        np.save(matrix_path, data[features].to_numpy(dtype=np.float32))
+        np.save(target_path, data[TARGET_COLUMN].to_numpy(dtype=np.float32))
+        run['rows'] = len(data)
+        run['features'] = features
+        del data
+        run['timings']['prepare_seconds'] = time.perf_counter() - start
+
+        # Spawned workers start clean, so TensorFlow is never forked mid-flight
+        max_workers = max_workers or min(len(model_names), os.cpu_count() or 1)
+        context = multiprocessing.get_context('spawn')
+        artifact_dir = os.path.join(workdir, 'artifacts')
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            futures = {
+                executor.submit(train_model, model_name, matrix_path, target_path, artifact_dir, features, statistics): model_name
+                for model_name in model_names
+            }
+            for future in as_completed(futures):
+                model_name = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    run['models'][model_name] = {'status': 'failed', 'error': str(e)}
+                    print(f"Training {model_name} failed: {e}")
+                    continue
+
+                # Upload as soon as a model is done, while the others keep training
+                start = time.perf_counter()
+                for model_key, model_local_path in result['artifacts'].items():
+                    s3_client.upload_file(model_local_path, bucket_name, model_key)
+                    print(f"Model uploaded to s3://{bucket_name}/{model_key}")
+                result['timings']['upload_seconds'] = time.perf_counter() - start
+                run['models'][model_name] = {
+                    'status': 'succeeded',
+                    'artifacts': sorted(result['artifacts']),
+                    'timings': result['timings'],
+                }
+                if result['search'] is not None:
+                    search = result['search']
+                    run['models'][model_name]['params'] = search['params']
+                    run['models'][model_name]['search_results'] = walk_forward_search.upload_search_results(
+                        s3_client, bucket_name, model_name, search['results'], search['params']
+                    )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    run['timings']['total_seconds'] = time.perf_counter() - total_start
+    run_key = f'{RUNS_PREFIX}{run_id}.json'
+    s3_client.put_object(Bucket=bucket_name, Key=run_key, Body=json.dumps(run, indent=2), ContentType='application/json')
+    print(f"Training run summary saved to s3://{bucket_name}/{run_key}")
+    return run
+
+def train():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bucket', default=os.getenv('BUCKET_NAME'))
+    parser.add_argument('--file-key', default=os.getenv('FILE_KEY'))
+    parser.add_argument('--from-date', default=os.getenv('FROM_DATE') or None, help='first date of a partitioned dataset (manifest key)')
+    parser.add_argument('--to-date', default=os.getenv('TO_DATE') or None, help='last date of a partitioned dataset (manifest key)')
+    parser.add_argument('--models', default=os.getenv('MODELS', ','.join(MODELS)), help='comma separated model names')
+    parser.add_argument('--max-workers', type=int, default=int(os.getenv('MAX_WORKERS', '0')) or None)
+    parser.add_argument('--local-s3', help='directory of a filesystem S3 stand-in (benchmarks/local_s3.py) instead of AWS')
+    # SageMaker starts the container with a trailing "train" argument
+    args, _ = parser.parse_known_args()
+
+    if args.local_s3:
+        sys.path.insert(0, os.path.join(os.path.dirname(REPO_TRAINERS_DIR), 'benchmarks'))
+        from local_s3 import LocalS3
+        s3_client = LocalS3(args.local_s3)
+    else:
+        s3_client = boto3.client('s3')
+
+    run = train_models(
+        s3_client, args.bucket, args.file_key, args.models.split(','), args.max_workers, args.from_date, args.to_date
+    )
+    failed = [model_name for model_name, result in run['models'].items() if result['status'] != 'succeeded']
+    if failed:
+        sys.exit(f"Training failed for: {failed}")
+
+if __name__ == '__main__':
+    train()
@@ -1,54 +1,102 @@
 import os
+import sys
 import argparse
 import boto3
-import pandas as pd
-import io
 from sklearn.ensemble import RandomForestRegressor
 import joblib
 
-def load_csv_from_s3(bucket_name, file_key):
-    s3_client = boto3.client('s3')
-    csv_obj = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-    
-    body = csv_obj['Body'].read().decode('utf-8')
-    data = pd.read_csv(io.StringIO(body))
-    
-    return data
-    
-def upload_model_to_s3(model, bucket_name, model_key):
-    s3_client = boto3.client('s3')
-    
-    # Save the model to a local file
-    model_local_path = '/tmp/random_forest_model.joblib'
+# Modules shared by the trainers sit next to train.py in the image and in
+# docker/shared in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'shared'))
+import compact_export
+import training_data
+import walk_forward_search
+
+TARGET_COLUMN = 'close'
+# The dataset declares its features: every column the collection Lambda wrote
+# besides the bar time and the target (see its features.py)
+NON_FEATURE_COLUMNS = ['t', 'date', TARGET_COLUMN]
+
+MODEL_KEY = 'training/models/random_forest_model.joblib'
+# Compact export for fast, scikit-learn free inference in the prediction Lambda
+COMPACT_MODEL_KEY = 'training/models/random_forest_model.compact'
+
+MODEL_CLASS = RandomForestRegressor
+# Parameters used when no search runs, and the grid searched by default
+DEFAULT_PARAMS = {'n_estimators': 100, 'max_depth': 10, 'random_state': 42}
+DEFAULT_PARAM_GRID = {'n_estimators': [50, 100, 200], 'max_depth': [6, 10, 14, None], 'min_samples_leaf': [1, 5, 20], 'max_features': [1.0, 0.5]}
+PARAM_GRID = walk_forward_search.PARAM_GRID or DEFAULT_PARAM_GRID
+
+# Partitioned datasets (the dataset's manifest as FILE_KEY) are read only for
+# the partitions overlapping [FROM_DATE, TO_DATE] (see training_data.py)
+FROM_DATE = os.getenv('FROM_DATE') or None
+TO_DATE = os.getenv('TO_DATE') or None
+
+def load_dataset_from_s3(bucket_name, file_key, columns=None):
+    return training_data.load_dataset(boto3.client('s3'), bucket_name, file_key, columns, FROM_DATE, TO_DATE)
+
+def feature_columns(data):
+    return [column for column in data.columns if column not in NON_FEATURE_COLUMNS]
+
+def export_compact_model(model, path):
+    arrays, max_depth = compact_export.flatten_trees(model.estimators_)
+    header = {'kind': 'trees', 'feature_names': list(model.feature_names_in_), 'max_depth': max_depth, 'n_trees': len(arrays['roots'])}
+    compact_export.write_compact_model(path, header, arrays)
+
+def build_model(params=None):
+    return MODEL_CLASS(**{**DEFAULT_PARAMS, **(params or {})})
+
+# Walk-forward search over PARAM_GRID (see walk_forward_search.py); returns
+# (best parameters, per-configuration results)
+def search_hyperparameters(X, y, workers=walk_forward_search.SEARCH_WORKERS):
+    candidates = walk_forward_search.candidate_params(PARAM_GRID)
+    return walk_forward_search.search_hyperparameters(X, y, build_model, candidates, workers=workers)
+
+def fit_model(X, y, params=None):
+    # Create and train the random forest regression model
+    model = build_model(params)
+    model.fit(X, y)
+    return model
+
+# Model files written locally, keyed by their S3 key
+def write_artifacts(model, directory):
+    model_local_path = os.path.join(directory, 'random_forest_model.joblib')
     joblib.dump(model, model_local_path)
-    
-    # Upload the model to S3
-    with open(model_local_path, 'rb') as model_file:
-        s3_client.upload_fileobj(model_file, bucket_name, model_key)
-    
-    
-    print(f"Model uploaded to s3://{bucket_name}/{model_key}")
+
+    compact_local_path = os.path.join(directory, 'random_forest_model.compact')
+    export_compact_model(model, compact_local_path)
+
+    return {MODEL_KEY: model_local_path, COMPACT_MODEL_KEY: compact_local_path}
+
+def upload_artifacts_to_s3(artifacts, bucket_name):
+    s3_client = boto3.client('s3')
+
+    for model_key, model_local_path in artifacts.items():
+        with open(model_local_path, 'rb') as model_file:
+            s3_client.upload_fileobj(model_file, bucket_name, model_key)
+        print(f"Model uploaded to s3://{bucket_name}/{model_key}")
 
 def train():
     file_key = os.getenv('FILE_KEY')
     bucket_name = os.getenv('BUCKET_NAME')
 
     # Load the dataset from S3
-    data = load_csv_from_s3(bucket_name, file_key)
+    data = load_dataset_from_s3(bucket_name, file_key)
     
     # Feature selection and target variable
-    X = data[['open', 'high', 'low', 'volume', 'sma_14', 'ema_14', 'rsi', 'volatility']]
-    y = data['close']
+    X = data[feature_columns(data)]
+    y = data[TARGET_COLUMN]
 
-    # Create and train the random forest regression model
-    model = RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42)
-    model.fit(X, y)
+    params = None
+    if walk_forward_search.SEARCH_MODE:
+        params, results = search_hyperparameters(X, y)
+        walk_forward_search.upload_search_results(boto3.client('s3'), bucket_name, 'random_forest', results, params)
 
-    # Define the S3 key for the model
-    model_key = 'training/models/random_forest_model.joblib'
-    
-    # Upload the trained model to S3
-    upload_model_to_s3(model, bucket_name, model_key)
+    # Refit on the whole dataset with the chosen parameters
+    model = fit_model(X, y, params)
+
+    # Upload the trained model and its compact export to S3
+    upload_artifacts_to_s3(write_artifacts(model, '/tmp'), bucket_name)
 
 if __name__ == '__main__':
     train()
\ No newline at end of file
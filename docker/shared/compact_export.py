@@ -0,0 +1,57 @@
+import json
+import struct
+
+import numpy as np
+
+# Compact inference format read by the prediction Lambda (compact_model.py):
+# magic | header length (uint64 LE) | JSON header | arrays aligned to 64 bytes.
+# Every trainer builds its own header and arrays and writes them through here;
+# the decision tree and random forest trainers share flatten_trees for theirs.
+COMPACT_MAGIC = b'CMPMDL01'
+COMPACT_ALIGNMENT = 64
+
+def compact_aligned(offset):
+    return (offset + COMPACT_ALIGNMENT - 1) // COMPACT_ALIGNMENT * COMPACT_ALIGNMENT
+
+def write_compact_model(path, header, arrays):
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = compact_aligned(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+
+    header_bytes = json.dumps({**header, 'arrays': layout}).encode()
+    data_start = compact_aligned(len(COMPACT_MAGIC) + 8 + len(header_bytes))
+
+    with open(path, 'wb') as model_file:
+        model_file.write(COMPACT_MAGIC)
+        model_file.write(struct.pack('<Q', len(header_bytes)))
+        model_file.write(header_bytes)
+        for name, array in arrays.items():
+            model_file.write(b'\0' * (data_start + layout[name]['offset'] - model_file.tell()))
+            model_file.write(np.ascontiguousarray(array).tobytes())
+
+# Flatten fitted trees into one node table. Leaves point to themselves, so the
+# prediction Lambda can descend every tree a fixed max_depth steps without branching.
+def flatten_trees(estimators):
+    parts = {'feature': [], 'threshold': [], 'left': [], 'right': [], 'value': []}
+    roots = []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+        parts['feature'].append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        parts['threshold'].append(tree.threshold.astype(np.float64))
+        parts['left'].append((np.where(leaf, nodes, tree.children_left) + offset).astype(np.int32))
+        parts['right'].append((np.where(leaf, nodes, tree.children_right) + offset).astype(np.int32))
+        parts['value'].append(tree.value[:, 0, 0].astype(np.float64))
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {name: np.concatenate(values) for name, values in parts.items()}
+    arrays['roots'] = np.array(roots, dtype=np.int32)
+    return arrays, max_depth
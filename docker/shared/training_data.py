@@ -0,0 +1,163 @@
+import io
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Reading the collection Lambda's processed datasets, shared by the trainers and
+# the multi-model job: a single processed file (CSV, optionally gzip/zstd, or
+# Parquet) or a partitioned dataset through its manifest, and the column
+# statistics gathered while it was written. Every reader takes the S3 client,
+# so callers create it (boto3.client('s3')) at call time.
+
+# Processed datasets keep the bar start as 't' (epoch ms, int64) and prices,
+# volume and features as float32. Older ones have a YYYY-MM-DD 'date' column
+# instead of 't' and float64 values, which are read into the same types.
+DAY_MS = 24 * 60 * 60 * 1000
+CSV_DTYPES = defaultdict(lambda: 'float32', t='int64', date='object')
+
+PARTITION_READERS = 16
+
+# Compressed datasets are recognised by their key suffix (.gz, .zst)
+def compression_for(file_key):
+    if file_key.endswith('.gz'):
+        return 'gzip'
+    if file_key.endswith('.zst'):
+        return 'zstd'
+    return None
+
+def compact_dtypes(data):
+    return data.astype({column: 'float32' for column in data.columns if data[column].dtype == 'float64'})
+
+# Requested columns the dataset actually has, so either time column can be asked for
+def present_columns(columns, available):
+    return [column for column in columns if column in available]
+
+def read_csv(source, file_key, columns=None):
+    wanted = None if columns is None else set(columns)
+    return pd.read_csv(
+        source, usecols=None if wanted is None else lambda column: column in wanted,
+        dtype=CSV_DTYPES, compression=compression_for(file_key)
+    )
+
+# Parquet is read only for the requested columns
+def read_parquet(source, columns=None):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(source)
+    if columns is not None:
+        columns = present_columns(columns, parquet_file.schema_arrow.names)
+    return compact_dtypes(parquet_file.read(columns=columns).to_pandas())
+
+def read_file(s3_client, bucket_name, file_key, columns=None):
+    obj = s3_client.get_object(Bucket=bucket_name, Key=file_key)
+    if file_key.endswith('.parquet'):
+        return read_parquet(io.BytesIO(obj['Body'].read()), columns)
+    return read_csv(obj['Body'], file_key, columns)
+
+# Partitioned datasets (layout=partitioned in the collection Lambda) are read
+# through their manifest: only partitions whose [min_date, max_date] overlaps
+# [from_date, to_date] are downloaded, and only the requested columns of them
+def is_manifest_key(file_key):
+    return '/manifests/' in file_key and file_key.endswith('.json')
+
+# Dates are YYYY-MM-DD strings, so they compare lexically; None is unbounded
+def select_partitions(manifest, from_date=None, to_date=None):
+    return [
+        partition for partition in manifest.get('partitions', [])
+        if (from_date is None or partition['max_date'] >= from_date)
+        and (to_date is None or partition['min_date'] <= to_date)
+    ]
+
+def epoch_ms(day):
+    return int(pd.Timestamp(day, tz='UTC').value // 1000000)
+
+# Range bounds in the dataset's time column: dates compare lexically, epoch
+# milliseconds cover the whole to_date day
+def range_bounds(time_column, from_date, to_date):
+    if time_column == 'date':
+        return from_date, to_date
+    return (
+        epoch_ms(from_date) if from_date else None,
+        epoch_ms(to_date) + DAY_MS - 1 if to_date else None,
+    )
+
+def load_partitioned(s3_client, bucket_name, manifest_key, columns=None, from_date=None, to_date=None):
+    manifest = json.loads(s3_client.get_object(Bucket=bucket_name, Key=manifest_key)['Body'].read())
+    selected = select_partitions(manifest, from_date, to_date)
+    if not selected:
+        raise ValueError(f"No partitions of {manifest_key} overlap {from_date or '-'} .. {to_date or '-'}")
+    print(f"Reading {len(selected)} of {len(manifest['partitions'])} partitions of s3://{bucket_name}/{manifest_key}")
+
+    time_column = manifest.get('time_column', 'date')
+    read_columns = None if columns is None else list(dict.fromkeys([time_column] + columns))
+    with ThreadPoolExecutor(max_workers=min(PARTITION_READERS, len(selected))) as executor:
+        frames = list(executor.map(
+            lambda partition: read_file(s3_client, bucket_name, partition['key'], read_columns), selected
+        ))
+
+    # Partitions do not overlap, except in a combined manifest of several
+    # uploads of one dataset: there a bar is kept from the partition listed
+    # last, the latest upload. Older datasets' 'date' column is not unique.
+    data = pd.concat(frames, ignore_index=True)
+    if time_column == 't':
+        data = data.drop_duplicates(time_column, keep='last').sort_values(time_column, kind='stable', ignore_index=True)
+    # Only the first and last partition can hold rows outside the range
+    low, high = range_bounds(time_column, from_date, to_date)
+    in_range = pd.Series(True, index=data.index)
+    if low is not None:
+        in_range &= data[time_column] >= low
+    if high is not None:
+        in_range &= data[time_column] <= high
+    columns = list(data.columns) if columns is None else present_columns(columns, data.columns)
+    return data.loc[in_range, columns].reset_index(drop=True)
+
+# A processed file, or a partitioned dataset when file_key is its manifest;
+# the date range applies to partitioned datasets only
+def load_dataset(s3_client, bucket_name, file_key, columns=None, from_date=None, to_date=None):
+    if is_manifest_key(file_key):
+        return load_partitioned(s3_client, bucket_name, file_key, columns, from_date, to_date)
+    return read_file(s3_client, bucket_name, file_key, columns)
+
+# Column statistics gathered at ingestion (the collection Lambda's
+# column_stats.py): in the manifest entry of every partition, or for a
+# processed file in {data_set}/statistics/<file name>.json
+def stats_key(processed_key):
+    data_set, _, file_name = processed_key.partition('/processed/')
+    return f'{data_set}/statistics/{file_name}.json'
+
+# Pairwise Welford update: count, mean and m2 of two disjoint parts combined
+def merge_column(total, part):
+    count = total['count'] + part['count']
+    delta = part['mean'] - total['mean']
+    return {
+        'count': count,
+        'mean': total['mean'] + delta * part['count'] / count,
+        'm2': total['m2'] + part['m2'] + delta * delta * total['count'] * part['count'] / count,
+    }
+
+# Statistics of every column over the dataset's files, or None when any file
+# has none (written before they were gathered)
+def load_statistics(s3_client, bucket_name, file_key, from_date=None, to_date=None):
+    if is_manifest_key(file_key):
+        manifest = json.loads(s3_client.get_object(Bucket=bucket_name, Key=file_key)['Body'].read())
+        partitions = select_partitions(manifest, from_date, to_date)
+    else:
+        partitions = [{'key': file_key}]
+
+    totals = {}
+    for partition in partitions:
+        stats = partition.get('stats')
+        if not stats or 'mean' not in next(iter(stats.values())):
+            if '/processed/' not in partition['key']:
+                return None
+            try:
+                stats_object = s3_client.get_object(Bucket=bucket_name, Key=stats_key(partition['key']))
+            except Exception as e:
+                print(f"No column statistics for {partition['key']}: {e}")
+                return None
+            stats = json.loads(stats_object['Body'].read())['stats']
+        for column, values in stats.items():
+            totals[column] = merge_column(totals[column], values) if column in totals else values
+    return totals
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import uuid
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Hyperparameter search under walk-forward validation, shared by the decision
+# tree and random forest trainers and the multi-model job. Enabled with
+# SEARCH_MODE (grid or random). PARAM_GRID is a JSON object of parameter ->
+# candidate values; without it every trainer searches its DEFAULT_PARAM_GRID.
+SEARCH_MODE = os.getenv('SEARCH_MODE', '')
+PARAM_GRID = json.loads(os.getenv('PARAM_GRID', 'null'))
+SEARCH_SAMPLES = int(os.getenv('SEARCH_SAMPLES', '20'))
+WALK_FORWARD_SPLITS = int(os.getenv('WALK_FORWARD_SPLITS', '5'))
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', '0')) or os.cpu_count() or 1
+# A configuration is dropped once its mean fold RMSE is this many times the best one
+ABANDON_FACTOR = float(os.getenv('ABANDON_FACTOR', '1.25'))
+ABANDON_AFTER_FOLDS = 2
+
+SEARCH_RESULTS_PREFIX = 'training/search/'
+
+# Set before the worker pool forks; workers read the matrix and the model
+# factory through it, so neither is pickled per task
+search_data = {}
+
+def candidate_params(param_grid, mode=SEARCH_MODE, samples=SEARCH_SAMPLES, seed=42):
+    names = sorted(param_grid)
+    candidates = [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+    if mode == 'random' and samples < len(candidates):
+        rng = np.random.default_rng(seed)
+        candidates = [candidates[i] for i in sorted(rng.choice(len(candidates), samples, replace=False))]
+    return candidates
+
+# Expanding-window folds in time order: (train_end, test_end) row positions.
+# Every fold trains on all rows before its test block.
+def walk_forward_splits(rows, n_splits):
+    test_size = rows // (n_splits + 1)
+    if test_size == 0:
+        raise ValueError(f"{rows} rows are not enough for {n_splits} walk-forward splits")
+    return [(rows - (n_splits - i) * test_size, rows - (n_splits - i - 1) * test_size) for i in range(n_splits)]
+
+# Folds are prefixes of one float32 matrix (the dtype the trees train on), so
+# every fold slice is a view and nothing is converted per configuration.
+def evaluate_fold(params, train_end, test_end):
+    X = search_data['X']
+    y = search_data['y']
+    start = time.perf_counter()
+    model = search_data['build_model'](params)
+    model.fit(X[:train_end], y[:train_end])
+    predictions = model.predict(X[train_end:test_end])
+    errors = predictions - y[train_end:test_end]
+    return {
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'mae': float(np.mean(np.abs(errors))),
+        'seconds': time.perf_counter() - start,
+    }
+
+# Folds are evaluated in rounds, all surviving configurations in parallel per
+# round. After ABANDON_AFTER_FOLDS rounds, configurations that are clearly
+# losing are dropped and skip the remaining (largest) folds. With one worker
+# the folds run in this process, e.g. inside a multi-model worker, which may
+# not start processes of its own.
+def search_hyperparameters(X, y, build_model, candidates, n_splits=WALK_FORWARD_SPLITS, workers=SEARCH_WORKERS):
+    search_data['X'] = np.ascontiguousarray(X, dtype=np.float32)
+    search_data['y'] = np.asarray(y, dtype=np.float64)
+    search_data['build_model'] = build_model
+    splits = walk_forward_splits(len(search_data['X']), n_splits)
+
+    folds = {index: [] for index in range(len(candidates))}
+    abandoned = set()
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) if workers > 1 else None
+    try:
+        for fold, (train_end, test_end) in enumerate(splits):
+            active = [index for index in folds if index not in abandoned]
+            if executor is None:
+                for index in active:
+                    folds[index].append(evaluate_fold(candidates[index], train_end, test_end))
+            else:
+                futures = {index: executor.submit(evaluate_fold, candidates[index], train_end, test_end) for index in active}
+                for index, future in futures.items():
+                    folds[index].append(future.result())
+
+            if fold + 1 >= ABANDON_AFTER_FOLDS:
+                means = {index: np.mean([result['rmse'] for result in folds[index]]) for index in active}
+                best = min(means.values())
+                abandoned.update(index for index, mean in means.items() if mean > best * ABANDON_FACTOR)
+            print(f"Walk-forward fold {fold + 1}/{len(splits)}: {len(active)} configurations, {len(abandoned)} abandoned")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        search_data.clear()
+
+    rows = []
+    for index, results in folds.items():
+        rmse = [result['rmse'] for result in results]
+        rows.append({
+            **{f'param_{name}': value for name, value in candidates[index].items()},
+            'folds': len(results),
+            'mean_rmse': float(np.mean(rmse)),
+            'std_rmse': float(np.std(rmse)),
+            'mean_mae': float(np.mean([result['mae'] for result in results])),
+            'fit_seconds': float(sum(result['seconds'] for result in results)),
+            'status': 'abandoned' if index in abandoned else 'complete',
+        })
+    results = pd.DataFrame(rows).sort_values(['status', 'mean_rmse'], ascending=[False, True], ignore_index=True)
+    best_params = candidates[min(
+        (index for index in folds if index not in abandoned),
+        key=lambda index: np.mean([result['rmse'] for result in folds[index]])
+    )]
+    return best_params, results
+
+def upload_search_results(s3_client, bucket_name, model_name, results, best_params):
+    results_key = f'{SEARCH_RESULTS_PREFIX}{model_name}_{uuid.uuid4()}.csv'
+    s3_client.put_object(Bucket=bucket_name, Key=results_key, Body=results.to_csv(index=False))
+    print(f"Best {model_name} parameters: {best_params}")
+    print(f"Search results uploaded to s3://{bucket_name}/{results_key}")
+    return results_key
@@ -0,0 +1,190 @@
+import argparse
+import io
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import numpy as np
+import pandas as pd
+
+# Evaluacija svih predikcija iz S3 odjednom. Predikcije (predictions/) se uparuju
+# sa stvarnim vrednostima (actuals/) po zajedničkom run_id-u u imenu fajla, a
+# stariji fajlovi bez zajedničkog id-a po vremenu upisa. Redovi se spajaju po
+# datumu, ne po poziciji. Batch rezultati (predictions/batch/*.parquet) već
+# sadrže stvarne vrednosti, pa je svaki model u svakom skupu zaseban run.
+#
+#   python evaluate.py --bucket stock-data-607282882839-us-east-1 --output summary.csv
+
+PREDICTIONS_PREFIX = 'predictions/'
+ACTUALS_PREFIX = 'actuals/'
+BATCH_PREFIX = 'predictions/batch/'
+
+BATCH_FIXED_COLUMNS = ['dataset', 'date', 'actual']
+
+# Kompresija se prepoznaje po ekstenziji ključa (.gz, .zst)
+def compression_for(file_key):
+    if file_key.endswith('.gz'):
+        return 'gzip'
+    if file_key.endswith('.zst'):
+        return 'zstd'
+    return None
+
+def list_objects(s3_client, bucket_name, prefix):
+    objects = []
+    for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=prefix):
+        objects.extend(page.get('Contents', []))
+    return objects
+
+# predictions/predictions_<id>.csv i predictions/<id>.csv -> <id>
+def run_id_for(file_key):
+    name = file_key.split('/')[-1]
+    name = re.sub(r'\.(csv|parquet)(\.gz|\.zst)?$', '', name)
+    return re.sub(r'^(predictions|actuals)_', '', name)
+
+# Parovi (predictions_key, actuals_key). Fajlovi bez para po id-u se uparuju sa
+# prvim neuparenim actuals fajlom upisanim najviše pair_window sekundi kasnije.
+def pair_runs(predictions, actuals, pair_window):
+    actuals_by_id = {run_id_for(obj['Key']): obj for obj in actuals}
+    pairs = []
+    unpaired = []
+    for obj in predictions:
+        actual = actuals_by_id.pop(run_id_for(obj['Key']), None)
+        if actual is not None:
+            pairs.append((obj['Key'], actual['Key']))
+        else:
+            unpaired.append(obj)
+
+    remaining = sorted(actuals_by_id.values(), key=lambda obj: obj['LastModified'])
+    for obj in sorted(unpaired, key=lambda obj: obj['LastModified']):
+        for i, actual in enumerate(remaining):
+            delay = (actual['LastModified'] - obj['LastModified']).total_seconds()
+            if 0 <= delay <= pair_window:
+                pairs.append((obj['Key'], actual['Key']))
+                del remaining[i]
+                break
+    return pairs
+
+def read_object(s3_client, bucket_name, file_key):
+    body = s3_client.get_object(Bucket=bucket_name, Key=file_key)['Body'].read()
+    if file_key.endswith('.parquet'):
+        return pd.read_parquet(io.BytesIO(body))
+    return pd.read_csv(io.BytesIO(body), compression=compression_for(file_key))
+
+# Dugačka tabela (run, date, predicted, actual) za sve runove
+def load_runs(s3_client, bucket_name, pairs, batch_keys, max_workers):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pair_frames = list(executor.map(
+            lambda pair: (read_object(s3_client, bucket_name, pair[0]), read_object(s3_client, bucket_name, pair[1])),
+            pairs
+        ))
+        batch_frames = list(executor.map(lambda key: read_object(s3_client, bucket_name, key), batch_keys))
+
+    predicted, actual = [], []
+    for (predictions_key, _), (predictions_df, actuals_df) in zip(pairs, pair_frames):
+        predicted.append(predictions_df[['date', 'close']].rename(columns={'close': 'predicted'}).assign(run=predictions_key))
+        actual.append(actuals_df[['date', 'close']].rename(columns={'close': 'actual'}).assign(run=predictions_key))
+
+    joined = [join_on_date(pd.concat(predicted, ignore_index=True), pd.concat(actual, ignore_index=True))] if pairs else []
+
+    for batch_key, frame in zip(batch_keys, batch_frames):
+        models = [column for column in frame.columns if column not in BATCH_FIXED_COLUMNS]
+        long = frame.melt(id_vars=BATCH_FIXED_COLUMNS, value_vars=models, var_name='model', value_name='predicted')
+        long['run'] = batch_key + '#' + long['dataset'].astype(str) + '#' + long['model']
+        long['date'] = pd.to_datetime(long['date'])
+        joined.append(long[['run', 'date', 'predicted', 'actual']])
+
+    if not joined:
+        return pd.DataFrame(columns=['run', 'date', 'predicted', 'actual'])
+    return pd.concat(joined, ignore_index=True)
+
+# Spajanje po (run, date). date je pun timestamp bara, ali skupovi zapisani pre
+# kolone 't' imaju samo datum, pa unutardnevni podaci imaju više redova istog
+# datuma; zato se uz datum spaja i redni broj pojavljivanja tog datuma u runu.
+def join_on_date(predicted, actual):
+    for frame in (predicted, actual):
+        frame['date'] = pd.to_datetime(frame['date'])
+        frame['occurrence'] = frame.groupby(['run', 'date']).cumcount()
+    joined = predicted.merge(actual, on=['run', 'date', 'occurrence'], how='outer')
+    return joined.drop(columns='occurrence')
+
+SUMMARY_COLUMNS = [
+    'run', 'rows', 'unmatched_predictions', 'unmatched_actuals', 'mse', 'rmse', 'mae', 'mape', 'r2', 'directional_accuracy'
+]
+
+# Metrike za sve runove u jednom prolazu (bincount po kodu runa). Bez runova
+# (prazan bucket ili prefiks) tabela je prazna.
+def summarize(runs):
+    if runs.empty:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+    runs = runs.sort_values(['run', 'date'], kind='stable', ignore_index=True)
+    codes, names = pd.factorize(runs['run'], sort=True)
+    count = len(names)
+
+    matched = runs['predicted'].notna().to_numpy() & runs['actual'].notna().to_numpy()
+    predicted = runs['predicted'].to_numpy(dtype=np.float64)
+    actual = runs['actual'].to_numpy(dtype=np.float64)
+
+    # Prethodna stvarna vrednost u istom runu, za tačnost smera
+    previous = np.roll(actual, 1)
+    previous[np.r_[True, codes[1:] != codes[:-1]]] = np.nan
+    directional = matched & ~np.isnan(previous)
+
+    m_codes = codes[matched]
+    errors = predicted[matched] - actual[matched]
+    matched_actual = actual[matched]
+    rows = np.bincount(m_codes, minlength=count)
+    sse = np.bincount(m_codes, errors ** 2, minlength=count)
+    actual_sum = np.bincount(m_codes, matched_actual, minlength=count)
+    total = np.bincount(m_codes, matched_actual ** 2, minlength=count) - actual_sum ** 2 / np.maximum(rows, 1)
+    hits = np.sign(predicted[directional] - previous[directional]) == np.sign(actual[directional] - previous[directional])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary = pd.DataFrame({
+            'run': names,
+            'rows': rows,
+            'unmatched_predictions': np.bincount(codes[~np.isnan(predicted) & np.isnan(actual)], minlength=count),
+            'unmatched_actuals': np.bincount(codes[np.isnan(predicted) & ~np.isnan(actual)], minlength=count),
+            'mse': sse / rows,
+            'rmse': np.sqrt(sse / rows),
+            'mae': np.bincount(m_codes, np.abs(errors), minlength=count) / rows,
+            'mape': np.bincount(m_codes, np.abs(errors / matched_actual), minlength=count) / rows * 100,
+            'r2': np.where(total > 0, 1 - sse / total, np.nan),
+            'directional_accuracy': np.bincount(codes[directional], hits, minlength=count) / np.bincount(codes[directional], minlength=count),
+        }, columns=SUMMARY_COLUMNS)
+    return summary.sort_values('rmse', ignore_index=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--max-workers', type=int, default=32)
+    parser.add_argument('--pair-window', type=float, default=60, help='najveći razmak (s) za uparivanje fajlova bez zajedničkog id-a')
+    parser.add_argument('--no-batch', action='store_true', help='preskoči predictions/batch/ rezultate')
+    parser.add_argument('--output', help='CSV fajl za zbirnu tabelu')
+    parser.add_argument('--local-s3', help='direktorijum lokalne zamene za S3 (benchmarks/local_s3.py)')
+    args = parser.parse_args()
+
+    if args.local_s3:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+        from local_s3 import LocalS3
+        s3_client = LocalS3(args.local_s3)
+    else:
+        s3_client = boto3.client('s3')
+
+    predictions = [obj for obj in list_objects(s3_client, args.bucket, PREDICTIONS_PREFIX) if not obj['Key'].startswith(BATCH_PREFIX)]
+    actuals = list_objects(s3_client, args.bucket, ACTUALS_PREFIX)
+    batch_keys = [] if args.no_batch else [
+        obj['Key'] for obj in list_objects(s3_client, args.bucket, BATCH_PREFIX) if obj['Key'].endswith('.parquet')
+    ]
+    pairs = pair_runs(predictions, actuals, args.pair_window)
+    print(f"{len(pairs)} parova predikcija/stvarnih vrednosti, {len(predictions) - len(pairs)} predikcija bez para, {len(batch_keys)} batch fajlova")
+
+    summary = summarize(load_runs(s3_client, args.bucket, pairs, batch_keys, args.max_workers))
+    with pd.option_context('display.max_rows', 200, 'display.width', 200):
+        print(summary.to_string(index=False))
+    if args.output:
+        summary.to_csv(args.output, index=False)
+
+if __name__ == '__main__':
+    main()
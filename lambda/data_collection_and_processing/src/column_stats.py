@@ -0,0 +1,47 @@
+import numpy as np
+
+# Per-column statistics of a processed dataset, gathered while it is written:
+# min, max, and Welford's count, mean and m2 (sum of squared deviations from
+# the mean). Each written chunk is summarized with numpy and merged into the
+# running totals with the pairwise form of Welford's update (Chan et al.), so
+# one pass over the chunks gives the mean and variance of all rows without
+# keeping them. Trainers scale features with mean and sqrt(m2 / count).
+#
+#   {"close": {"min": 209.8, "max": 229.0, "count": 21, "mean": 219.3, "m2": 401.7}, ...}
+
+
+def chunk_stats(chunk, columns):
+    values = chunk[columns].to_numpy(dtype=np.float64)
+    mean = values.mean(axis=0)
+    m2 = np.square(values - mean).sum(axis=0)
+    minimum = values.min(axis=0)
+    maximum = values.max(axis=0)
+    return {
+        column: {
+            'min': float(minimum[index]),
+            'max': float(maximum[index]),
+            'count': len(values),
+            'mean': float(mean[index]),
+            'm2': float(m2[index]),
+        }
+        for index, column in enumerate(columns)
+    }
+
+
+def merge_column(total, chunk):
+    count = total['count'] + chunk['count']
+    delta = chunk['mean'] - total['mean']
+    return {
+        'min': min(total['min'], chunk['min']),
+        'max': max(total['max'], chunk['max']),
+        'count': count,
+        'mean': total['mean'] + delta * chunk['count'] / count,
+        'm2': total['m2'] + chunk['m2'] + delta * delta * total['count'] * chunk['count'] / count,
+    }
+
+
+def merge_stats(total, chunk):
+    merged = dict(total)
+    for column, values in chunk.items():
+        merged[column] = merge_column(merged[column], values) if column in merged else values
+    return merged
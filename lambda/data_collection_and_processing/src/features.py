@@ -0,0 +1,178 @@
+# Feature set of a processed dataset, taken from the request body ('features').
+# Each indicator lists the windows (or parameter tuples) to compute; all of them
+# come from one pass over the bars in indicators.compute_features.
+#
+#   {"sma": [5, 14, 50], "ema": [12, 26], "rsi": [14], "volatility": [14, 30],
+#    "macd": [[12, 26, 9]], "bollinger": [[20, 2]], "atr": [14], "obv": true,
+#    "vwap": [20], "stochastic": [[14, 3]]}
+#
+# The given set replaces the default. Columns are named <indicator>_<params>,
+# except RSI and volatility over 14 bars, which keep the names the original
+# fixed feature set used ('rsi', 'volatility').
+#
+# No numpy here, so the request can be validated before the heavy imports.
+
+DEFAULT_FEATURES = {'sma': [14], 'ema': [14], 'rsi': [14], 'volatility': [14]}
+
+# Indicator -> number of parameters per entry (0 for an on/off flag). The order
+# is also the column order of the processed dataset.
+FEATURE_PARAMETERS = {
+    'sma': 1,
+    'ema': 1,
+    'rsi': 1,
+    'volatility': 1,
+    'macd': 3,
+    'bollinger': 2,
+    'atr': 1,
+    'obv': 0,
+    'vwap': 1,
+    'stochastic': 2,
+}
+
+LEGACY_NAMES = {('rsi', 14): 'rsi', ('volatility', 14): 'volatility'}
+
+# Every window's warm-up rows are dropped from the dataset and kept as history
+# in the manifest, so windows stay well below a typical request range
+MAX_WINDOW = 1000
+
+# Bar start as Polygon's epoch milliseconds (UTC), so intraday bars keep their
+# own timestamps instead of sharing a date
+TIME_COLUMN = 't'
+
+BASE_COLUMNS = [TIME_COLUMN, 'open', 'high', 'low', 'close', 'volume']
+
+
+def _window(value, name):
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= MAX_WINDOW:
+        raise ValueError(f'{name}: window must be an integer between 1 and {MAX_WINDOW}, got {value!r}')
+    return value
+
+
+def _entry(kind, value):
+    if kind == 'bollinger':
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            raise ValueError(f'bollinger: expected [window, num_std], got {value!r}')
+        window, num_std = value
+        if isinstance(num_std, bool) or not isinstance(num_std, (int, float)) or num_std <= 0:
+            raise ValueError(f'bollinger: num_std must be a positive number, got {num_std!r}')
+        if _window(window, kind) < 2:
+            raise ValueError(f'bollinger: window must be at least 2, got {value!r}')
+        return [window, float(num_std)]
+
+    count = FEATURE_PARAMETERS[kind]
+    if count == 1:
+        # Single windows may also be given without the list, e.g. "sma": [5, 14]
+        if isinstance(value, (list, tuple)) and len(value) == 1:
+            value = value[0]
+        # A standard deviation needs at least two bars
+        if kind == 'volatility' and _window(value, kind) < 2:
+            raise ValueError(f'volatility: window must be at least 2, got {value!r}')
+        return _window(value, kind)
+
+    if not isinstance(value, (list, tuple)) or len(value) != count:
+        raise ValueError(f'{kind}: expected {count} windows, got {value!r}')
+    entry = [_window(item, kind) for item in value]
+    if kind == 'macd' and entry[0] >= entry[1]:
+        raise ValueError(f'macd: fast window must be shorter than the slow one, got {value!r}')
+    if kind == 'stochastic' and entry[0] < 2:
+        raise ValueError(f'stochastic: window must be at least 2, got {value!r}')
+    return entry
+
+
+# Canonical form of a feature set: known indicators only, entries validated,
+# de-duplicated and sorted, so equal sets compare equal (also after a JSON
+# round trip through the manifest). Raises ValueError on anything else.
+def normalize_features(features=None):
+    if features is None:
+        features = DEFAULT_FEATURES
+    if not isinstance(features, dict) or not features:
+        raise ValueError('features must be a non-empty object, e.g. {"sma": [5, 14]}')
+
+    unknown = [kind for kind in features if kind not in FEATURE_PARAMETERS]
+    if unknown:
+        raise ValueError(f'Unknown indicators: {", ".join(unknown)}. Supported: {", ".join(FEATURE_PARAMETERS)}')
+
+    normalized = {}
+    for kind in FEATURE_PARAMETERS:
+        if kind not in features:
+            continue
+        value = features[kind]
+        if FEATURE_PARAMETERS[kind] == 0:
+            if not isinstance(value, bool):
+                raise ValueError(f'{kind}: expected true or false, got {value!r}')
+            if value:
+                normalized[kind] = True
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = [value]
+        if not isinstance(value, (list, tuple)) or not value:
+            raise ValueError(f'{kind}: expected a non-empty list, got {value!r}')
+        entries = []
+        for item in value:
+            entry = _entry(kind, item)
+            if entry not in entries:
+                entries.append(entry)
+        normalized[kind] = sorted(entries)
+
+    if not normalized:
+        raise ValueError('features must enable at least one indicator')
+    return normalized
+
+
+def _suffix(entry):
+    values = entry if isinstance(entry, list) else [entry]
+    return '_'.join(f'{value:g}' for value in values)
+
+
+def column_name(kind, entry, part=None):
+    if part is None and not isinstance(entry, list) and (kind, entry) in LEGACY_NAMES:
+        return LEGACY_NAMES[(kind, entry)]
+    prefix = kind if part is None else f'{kind}_{part}'
+    return f'{prefix}_{_suffix(entry)}'
+
+
+# Output columns of each indicator entry, in dataset order
+def entry_columns(kind, entry):
+    if kind == 'macd':
+        return [column_name(kind, entry), column_name(kind, entry, 'signal'), column_name(kind, entry, 'hist')]
+    if kind == 'bollinger':
+        return [column_name(kind, entry, 'upper'), column_name(kind, entry, 'lower')]
+    if kind == 'stochastic':
+        return [column_name('stoch', entry, 'k'), column_name('stoch', entry, 'd')]
+    return [column_name(kind, entry)]
+
+
+def feature_columns(features):
+    columns = []
+    for kind, entries in features.items():
+        if kind == 'obv':
+            columns.append('obv')
+            continue
+        for entry in entries:
+            columns.extend(entry_columns(kind, entry))
+    return columns
+
+
+def processed_columns(features):
+    return BASE_COLUMNS + feature_columns(features)
+
+
+# Stored dtypes: the time as int64, everything else as float32. Indicators are
+# computed in float64 and only rounded for storage; float32 keeps about seven
+# significant digits, finer than prices are quoted or predicted. Volume is a
+# float too, because Polygon reports fractional share volumes and busy daily
+# bars would overflow a 32-bit integer.
+def processed_dtypes(features):
+    return {column: 'int64' if column == TIME_COLUMN else 'float32' for column in processed_columns(features)}
+
+
+# Bars before the first new row that every windowed feature of the first new
+# row depends on; incremental and streamed ingestion keep this much history
+def lookback(features):
+    rows = [1]
+    for kind, entries in features.items():
+        if kind in ('sma', 'volatility', 'bollinger', 'vwap', 'rsi', 'atr'):
+            rows.extend(entry[0] if isinstance(entry, list) else entry for entry in entries)
+        elif kind == 'stochastic':
+            rows.extend(window + smoothing for window, smoothing in entries)
+    return max(rows)
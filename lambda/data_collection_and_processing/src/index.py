@@ -1,131 +1,739 @@
 import os
 import json
-import csv
+import random
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 import boto3
-import pandas as pd
-from io import StringIO
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import uuid
+from s3_stream import S3CompressedWriter, CODECS
+import manifest
+import metrics
+import features
 
+POLYGON_API_URL = os.getenv('POLYGON_API_URL', 'https://api.polygon.io')
+# Broj simbola koji se istovremeno preuzimaju i obrađuju
+MAX_CONCURRENCY = int(os.getenv('POLYGON_MAX_CONCURRENCY', '8'))
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+# pandas, pyarrow i numpy (indicators) se uvoze tek u funkcijama koje ih
+# koriste, pa hladan start zahteva koji padne već na Polygon pozivu ne plaća
+# njihovo učitavanje. Klijenti se prave jednom po instanci.
 s3 = boto3.client('s3')
 
-def calculate_sma(data, window):
-    return data['close'].rolling(window=window).mean()
+# One pooled session per container keeps TLS connections to Polygon warm
+http = requests.Session()
+http.mount(POLYGON_API_URL, HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENCY))
 
-def calculate_ema(data, window):
-    return data['close'].ewm(span=window, adjust=False).mean()
+# A 429 on any worker pauses all of them, since they share one API key
+rate_limit_lock = threading.Lock()
+rate_limited_until = 0.0
 
-def calculate_rsi(data, window):
-    delta = data['close'].diff(1)
-    gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs))
+# Format processed skupa: (ekstenzija, content type)
+OUTPUT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
 
-def calculate_volatility(data, window):
-    return data['close'].rolling(window=window).std()
+# file: jedan processed fajl po opsegu; partitioned: fajl po particiji
+# simbol/timespan/datum, indeksiran u manifestu (vidi manifest.py)
+LAYOUTS = ('file', 'partitioned')
 
-def handler(event, context):
-    polygon_api_key = os.getenv('POLYGON_API_KEY')
-    s3_bucket = os.getenv('S3_BUCKET')
+# Processed CSV is encoded in slices so a large frame never becomes one big string
+CSV_CHUNK_ROWS = 100000
 
-    body = json.loads(event['body'])
-    
-    data_set = body.get('data_set', 'training')
-    multiplier = body.get('multiplier', 1)
-    timespan = body.get('timespan', 'day')
-    from_date = body.get('from', '2024-08-01')
-    to_date = body.get('to', '2024-08-31')
-    stock_symbol = body.get('stock_symbol', 'AAPL')
+def wait_for_rate_limit():
+    with rate_limit_lock:
+        delay = rate_limited_until - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
 
-    polygon_url = f"https://api.polygon.io/v2/aggs/ticker/{stock_symbol}/range/{multiplier}/{timespan}/{from_date}/{to_date}?adjusted=true&apiKey={polygon_api_key}"
+def backoff_delay(response, attempt):
+    retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    return min(BACKOFF_BASE_SECONDS * 2 ** attempt, BACKOFF_MAX_SECONDS) * random.uniform(0.5, 1.0)
 
-    response = requests.get(polygon_url)
-    if response.status_code != 200:
+def aggregates_url(polygon_api_key, stock_symbol, multiplier, timespan, from_date, to_date, limit=None):
+    polygon_url = f"{POLYGON_API_URL}/v2/aggs/ticker/{stock_symbol}/range/{multiplier}/{timespan}/{from_date}/{to_date}?adjusted=true&apiKey={polygon_api_key}"
+    if limit:
+        polygon_url += f"&limit={limit}"
+    return polygon_url
+
+# Polygon's next_url does not carry the API key
+def next_page_url(data, polygon_api_key):
+    next_url = data.get('next_url')
+    if not next_url:
+        return None
+    separator = '&' if '?' in next_url else '?'
+    return f"{next_url}{separator}apiKey={polygon_api_key}"
+
+def fetch_aggregates(polygon_url):
+    global rate_limited_until
+
+    with metrics.stage('fetch') as stage:
+        for attempt in range(MAX_RETRIES + 1):
+            wait_for_rate_limit()
+            response = http.get(polygon_url, timeout=30)
+            if response.status_code != 429 or attempt == MAX_RETRIES:
+                stage.bytes = len(response.content)
+                stage.fields['status_code'] = response.status_code
+                stage.fields['attempts'] = attempt + 1
+                return response
+
+            delay = backoff_delay(response, attempt)
+            with rate_limit_lock:
+                rate_limited_until = max(rate_limited_until, time.monotonic() + delay)
+
+# orjson dekodira velike Polygon odgovore višestruko brže od json modula; bez
+# njega se koristi json
+def decode_json(response):
+    with metrics.stage('decode_json') as stage:
+        stage.bytes = len(response.content)
+        try:
+            import orjson
+        except ImportError:
+            return response.json()
+        return orjson.loads(response.content)
+
+# Barovi stranice kao DataFrame i sažetak kvaliteta podataka (vidi bars.py).
+# last_t je vreme poslednjeg bara prethodne stranice iste serije.
+def parse_results(data, timespan='day', multiplier=1, last_t=None):
+    import pandas as pd
+    from bars import parse_bars
+
+    with metrics.stage('parse') as stage:
+        columns, quality = parse_bars(data.get('results') or [], timespan, multiplier, last_t)
+        df = pd.DataFrame(columns, columns=features.BASE_COLUMNS, copy=False)
+        stage.fields['rows'] = len(df)
+        stage.fields['dropped'] = quality['dropped']
+    return df, quality
+
+# Feature kolone iz request['features'] (vidi features.py); redovi na početku
+# serije kojima nedostaje istorija za neki prozor se odbacuju. Indikatori se
+# računaju u float64, a čuvaju u kompaktnim tipovima (features.processed_dtypes).
+# state continues the indicators from the previous page of the same series
+def add_indicators(df, feature_set, state=None):
+    from indicators import compute_features
+
+    with metrics.stage('indicators', rows=len(df)) as stage:
+        columns, state = compute_features(df, feature_set, state)
+        stage.fields['features'] = len(columns)
+    for column, values in columns.items():
+        df[column] = values
+
+    dtypes = features.processed_dtypes(feature_set)
+    return df.dropna(subset=list(columns))[list(dtypes)].astype(dtypes), state
+
+def empty_processed_frame(dtypes):
+    import pandas as pd
+
+    return pd.DataFrame(columns=list(dtypes)).astype(dtypes)
+
+def write_processed_chunk(writer, df, output_format, compression, parquet_writer, schema):
+    with metrics.stage('write_processed', format=output_format, rows=len(df)) as stage:
+        start = writer.tell()
+        parquet_writer, schema = encode_processed_chunk(writer, df, output_format, compression, parquet_writer, schema)
+        stage.bytes = writer.tell() - start
+    return parquet_writer, schema
+
+def encode_processed_chunk(writer, processed, output_format, compression, parquet_writer, schema):
+    if output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(processed, preserve_index=False)
+        if parquet_writer is None:
+            schema = table.schema
+            parquet_writer = pq.ParquetWriter(writer, schema, compression=compression)
+        # Pages may disagree on inferred types (e.g. integer vs float volume)
+        parquet_writer.write_table(table.cast(schema))
+    else:
+        for start in range(0, max(len(processed), 1), CSV_CHUNK_ROWS):
+            chunk = processed.iloc[start:start + CSV_CHUNK_ROWS]
+            writer.write(chunk.to_csv(header=writer.tell() == 0, index=False).encode('utf-8'))
+
+    return parquet_writer, schema
+
+# Raw odgovor se čuva bajt po bajt kako je stigao, bez ponovnog kodiranja.
+# JSON lines (stream mod) zahteva jednu liniju po stranici, pa se odgovor sa
+# prelomima redova ponovo kodira.
+def write_raw(writer, content, data, lines=False):
+    with metrics.stage('write_raw') as stage:
+        start = writer.tell()
+        if lines and b'\n' in content:
+            content = json.dumps(data).encode('utf-8')
+        writer.write(content)
+        if lines:
+            writer.write(b'\n')
+        stage.bytes = writer.tell() - start
+
+# Processed skup u jednom fajlu, sa statistikama kolona (column_stats.py) i
+# prvim i poslednjim vremenom bara. Parquet writer i šema se čuvaju između
+# stranica, a prazan skup i dalje daje validan fajl sa zaglavljem/šemom. Uz
+# stats_key statistike se upisuju pre zatvaranja fajla, pa postoje kad upload
+# fajla pokrene treniranje; uz njih stoje skup kome fajl pripada (dataset:
+# simbol, multiplier, timespan) i opseg datuma, po čemu training Lambda zajedno
+# trenira samo fajlove istog skupa.
+class ProcessedFile:
+    def __init__(self, writer, output_format, compression, dtypes, bucket=None, stats_key=None, dataset=None):
+        self.writer = writer
+        self.output_format = output_format
+        self.compression = compression
+        self.dtypes = dtypes
+        self.bucket = bucket
+        self.stats_key = stats_key
+        self.dataset = dataset or {}
+        self.parquet_writer = None
+        self.schema = None
+        self.rows = 0
+        self.stats = {}
+        self.times = None
+
+    @property
+    def key(self):
+        return self.writer.key
+
+    @property
+    def uncompressed_size(self):
+        return self.writer.uncompressed_size
+
+    @property
+    def compressed_size(self):
+        return self.writer.compressed_size
+
+    def write(self, df):
+        if len(df) == 0:
+            return
+        from column_stats import chunk_stats, merge_stats
+
+        self.parquet_writer, self.schema = write_processed_chunk(
+            self.writer, df, self.output_format, self.compression, self.parquet_writer, self.schema
+        )
+        self.rows += len(df)
+        self.stats = merge_stats(self.stats, chunk_stats(df, [column for column in df.columns if column != features.TIME_COLUMN]))
+        times = (int(df[features.TIME_COLUMN].min()), int(df[features.TIME_COLUMN].max()))
+        self.times = times if self.times is None else (min(self.times[0], times[0]), max(self.times[1], times[1]))
+
+    # Unos za manifest: prvi i poslednji datum (UTC) i vreme bara; prazan fajl nema opseg
+    def time_range(self):
+        if self.times is None:
+            return {}
         return {
-            'statusCode': response.status_code,
-            'body': json.dumps('Greška prilikom preuzimanja podataka.')
+            'min_date': manifest.utc_date(self.times[0]),
+            'max_date': manifest.utc_date(self.times[1]),
+            'min_t': self.times[0],
+            'max_t': self.times[1],
         }
 
-    data = response.json()
-
-    cleaned_data = []
-    for result in data.get('results', []):
-        if 'c' in result and 'h' in result and 'l' in result and 'o' in result and 't' in result and 'v' in result:
-            timestamp = result['t']
-            result['date'] = datetime.utcfromtimestamp(timestamp / 1000.0).strftime('%Y-%m-%d')
-            cleaned_data.append({
-                'open': result['o'],  # Open
-                'high': result['h'],  # High
-                'low': result['l'],   # Low
-                'close': result['c'],  # Close
-                'volume': result['v'],  # Volume
-                'date': result['date']  # Date
-            })
-
-    df = pd.DataFrame(cleaned_data)
-    df.columns = ['open', 'high', 'low', 'close', 'volume', 'date']
-
-    df['sma_14'] = calculate_sma(df, 14)
-    df['ema_14'] = calculate_ema(df, 14)
-    df['rsi'] = calculate_rsi(df, 14)
-    df['volatility'] = calculate_volatility(df, 14)
-
-    df = df.dropna(subset=['sma_14', 'ema_14', 'rsi', 'volatility'])
-
-    original_file_name = f'{data_set}/raw/stock_data_{stock_symbol}_{datetime.utcnow().strftime("%Y-%m-%d")}_{uuid.uuid4()}.json'
-    s3.put_object(
-        Bucket=s3_bucket,
-        Key=original_file_name,
-        Body=json.dumps(data),
-        ContentType='application/json'
+    def close(self):
+        if self.rows == 0:
+            self.parquet_writer, self.schema = write_processed_chunk(
+                self.writer, empty_processed_frame(self.dtypes), self.output_format, self.compression, self.parquet_writer, self.schema
+            )
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if self.stats_key:
+            s3.put_object(
+                Bucket=self.bucket,
+                Key=self.stats_key,
+                Body=json.dumps({
+                    'processed_file': self.key,
+                    **self.dataset,
+                    'time_column': features.TIME_COLUMN,
+                    'rows': self.rows,
+                    **self.time_range(),
+                    'stats': self.stats,
+                }),
+                ContentType='application/json'
+            )
+        self.writer.close()
+
+    def abort(self):
+        self.writer.abort()
+
+# Particionisani processed skup (layout=partitioned): svaka particija simbola,
+# timespan-a i datuma je poseban fajl pod
+# {data_set}/partitions/symbol=.../timespan=.../date=.../. Redovi stižu
+# hronološki, pa je u svakom trenutku otvorena samo jedna particija. Za svaku
+# zatvorenu particiju pamti se unos za manifest: broj redova, prvi i poslednji
+# datum (UTC, iz kolone t) i statistike svake kolone (min/max, mean, m2).
+class PartitionedDataset:
+    def __init__(self, request, stock_symbol, timespan):
+        self.request = request
+        self.timespan = timespan
+        self.key = manifest.partition_prefix(request['data_set'], stock_symbol, request['multiplier'], timespan)
+        self.current = None
+        self.label = None
+        self.partitions = []
+
+    @property
+    def uncompressed_size(self):
+        return sum(partition['size'] for partition in self.partitions)
+
+    @property
+    def compressed_size(self):
+        return sum(partition['compressed_size'] for partition in self.partitions)
+
+    def write(self, df):
+        if len(df) == 0:
+            return
+        labels = manifest.partition_labels(df[features.TIME_COLUMN], self.timespan)
+        bounds = [0, *((labels[1:] != labels[:-1]).nonzero()[0] + 1), len(df)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if labels[start] != self.label:
+                self.finish_partition()
+                self.open_partition(labels[start])
+            self.current.write(df.iloc[start:end])
+
+    def open_partition(self, label):
+        output_format = self.request['output_format']
+        extension, content_type = OUTPUT_FORMATS[output_format]
+        codec = 'none' if output_format == 'parquet' else self.request['codec']
+        writer = S3CompressedWriter(
+            s3, self.request['s3_bucket'], f'{self.key}date={label}/part-{uuid.uuid4()}.{extension}',
+            content_type, codec, self.request['codec_level']
+        )
+        self.current = ProcessedFile(
+            writer, output_format, self.request['compression'], features.processed_dtypes(self.request['features'])
+        )
+        self.label = label
+
+    def finish_partition(self):
+        if self.current is None:
+            return
+        self.current.close()
+        self.partitions.append({
+            'key': self.current.key,
+            'partition': self.label,
+            'rows': self.current.rows,
+            **self.current.time_range(),
+            'size': self.current.uncompressed_size,
+            'compressed_size': self.current.compressed_size,
+            'stats': self.current.stats,
+        })
+        self.current = None
+        self.label = None
+
+    def close(self):
+        self.finish_partition()
+
+    # Već zatvorene particije nisu u manifestu, pa se brišu
+    def abort(self):
+        if self.current is not None:
+            self.current.abort()
+            self.current = None
+        delete_partitions(self.request, self.partitions)
+        self.partitions = []
+
+def delete_partitions(request, partitions):
+    for partition in partitions:
+        s3.delete_object(Bucket=request['s3_bucket'], Key=partition['key'])
+
+# Zatvaranje upisa šalje poslednje delove multipart upload-a u S3
+def close_artifacts(raw_writer, processed_writer):
+    with metrics.stage('upload') as stage:
+        raw_writer.close()
+        processed_writer.close()
+        stage.bytes = raw_writer.compressed_size + processed_writer.compressed_size
+
+# Raw i processed fajl se pišu kroz kompresiju direktno u S3. Parquet je već
+# kompresovan iznutra, pa se ne pakuje dodatno.
+def open_artifacts(request, stock_symbol, timespan, raw_extension, raw_content_type):
+    s3_bucket = request['s3_bucket']
+    data_set = request['data_set']
+    extension, content_type = OUTPUT_FORMATS[request['output_format']]
+    processed_codec = 'none' if request['output_format'] == 'parquet' else request['codec']
+
+    original_file_name = f'{data_set}/raw/stock_data_{stock_symbol}_{datetime.utcnow().strftime("%Y-%m-%d")}_{uuid.uuid4()}.{raw_extension}'
+    raw_writer = S3CompressedWriter(
+        s3, s3_bucket, original_file_name, raw_content_type, request['codec'], request['codec_level']
     )
+    if request['layout'] == 'partitioned':
+        return raw_writer, PartitionedDataset(request, stock_symbol, timespan)
 
-    csv_buffer = StringIO()
-    csv_writer = csv.writer(csv_buffer)
-
-    csv_writer.writerow(['date', 'open', 'high', 'low', 'close', 'volume', 'sma_14', 'ema_14', 'rsi', 'volatility'])
-
-    for index, result in df.iterrows():
-        csv_writer.writerow([
-            result.get('date'),
-            result.get('open'),  # Open
-            result.get('high'),  # High
-            result.get('low'),  # Low
-            result.get('close'),  # Close
-            result.get('volume'),  # Volume
-            result.get('sma_14'),
-            result.get('ema_14'),
-            result.get('rsi'),
-            result.get('volatility')
-        ])
-
-    processed_file_name = f'{data_set}/processed/stock_data_{stock_symbol}_{datetime.utcnow().strftime("%Y-%m-%d")}_{uuid.uuid4()}.csv'
-    s3.put_object(
-        Bucket=s3_bucket,
-        Key=processed_file_name,
-        Body=csv_buffer.getvalue(),
-        ContentType='text/csv'
+    processed_file_name = f'{data_set}/processed/stock_data_{stock_symbol}_{datetime.utcnow().strftime("%Y-%m-%d")}_{uuid.uuid4()}.{extension}'
+    processed_writer = S3CompressedWriter(
+        s3, s3_bucket, processed_file_name, content_type, processed_codec, request['codec_level']
     )
+    return raw_writer, ProcessedFile(
+        processed_writer, request['output_format'], request['compression'], features.processed_dtypes(request['features']),
+        s3_bucket, manifest.stats_key(processed_writer.key),
+        {'stock_symbol': stock_symbol, 'multiplier': request['multiplier'], 'timespan': timespan}
+    )
+
+# Kod particionisanog rasporeda 'partitions' su unosi za manifest; process_symbol
+# i ingest_incremental ih upisuju u manifest i u odgovoru ostavljaju samo broj
+def artifacts_result(request, raw_writer, processed_writer, rows):
+    s3_bucket = request['s3_bucket']
 
     original_file_url = s3.generate_presigned_url(
         'get_object',
-        Params={'Bucket': s3_bucket, 'Key': original_file_name},
+        Params={'Bucket': s3_bucket, 'Key': raw_writer.key},
         ExpiresIn=3600
     )
 
-    processed_file_url = s3.generate_presigned_url(
+    result = {
+        'message': f'Podaci uspešno sačuvani u {request["data_set"]} skupu.',
+        'original_file_url': original_file_url,
+        'original_file_key': raw_writer.key,
+        'original_file_size': raw_writer.uncompressed_size,
+        'original_file_compressed_size': raw_writer.compressed_size,
+        'processed_file_size': processed_writer.uncompressed_size,
+        'processed_file_compressed_size': processed_writer.compressed_size,
+        'rows': rows,
+        'feature_columns': features.feature_columns(request['features'])
+    }
+
+    if isinstance(processed_writer, PartitionedDataset):
+        result['partition_prefix'] = processed_writer.key
+        result['partitions'] = processed_writer.partitions
+        return result
+
+    result['processed_file_url'] = s3.generate_presigned_url(
         'get_object',
-        Params={'Bucket': s3_bucket, 'Key': processed_file_name},
+        Params={'Bucket': s3_bucket, 'Key': processed_writer.key},
         ExpiresIn=3600
     )
+    result['processed_file_key'] = processed_writer.key
+    result['stats_key'] = processed_writer.stats_key
+    return result
+
+# Preuzimanje, obrada i čuvanje podataka za jedan simbol, timespan i opseg datuma.
+# state nastavlja indikatore od prethodno sačuvanih podataka.
+# Vraća (status code, telo odgovora, stanje indikatora na kraju opsega).
+def ingest_range(request, stock_symbol, timespan, from_date, to_date, state=None):
+    if request['stream']:
+        return stream_range(request, stock_symbol, timespan, from_date, to_date, state)
+
+    response = fetch_aggregates(aggregates_url(
+        request['polygon_api_key'], stock_symbol, request['multiplier'], timespan, from_date, to_date
+    ))
+    if response.status_code != 200:
+        return response.status_code, 'Greška prilikom preuzimanja podataka.', state
+
+    data = decode_json(response)
+    df, quality = parse_results(data, timespan, request['multiplier'])
+    df, state = add_indicators(df, request['features'], state)
+
+    raw_writer, processed_writer = open_artifacts(request, stock_symbol, timespan, 'json', 'application/json')
+    try:
+        write_raw(raw_writer, response.content, data)
+        processed_writer.write(df)
+        close_artifacts(raw_writer, processed_writer)
+    except Exception:
+        raw_writer.abort()
+        processed_writer.abort()
+        raise
+
+    result = artifacts_result(request, raw_writer, processed_writer, len(df))
+    result['data_quality'] = quality
+    # Bez stream moda preuzima se samo prva stranica rezultata
+    result['truncated'] = bool(data.get('next_url'))
+    return 200, result, state
+
+# Stream mod: prati Polygon paginaciju stranicu po stranicu i svaku stranicu odmah
+# upisuje u S3 kao multipart upload, tako da memorija ne raste sa opsegom datuma.
+# Raw podaci se čuvaju kao JSON lines, jedna Polygon stranica po liniji.
+def stream_range(request, stock_symbol, timespan, from_date, to_date, state=None):
+    from bars import empty_quality, merge_quality
+
+    raw_writer, processed_writer = open_artifacts(request, stock_symbol, timespan, 'jsonl', 'application/x-ndjson')
+
+    polygon_url = aggregates_url(
+        request['polygon_api_key'], stock_symbol, request['multiplier'], timespan,
+        from_date, to_date, request['limit']
+    )
+    pages = 0
+    rows = 0
+    quality = empty_quality()
+
+    try:
+        while polygon_url:
+            response = fetch_aggregates(polygon_url)
+            if response.status_code != 200:
+                raw_writer.abort()
+                processed_writer.abort()
+                return response.status_code, 'Greška prilikom preuzimanja podataka.', state
+
+            data = decode_json(response)
+            write_raw(raw_writer, response.content, data, lines=True)
+
+            df, page_quality = parse_results(data, timespan, request['multiplier'], quality.get('last_t'))
+            quality = merge_quality(quality, page_quality)
+            df, state = add_indicators(df, request['features'], state)
+            processed_writer.write(df)
+
+            pages += 1
+            rows += len(df)
+            polygon_url = next_page_url(data, request['polygon_api_key'])
+            del response, data, df
+
+        close_artifacts(raw_writer, processed_writer)
+    except Exception:
+        raw_writer.abort()
+        processed_writer.abort()
+        raise
+
+    result = artifacts_result(request, raw_writer, processed_writer, rows)
+    result['pages'] = pages
+    result['data_quality'] = quality
+    return 200, result, state
+
+# Svi podaci jednog manifesta imaju iste kolone; drugi feature set, ili
+# particije zapisane pre kolone t (sa YYYY-MM-DD kolonom date), bi u istom
+# skupu dale fajlove i particije sa različitim kolonama
+def schema_conflict(request, current):
+    stored = manifest.stored_features(current)
+    if stored is not None and stored != request['features']:
+        return (
+            f'Skup {request["data_set"]} već sadrži podatke sa feature set-om {json.dumps(stored)}. '
+            'Za drugi feature set koristite drugi data_set.'
+        )
+    time_column = manifest.stored_time_column(current)
+    if time_column is not None and time_column != features.TIME_COLUMN:
+        return (
+            f'Particije skupa {request["data_set"]} imaju kolonu {time_column} umesto {features.TIME_COLUMN}. '
+            'Za nove podatke koristite drugi data_set.'
+        )
+    return None
+
+# Čitanje processed fajla koji je ovaj Lambda ranije upisao; format i
+# kompresija se prepoznaju po ekstenziji ključa, jer je fajl mogao biti upisan
+# sa drugačijim zahtevom
+def read_processed_file(request, key, dtypes):
+    import io
+    import pandas as pd
+
+    body = io.BytesIO(s3.get_object(Bucket=request['s3_bucket'], Key=key)['Body'].read())
+    if key.endswith('.parquet'):
+        return pd.read_parquet(body)[list(dtypes)].astype(dtypes)
+    compression = 'gzip' if key.endswith('.gz') else 'zstd' if key.endswith('.zst') else None
+    return pd.read_csv(body, dtype=dtypes, compression=compression)[list(dtypes)]
+
+# Particija koju opseg [from_date, to_date] pokriva samo delimično (npr. godišnja
+# particija dnevnih barova, a ponovo preuzet opseg počinje u junu) prepisuje se
+# bez svojih redova iz opsega, koje donose nove particije. Bez toga bi čitaoci
+# manifesta te redove dobili dvaput. Vraća unose prepisanih particija; stare se
+# brišu zajedno sa ostalim zamenjenim particijama.
+def trim_partitions(request, current, stock_symbol, timespan, from_date, to_date):
+    partial = [
+        partition for partition in manifest.overlapping_partitions(current, from_date, to_date)
+        if not manifest.inside_range(partition, from_date, to_date)
+    ]
+    if not partial:
+        return []
+
+    low, high = manifest.range_bounds(from_date, to_date)
+    dtypes = features.processed_dtypes(request['features'])
+    dataset = PartitionedDataset(request, stock_symbol, timespan)
+    try:
+        for partition in partial:
+            df = read_processed_file(request, partition['key'], dtypes)
+            times = df[features.TIME_COLUMN]
+            dataset.write(df[(times < low) | (times > high)])
+            # Svaka stara particija daje svoj fajl, i kad dve imaju isti naziv
+            dataset.finish_partition()
+    except Exception:
+        dataset.abort()
+        raise
+    return dataset.partitions
+
+# Nove particije opsega ulaze u manifest, a particije koje one zamenjuju se
+# brišu tek pošto je sačuvan manifest koji više ne pokazuje na njih
+def save_manifest_with_partitions(request, key, current, stock_symbol, timespan, from_date, to_date, result):
+    current['features'] = request['features']
+    replaced = []
+    if isinstance(result.get('partitions'), list):
+        current['time_column'] = features.TIME_COLUMN
+        try:
+            trimmed = trim_partitions(request, current, stock_symbol, timespan, from_date, to_date)
+        except Exception:
+            delete_partitions(request, result['partitions'])
+            raise
+        replaced = manifest.add_partitions(current, from_date, to_date, result['partitions'] + trimmed)
+        result['partitions'] = len(result['partitions'])
+        result['replaced_partitions'] = len(replaced)
+        result['rewritten_partitions'] = len(trimmed)
+
+    with metrics.stage('manifest_save'):
+        manifest.save_manifest(s3, request['s3_bucket'], key, current)
+    delete_partitions(request, replaced)
+
+# Inkrementalni mod: preuzimaju se samo opsezi koji nisu u manifestu, a indikatori
+# novih redova nastavljaju se od stanja sačuvanog na kraju prethodnog opsega.
+# Opseg se završava najkasnije juče, jer današnji barovi još nisu kompletni.
+# Opsezi se uvek preuzimaju u stream modu, kroz sve stranice: opseg upisan u
+# manifest se više ne preuzima, pa ne sme biti skraćen na prvu stranicu.
+def ingest_incremental(request, stock_symbol, timespan):
+    request = {**request, 'stream': True}
+    s3_bucket = request['s3_bucket']
+    data_set = request['data_set']
+    multiplier = request['multiplier']
+
+    key = manifest.manifest_key(data_set, stock_symbol, multiplier, timespan)
+    with metrics.stage('manifest_load'):
+        current = manifest.load_manifest(s3, s3_bucket, key, stock_symbol, multiplier, timespan)
+    conflict = schema_conflict(request, current)
+    if conflict:
+        return 400, conflict
+
+    yesterday = (datetime.utcnow().date() - timedelta(days=1)).isoformat()
+    to_date = min(request['to_date'], yesterday)
+    gaps = manifest.missing_ranges(current['ranges'], request['from_date'], to_date)
+
+    fetched = []
+    for gap_from, gap_to in gaps:
+        seed = manifest.state_before(current, gap_from)
+        status_code, result, state = ingest_range(request, stock_symbol, timespan, gap_from, gap_to, seed)
+        if status_code != 200:
+            return status_code, {'message': result, 'ranges': fetched}
+
+        manifest.add_range(current, gap_from, gap_to, result, state)
+        save_manifest_with_partitions(request, key, current, stock_symbol, timespan, gap_from, gap_to, result)
+        fetched.append({'from': gap_from, 'to': gap_to, 'warm_start': seed is not None, **result})
+
+    if not fetched:
+        message = f'Podaci su već ažurni u {data_set} skupu.'
+    else:
+        message = f'Podaci uspešno sačuvani u {data_set} skupu.'
+
+    return 200, {
+        'message': message,
+        'manifest_key': key,
+        'ranges': fetched,
+        'rows': sum(item['rows'] for item in fetched)
+    }
+
+# Preuzimanje, obrada i čuvanje podataka za jedan simbol i timespan.
+# Vraća (status code, telo odgovora).
+def process_symbol(request, stock_symbol, timespan):
+    if request['incremental']:
+        return ingest_incremental(request, stock_symbol, timespan)
+
+    if request['layout'] != 'partitioned':
+        status_code, result, _ = ingest_range(
+            request, stock_symbol, timespan, request['from_date'], request['to_date']
+        )
+        return status_code, result
+
+    key = manifest.manifest_key(request['data_set'], stock_symbol, request['multiplier'], timespan)
+    with metrics.stage('manifest_load'):
+        current = manifest.load_manifest(s3, request['s3_bucket'], key, stock_symbol, request['multiplier'], timespan)
+    conflict = schema_conflict(request, current)
+    if conflict:
+        return 400, conflict
+
+    status_code, result, _ = ingest_range(
+        request, stock_symbol, timespan, request['from_date'], request['to_date']
+    )
+    if status_code == 200:
+        save_manifest_with_partitions(
+            request, key, current, stock_symbol, timespan, request['from_date'], request['to_date'], result
+        )
+        result['manifest_key'] = key
+    return status_code, result
+
+def process_batch_item(request, stock_symbol, timespan):
+    try:
+        status_code, result = process_symbol(request, stock_symbol, timespan)
+    except Exception as e:
+        status_code, result = 500, f'Greška prilikom obrade podataka: {e}'
+
+    item = {'stock_symbol': stock_symbol, 'timespan': timespan, 'statusCode': status_code}
+    if isinstance(result, dict):
+        item.update(result)
+    else:
+        item['message'] = result
+    return item
+
+@metrics.instrument('data_collection_and_processing')
+def handler(event, context):
+    body = json.loads(event['body'])
+
+    request = {
+        'polygon_api_key': os.getenv('POLYGON_API_KEY'),
+        's3_bucket': os.getenv('S3_BUCKET'),
+        'data_set': body.get('data_set', 'training'),
+        'multiplier': body.get('multiplier', 1),
+        'from_date': body.get('from', '2024-08-01'),
+        'to_date': body.get('to', '2024-08-31'),
+        'output_format': body.get('output_format', 'csv'),
+        'compression': body.get('compression', 'zstd'),
+        'stream': bool(body.get('stream', False)),
+        'incremental': bool(body.get('incremental', False)),
+        'codec': body.get('codec', 'gzip'),
+        'codec_level': body.get('codec_level'),
+        'limit': body.get('limit', 50000),
+        'layout': body.get('layout', 'file'),
+    }
+
+    try:
+        request['features'] = features.normalize_features(body.get('features'))
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps(f'Neispravan feature set: {e}')
+        }
+
+    if request['output_format'] not in OUTPUT_FORMATS:
+        return {
+            'statusCode': 400,
+            'body': json.dumps(f'Nepodržan format: {request["output_format"]}. Dozvoljeni formati: {", ".join(OUTPUT_FORMATS)}.')
+        }
+
+    if request['layout'] not in LAYOUTS:
+        return {
+            'statusCode': 400,
+            'body': json.dumps(f'Nepodržan raspored: {request["layout"]}. Dozvoljeni rasporedi: {", ".join(LAYOUTS)}.')
+        }
+
+    # Parquet compression uses the same codecs as the compressed CSV stream
+    if request['compression'] not in CODECS:
+        return {
+            'statusCode': 400,
+            'body': json.dumps(f'Nepodržana kompresija: {request["compression"]}. Dozvoljene kompresije: {", ".join(CODECS)}.')
+        }
+
+    if request['codec'] not in CODECS:
+        return {
+            'statusCode': 400,
+            'body': json.dumps(f'Nepodržan codec: {request["codec"]}. Dozvoljeni codec-i: {", ".join(CODECS)}.')
+        }
+
+    # Jedan simbol i timespan: originalni format odgovora
+    if 'stock_symbols' not in body and 'timespans' not in body:
+        status_code, result = process_symbol(request, body.get('stock_symbol', 'AAPL'), body.get('timespan', 'day'))
+        return {
+            'statusCode': status_code,
+            'body': json.dumps(result)
+        }
+
+    stock_symbols = body.get('stock_symbols') or [body.get('stock_symbol', 'AAPL')]
+    timespans = body.get('timespans') or [body.get('timespan', 'day')]
+    jobs = [(stock_symbol, timespan) for stock_symbol in stock_symbols for timespan in timespans]
+    max_concurrency = max(1, min(int(body.get('max_concurrency', MAX_CONCURRENCY)), MAX_CONCURRENCY, len(jobs)))
+
+    # Each worker fetches, computes and uploads its own symbol, so CPU work and
+    # S3 writes of one symbol overlap with the Polygon requests of the others
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        results = list(executor.map(lambda job: process_batch_item(request, *job), jobs))
 
+    succeeded = sum(1 for item in results if item['statusCode'] == 200)
     return {
         'statusCode': 200,
         'body': json.dumps({
-            'message': f'Podaci uspešno sačuvani u {data_set} skupu.',
-            'original_file_url': original_file_url,
-            'processed_file_url': processed_file_url
+            'message': f'Uspešno obrađeno {succeeded} od {len(results)} zahteva u {request["data_set"]} skupu.',
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'results': results
         })
     }
@@ -0,0 +1,310 @@
+import math
+import numpy as np
+
+from features import column_name, entry_columns, feature_columns, lookback, normalize_features
+
+# Prefix sums are taken per block of this many rows so rounding error is bounded
+# by the block length instead of growing with the length of the history.
+SUM_BLOCK = 256
+
+# EMA is evaluated in closed form per block; blocks are short enough that
+# decay ** -k stays well inside float64 precision.
+EMA_MAX_GROWTH = 1e8
+
+
+# Block-local prefix sums of one or more series stacked along the first axis,
+# built once and shared by every window up to max_window: the rolling sum for a
+# window is then a difference of two slices, O(n) without another pass over
+# the data or another cumsum.
+class PrefixSums:
+    def __init__(self, values, max_window):
+        values = np.asarray(values, dtype=np.float64)
+        self.n = values.shape[-1]
+        self.block = max(SUM_BLOCK, max_window)
+        lead = values.shape[:-1]
+        nblocks = max(1, -(-self.n // self.block))
+        padded = np.zeros(lead + (nblocks * self.block,))
+        padded[..., :self.n] = values
+        self.local = np.cumsum(padded.reshape(lead + (nblocks, self.block)), axis=-1)
+
+    # Sum of values[..., t-window+1:t+1] for every t >= window-1, NaN before that.
+    # row selects one of the stacked series; None sums all of them.
+    def window(self, window, row=None):
+        if window > self.block:
+            raise ValueError(f'Window {window} is longer than the prefix sum block {self.block}')
+        local = self.local if row is None else self.local[row]
+        lead = local.shape[:-2]
+        block = self.block
+        out = np.full(lead + (self.n,), np.nan)
+        if self.n < window:
+            return out
+
+        # Differences of prefix sums from the same block are exact when the window
+        # holds only zeros, so empty RSI windows come out as 0 like in pandas.
+        sums = np.empty_like(local)
+        # Windows that fit inside one block
+        sums[..., window:] = local[..., window:] - local[..., :-window]
+        # Windows that start in the previous block (window <= block, so at most two)
+        sums[..., 1:, :window] = local[..., 1:, :window] + (
+            local[..., :-1, -1:] - local[..., :-1, block - window:])
+        sums[..., 0, :window] = local[..., 0, :window]
+
+        out[..., window - 1:] = sums.reshape(lead + (-1,))[..., window - 1:self.n]
+        return out
+
+
+def window_sums(values, window):
+    # Sum of values[..., t-window+1:t+1] for every t >= window-1, NaN before that.
+    # Several series can be stacked along the first axis and summed together.
+    return PrefixSums(values, window).window(window)
+
+
+def window_max(values, window):
+    # Maximum of values[t-window+1:t+1] for every t >= window-1, NaN before that.
+    # van Herk/Gil-Werman: running maxima from both ends of blocks of `window`
+    # rows; every window spans at most two blocks, so it is the larger of the
+    # suffix maximum where it starts and the prefix maximum where it ends.
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    out = np.full(n, np.nan)
+    if n < window:
+        return out
+
+    nblocks = -(-n // window)
+    padded = np.full(nblocks * window, -np.inf)
+    padded[:n] = values
+    blocks = padded.reshape(nblocks, window)
+    prefix = np.maximum.accumulate(blocks, axis=1).ravel()
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    out[window - 1:] = np.maximum(suffix[:n - window + 1], prefix[window - 1:n])
+    return out
+
+
+def window_min(values, window):
+    return -window_max(-np.asarray(values, dtype=np.float64), window)
+
+
+def ema(values, window, seed=None):
+    # pandas ewm(span=window, adjust=False); seed is the EMA of the previous row
+    n = len(values)
+    if n == 0:
+        return np.empty(0)
+
+    alpha = 2.0 / (window + 1)
+    decay = 1.0 - alpha
+    prev = values[0] if seed is None else seed
+    if decay == 0.0:
+        return np.array(values, dtype=np.float64)
+
+    block = max(1, min(n, int(math.log(EMA_MAX_GROWTH) / -math.log(decay))))
+    nblocks = -(-n // block)
+    padded = np.zeros(nblocks * block)
+    padded[:n] = values
+    steps = np.arange(block)
+    shrink = decay ** steps
+
+    # Zero-seeded EMA inside every block at once:
+    # e[k] = alpha * decay^k * sum(x[j] * decay^-j, j <= k)
+    local = np.cumsum(padded.reshape(nblocks, block) * decay ** -steps, axis=1)
+    local *= alpha * shrink
+
+    # Carry the last EMA of each block into the next one; one scalar per block
+    block_decay = decay ** block
+    carry = np.empty(nblocks)
+    for b, last in enumerate(local[:, -1].tolist()):
+        carry[b] = prev
+        prev = last + block_decay * prev
+
+    local += carry[:, None] * (decay * shrink)
+    return local.ravel()[:n]
+
+
+def _last_or_none(values):
+    if len(values) == 0 or np.isnan(values[-1]):
+        return None
+    return float(values[-1])
+
+
+# Bars each indicator reads besides the close
+BAR_INPUTS = {
+    'atr': ['high', 'low'],
+    'obv': ['volume'],
+    'vwap': ['high', 'low', 'volume'],
+    'stochastic': ['high', 'low'],
+}
+
+
+# Indicator state saved before feature sets existed: SMA, EMA, RSI and
+# volatility over one window, with only the closes as history
+def _upgrade_state(state):
+    if state is None or 'window' not in state:
+        return state
+    window = state['window']
+    return {
+        'features': normalize_features({'sma': [window], 'ema': [window], 'rsi': [window], 'volatility': [window]}),
+        'bars': {'close': state['closes']},
+        'ema': {str(window): state['ema']},
+    }
+
+
+# Every feature of a feature set (see features.py) over the bars in one pass.
+#
+# bars maps open/high/low/close/volume to equal-length arrays (a DataFrame
+# works). Rolling sums of all indicators and windows come from one PrefixSums
+# over the stacked input series, and rolling highs/lows from window_max/min,
+# so each extra window costs O(n) and no pass of its own over the data.
+#
+# state is the dict returned by a previous call over the bars immediately before
+# these; passing it continues the series without recomputing history, and the
+# result matches a single call over the concatenated bars. Returns
+# ({column: values for the new bars}, state).
+def compute_features(bars, features=None, state=None):
+    features = normalize_features(features)
+    state = _upgrade_state(state)
+    if state is not None and state['features'] != features:
+        raise ValueError(f"Indicator state was computed for {state['features']}, not {features}")
+
+    inputs = ['close'] + sorted({name for kind in features for name in BAR_INPUTS.get(kind, [])})
+    history = state['bars'] if state is not None else {}
+    missing = [name for name in inputs if state is not None and name not in history]
+    if missing:
+        raise ValueError(f"Indicator state has no history for {', '.join(missing)}")
+
+    series = {
+        name: np.concatenate([np.asarray(history.get(name, []), dtype=np.float64), np.asarray(bars[name], dtype=np.float64)])
+        for name in inputs
+    }
+    close = series['close']
+    n = len(close)
+    offset = len(history.get('close', []))
+    ema_seeds = state['ema'] if state is not None else {}
+    signal_seeds = state.get('macd_signal', {}) if state is not None else {}
+
+    columns = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Centering leaves the variance unchanged and keeps the squared sums small
+        reference = close.mean() if n else 0.0
+        centered = close - reference
+        # The first delta of a fresh series is NaN in pandas and counts as 0 there
+        delta = np.diff(close, prepend=close[:1])
+
+        stacked = {}
+        if {'sma', 'volatility', 'bollinger'} & set(features):
+            stacked['close'] = centered
+        if {'volatility', 'bollinger'} & set(features):
+            stacked['close_squared'] = centered * centered
+        if 'rsi' in features:
+            stacked['gain'] = np.maximum(delta, 0.0)
+            stacked['loss'] = np.maximum(-delta, 0.0)
+        if 'atr' in features:
+            previous = close - delta
+            stacked['true_range'] = np.maximum.reduce([
+                series['high'] - series['low'],
+                np.abs(series['high'] - previous),
+                np.abs(series['low'] - previous),
+            ])
+        if 'vwap' in features:
+            typical = (series['high'] + series['low'] + close) / 3
+            stacked['price_volume'] = (typical - reference) * series['volume']
+            stacked['volume'] = series['volume']
+
+        windows = [
+            entry[0] if isinstance(entry, list) else entry
+            for kind in ('sma', 'volatility', 'bollinger', 'rsi', 'atr', 'vwap') for entry in features.get(kind, [])
+        ]
+        prefix_sums = PrefixSums(np.stack(list(stacked.values())) if stacked else np.empty((0, n)), max(windows, default=1))
+        rows = {name: index for index, name in enumerate(stacked)}
+        sums = {}
+
+        def rolling(name, window):
+            if (name, window) not in sums:
+                sums[(name, window)] = prefix_sums.window(window, rows[name])
+            return sums[(name, window)]
+
+        def standard_deviation(window):
+            sum1, sum2 = rolling('close', window), rolling('close_squared', window)
+            return np.sqrt(np.maximum((sum2 - sum1 * sum1 / window) / (window - 1), 0.0))
+
+        for window in features.get('sma', []):
+            columns[column_name('sma', window)] = rolling('close', window) / window + reference
+
+        for window in features.get('rsi', []):
+            average_gain = rolling('gain', window) / window
+            average_loss = rolling('loss', window) / window
+            columns[column_name('rsi', window)] = 100 - (100 / (1 + average_gain / average_loss))
+
+        for window in features.get('volatility', []):
+            columns[column_name('volatility', window)] = standard_deviation(window)
+
+        for window, num_std in features.get('bollinger', []):
+            middle = rolling('close', window) / window + reference
+            spread = num_std * standard_deviation(window)
+            upper, lower = entry_columns('bollinger', [window, num_std])
+            columns[upper] = middle + spread
+            columns[lower] = middle - spread
+
+        for window in features.get('atr', []):
+            columns[column_name('atr', window)] = rolling('true_range', window) / window
+
+        for window in features.get('vwap', []):
+            columns[column_name('vwap', window)] = rolling('price_volume', window) / rolling('volume', window) + reference
+
+        for window, smoothing in features.get('stochastic', []):
+            highest = window_max(series['high'], window)
+            lowest = window_min(series['low'], window)
+            k = 100 * (close - lowest) / (highest - lowest)
+            # A flat window has no range; its close sits in the middle of it
+            k[highest == lowest] = 50.0
+            d = np.full(n, np.nan)
+            d[window - 1:] = window_sums(k[window - 1:], smoothing) / smoothing
+            k_column, d_column = entry_columns('stochastic', [window, smoothing])
+            columns[k_column] = k
+            columns[d_column] = d
+
+        if 'obv' in features:
+            direction = np.sign(delta[offset:])
+            seed = state.get('obv', 0.0) if state is not None else 0.0
+            obv = np.cumsum(direction * series['volume'][offset:]) + (seed or 0.0)
+            columns['obv'] = np.concatenate([np.full(offset, np.nan), obv])
+
+    # Windowed features are computed over history + new bars; EMAs continue
+    # from their seeds over the new bars only
+    new_close = close[offset:]
+    emas = {}
+
+    def ema_of(window):
+        if window not in emas:
+            emas[window] = ema(new_close, window, ema_seeds.get(str(window)))
+        return emas[window]
+
+    result = {name: values[offset:] for name, values in columns.items()}
+    for window in features.get('ema', []):
+        result[column_name('ema', window)] = ema_of(window)
+
+    signals = {}
+    for fast, slow, signal in features.get('macd', []):
+        line = ema_of(fast) - ema_of(slow)
+        name, signal_name, hist_name = entry_columns('macd', [fast, slow, signal])
+        signals[name] = ema(line, signal, signal_seeds.get(name))
+        result[name] = line
+        result[signal_name] = signals[name]
+        result[hist_name] = line - signals[name]
+
+    has_new = len(new_close) > 0
+    keep = lookback(features)
+    new_state = {
+        'features': features,
+        'bars': {name: values[-keep:].tolist() for name, values in series.items()},
+        'ema': {
+            str(window): _last_or_none(values) if has_new else ema_seeds.get(str(window))
+            for window, values in emas.items()
+        },
+        'macd_signal': {
+            name: _last_or_none(values) if has_new else signal_seeds.get(name)
+            for name, values in signals.items()
+        },
+    }
+    if 'obv' in features:
+        new_state['obv'] = _last_or_none(result['obv']) if has_new else (state or {}).get('obv')
+
+    return {column: result[column] for column in feature_columns(features)}, new_state
@@ -0,0 +1,190 @@
+import json
+from datetime import date, datetime, timedelta
+
+from features import normalize_features
+
+# Manifest po simbolu i timespan-u: koji opsezi datuma su već sačuvani, u kojim
+# fajlovima, i stanje indikatora na kraju svakog opsega. Kod particionisanog
+# rasporeda (layout=partitioned) manifest je i indeks particija: čitaoci iz
+# njega biraju samo particije koje se preklapaju sa traženim opsegom datuma.
+#
+# {
+#     "stock_symbol": "AAPL", "multiplier": 1, "timespan": "day",
+#     "features": {"sma": [14], "ema": [14], "rsi": [14], "volatility": [14]},
+#     "time_column": "t",
+#     "ranges": [
+#         {"from": "2024-08-01", "to": "2024-08-31", "rows": 21,
+#          "original_file": "...", "processed_file": "...", "indicator_state": {...}}
+#     ],
+#     "partitions": [
+#         {"key": "training/partitions/symbol=AAPL/timespan=1_day/date=2024/part-<uuid>.csv.gz",
+#          "partition": "2024", "rows": 21, "min_date": "2024-08-01", "max_date": "2024-08-30",
+#          "min_t": 1722484800000, "max_t": 1724990400000, "size": 2310, "compressed_size": 1024,
+#          "stats": {"close": {"min": 209.8, "max": 229.0, "count": 21, "mean": 219.3, "m2": 401.7}, ...}}
+#     ]
+# }
+#
+# Statistike kolona (column_stats.py) processed fajla sa fajl rasporedom su u
+# zasebnom JSON-u pod {data_set}/statistics/, van prefiksa čiji upload pokreće
+# treniranje, zajedno sa simbolom, multiplier-om i timespan-om fajla i opsegom
+# njegovih barova (min_date/max_date, min_t/max_t, kao kod particija).
+
+
+# training/processed/stock_data_AAPL_....csv.gz -> training/statistics/stock_data_AAPL_....csv.gz.json
+def stats_key(processed_key):
+    data_set, _, file_name = processed_key.partition('/processed/')
+    return f'{data_set}/statistics/{file_name}.json'
+
+
+def manifest_key(data_set, stock_symbol, multiplier, timespan):
+    return f'{data_set}/manifests/{stock_symbol}/{multiplier}_{timespan}.json'
+
+
+def load_manifest(s3_client, bucket, key, stock_symbol, multiplier, timespan):
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return {'stock_symbol': stock_symbol, 'multiplier': multiplier, 'timespan': timespan, 'ranges': [], 'partitions': []}
+    return json.loads(response['Body'].read())
+
+
+# Feature set (features.py) of the stored data. Manifests written before the
+# feature set was configurable hold the default one; an empty manifest has none.
+def stored_features(manifest):
+    if 'features' in manifest:
+        return manifest['features']
+    if manifest['ranges'] or manifest.get('partitions'):
+        return normalize_features()
+    return None
+
+
+# Kolona sa vremenom bara u particijama: 't' (epoch ms), ili 'date' (YYYY-MM-DD)
+# kod particija zapisanih pre nje; manifest bez particija je nema
+def stored_time_column(manifest):
+    if not manifest.get('partitions'):
+        return None
+    return manifest.get('time_column', 'date')
+
+
+def save_manifest(s3_client, bucket, key, manifest):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(manifest),
+        ContentType='application/json'
+    )
+
+
+def _day(value):
+    return date.fromisoformat(value)
+
+
+# Date ranges inside [from_date, to_date] (inclusive, YYYY-MM-DD) that no stored
+# range covers, in ascending order
+def missing_ranges(ranges, from_date, to_date):
+    gaps = []
+    cursor = _day(from_date)
+    end = _day(to_date)
+
+    for stored in sorted(ranges, key=lambda r: r['from']):
+        if cursor > end:
+            break
+        stored_from = _day(stored['from'])
+        stored_to = _day(stored['to'])
+        if stored_to < cursor:
+            continue
+        if stored_from > cursor:
+            gaps.append((cursor.isoformat(), min(stored_from - timedelta(days=1), end).isoformat()))
+        cursor = max(cursor, stored_to + timedelta(days=1))
+
+    if cursor <= end:
+        gaps.append((cursor.isoformat(), end.isoformat()))
+    return gaps
+
+
+# Indicator state of the stored range ending the day before from_date, so a gap
+# directly after stored data continues its indicators instead of starting cold
+def state_before(manifest, from_date):
+    previous_day = (_day(from_date) - timedelta(days=1)).isoformat()
+    for stored in manifest['ranges']:
+        if stored['to'] == previous_day:
+            return stored.get('indicator_state')
+    return None
+
+
+def add_range(manifest, from_date, to_date, result, indicator_state):
+    manifest['ranges'].append({
+        'from': from_date,
+        'to': to_date,
+        'rows': result['rows'],
+        'original_file': result['original_file_key'],
+        'processed_file': result.get('processed_file_key'),
+        'original_file_size': result['original_file_size'],
+        'original_file_compressed_size': result['original_file_compressed_size'],
+        'processed_file_size': result['processed_file_size'],
+        'processed_file_compressed_size': result['processed_file_compressed_size'],
+        'indicator_state': indicator_state,
+    })
+    manifest['ranges'].sort(key=lambda r: r['from'])
+
+
+# Unutardnevni barovi se dele po danu, a dnevni i duži po godini, tako da
+# particije nisu ni premale ni prevelike. Vrednost je numpy jedinica datuma
+# (D -> YYYY-MM-DD, Y -> YYYY) koji je naziv particije.
+PARTITION_UNIT = {
+    'second': 'D',
+    'minute': 'D',
+    'hour': 'D',
+    'day': 'Y',
+    'week': 'Y',
+    'month': 'Y',
+    'quarter': 'Y',
+    'year': 'Y',
+}
+
+
+def partition_prefix(data_set, stock_symbol, multiplier, timespan):
+    return f'{data_set}/partitions/symbol={stock_symbol}/timespan={multiplier}_{timespan}/'
+
+
+# Nazivi particija za vremena barova u epoch milisekundama (UTC)
+def partition_labels(times, timespan):
+    import numpy as np
+
+    unit = PARTITION_UNIT.get(timespan, 'Y')
+    return np.datetime_as_string(np.asarray(times, dtype='int64').astype('datetime64[ms]').astype(f'datetime64[{unit}]'))
+
+
+def utc_date(timestamp_ms):
+    return datetime.utcfromtimestamp(timestamp_ms / 1000).date().isoformat()
+
+
+# Particije čiji se [min_date, max_date] preklapa sa opsegom [from_date, to_date]
+def overlapping_partitions(manifest, from_date, to_date):
+    return [
+        partition for partition in manifest.get('partitions', [])
+        if partition['max_date'] >= from_date and partition['min_date'] <= to_date
+    ]
+
+
+def inside_range(partition, from_date, to_date):
+    return from_date <= partition['min_date'] and partition['max_date'] <= to_date
+
+
+# Epoch milisekunde (UTC) prvog i poslednjeg trenutka opsega [from_date, to_date]
+def range_bounds(from_date, to_date):
+    epoch = date(1970, 1, 1)
+    day_ms = 24 * 60 * 60 * 1000
+    return (_day(from_date) - epoch).days * day_ms, ((_day(to_date) - epoch).days + 1) * day_ms - 1
+
+
+# Novi fajlovi za opseg [from_date, to_date] zamenjuju sve stare particije koje
+# se preklapaju sa tim opsegom. Particije koje opseg seče samo delimično su pre
+# toga prepisane bez redova iz opsega (index.trim_partitions), i ti prepisani
+# fajlovi stižu ovde zajedno sa novim. Vraća zamenjene particije, da bi se
+# obrisale iz S3 tek pošto je novi manifest sačuvan.
+def add_partitions(manifest, from_date, to_date, partitions):
+    replaced = overlapping_partitions(manifest, from_date, to_date)
+    kept = [partition for partition in manifest.setdefault('partitions', []) if partition not in replaced]
+    manifest['partitions'] = sorted(kept + partitions, key=lambda p: (p['min_date'], p['max_date']))
+    return replaced
@@ -0,0 +1,183 @@
+import gzip
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+# S3 requires every part except the last one to be at least 5 MB
+PART_SIZE = 8 * 1024 * 1024
+# Parts uploaded in parallel; also bounds how many parts are held in memory
+UPLOAD_CONCURRENCY = 4
+
+# Codec -> key suffix. Readers pick the decompressor from the suffix.
+CODECS = {
+    'none': '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+DEFAULT_LEVELS = {
+    'gzip': 6,
+    'zstd': 3,
+}
+
+
+# File-like writer that sends data to S3 as it arrives. Objects smaller than one
+# part are written with a single put_object; larger ones become a multipart
+# upload whose parts are sent in parallel while the caller keeps writing.
+class S3StreamWriter(io.RawIOBase):
+    def __init__(self, s3_client, bucket, key, content_type, part_size=PART_SIZE, concurrency=UPLOAD_CONCURRENCY):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.buffer = bytearray()
+        self.position = 0
+        self.upload_id = None
+        self.executor = None
+        self.pending = []
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def _send_part(self, part_number, body):
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+            )
+            self.upload_id = response['UploadId']
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        # Wait for the oldest part once the window is full
+        if len(self.pending) >= self.concurrency:
+            self.parts.append(self.pending.pop(0).result())
+
+        part_number = len(self.parts) + len(self.pending) + 1
+        self.pending.append(self.executor.submit(self._send_part, part_number, bytes(self.buffer)))
+        self.buffer = bytearray()
+
+    def _shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def _abort_upload(self):
+        self._shutdown()
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    # A part or completion that fails aborts the multipart upload before the
+    # error propagates, so no uploaded parts are left behind in the bucket
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.s3_client.put_object(
+                    Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), ContentType=self.content_type
+                )
+            else:
+                if self.buffer:
+                    self._upload_part()
+                self.parts.extend(future.result() for future in self.pending)
+                self.pending = []
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={'Parts': self.parts}
+                )
+        except BaseException:
+            self._abort_upload()
+            raise
+        finally:
+            self._shutdown()
+            self.buffer = bytearray()
+            super().close()
+
+    # Odustajanje od upload-a, npr. kada Polygon vrati grešku usred paginacije
+    def abort(self):
+        if self.closed:
+            return
+        self._abort_upload()
+        self.buffer = bytearray()
+        super().close()
+
+
+# S3StreamWriter behind a streaming compressor. The codec's suffix is appended to
+# the key; uncompressed_size and compressed_size are known after close().
+class S3CompressedWriter(io.RawIOBase):
+    def __init__(self, s3_client, bucket, key, content_type, codec='gzip', level=None):
+        super().__init__()
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported codec: {codec}")
+
+        self.key = key + CODECS[codec]
+        self.target = S3StreamWriter(s3_client, bucket, self.key, content_type)
+        self.uncompressed_size = 0
+        level = DEFAULT_LEVELS.get(codec) if level is None else level
+
+        if codec == 'gzip':
+            self.compressor = gzip.GzipFile(fileobj=self.target, mode='wb', compresslevel=level, mtime=0)
+        elif codec == 'zstd':
+            import zstandard
+            self.compressor = zstandard.ZstdCompressor(level=level).stream_writer(self.target, closefd=False)
+        else:
+            self.compressor = None
+
+    @property
+    def compressed_size(self):
+        return self.target.tell()
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.uncompressed_size
+
+    def write(self, data):
+        self.uncompressed_size += len(data)
+        if self.compressor is None:
+            return self.target.write(data)
+        self.compressor.write(data)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.compressor is not None:
+                self.compressor.close()
+            self.target.close()
+        except BaseException:
+            self.target.abort()
+            raise
+        finally:
+            super().close()
+
+    def abort(self):
+        if self.closed:
+            return
+        self.target.abort()
+        super().close()
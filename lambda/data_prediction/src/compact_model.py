@@ -0,0 +1,241 @@
+import json
+import struct
+
+import numpy as np
+
+# Kompaktni format modela koji trenerima izvoze pored .joblib fajla:
+#
+#   MAGIC (8 B) | dužina zaglavlja (uint64 LE) | JSON zaglavlje | nizovi
+#
+# Zaglavlje opisuje vrstu modela ('linear' ili 'trees'), redosled feature kolona
+# i za svaki niz dtype, shape i offset od početka dela sa nizovima. Nizovi su
+# poravnati na 64 bajta, pa se čitaju direktno iz memorijski mapiranog fajla.
+#
+# linear: coef (n_features,), intercept (1,)
+# trees:  feature, threshold, left, right, value po čvoru (sva stabla spojena),
+#         roots (n_trees,). Listovi pokazuju sami na sebe, pa se obilazak radi
+#         fiksnim brojem koraka (max_depth) bez grananja.
+# rnn:    složeni LSTM ili GRU slojevi ('cell') i Dense izlaz, sa težinama u
+#         Keras rasporedu: layer<i>_kernel, layer<i>_recurrent_kernel,
+#         layer<i>_bias, dense_kernel, dense_bias. Uz quantization 'int8' su
+#         matrice int8 sa float32 skalom po izlaznoj koloni (<ime>_scale).
+#         Zaglavlje nosi i standardizaciju iz treninga (feature_mean,
+#         feature_scale, target_mean, target_scale); stariji modeli je nemaju.
+MAGIC = b'CMPMDL01'
+ALIGNMENT = 64
+
+# Broj redova koji se obilaze odjednom. Mali blokovi drže indekse čvorova
+# (redovi x stabla) u kešu procesora.
+PREDICT_CHUNK_ROWS = 1024
+
+# Broj prozora koji prolaze kroz rekurentne slojeve odjednom. Međurezultati
+# jednog koraka (prozori x gejtovi) tada staju u keš procesora.
+SEQUENCE_CHUNK_WINDOWS = 512
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _dequantized(arrays, name):
+    weights = arrays[name]
+    if weights.dtype == np.int8:
+        return weights.astype(np.float32) * arrays[f'{name}_scale']
+    return np.array(weights, dtype=np.float32)
+
+
+# Težine jednog rekurentnog sloja, pripremljene za _run_layer. Gejtovi sa
+# sigmoidom idu prvi (LSTM input, forget, output pa cell umesto Keras redosleda
+# input, forget, cell, output; GRU update i reset su već prvi), a njihove kolone
+# se dele sa 2: sigmoid(a) = 0.5 + 0.5 * tanh(a / 2), pa svi gejtovi koraka
+# prolaze kroz jedan tanh nad celim blokom.
+def _rnn_layer(arrays, index, cell, layer):
+    units = layer['units']
+    weights = {
+        'kernel': _dequantized(arrays, f'layer{index}_kernel'),
+        'recurrent_kernel': _dequantized(arrays, f'layer{index}_recurrent_kernel'),
+        'bias': np.array(arrays[f'layer{index}_bias'], dtype=np.float32),
+    }
+    sigmoid_gates = 2
+    if cell == 'lstm':
+        order = np.r_[0:2 * units, 3 * units:4 * units, 2 * units:3 * units]
+        weights = {name: array[..., order] for name, array in weights.items()}
+        sigmoid_gates = 3
+    for array in weights.values():
+        array[..., :sigmoid_gates * units] *= 0.5
+    return {**layer, **weights}
+
+
+class CompactModel:
+    def __init__(self, header, arrays):
+        self.kind = header['kind']
+        self.feature_names = header['feature_names']
+        self.max_depth = header.get('max_depth', 0)
+        self.arrays = arrays
+        if self.kind == 'trees':
+            # left/right spojeni u jedan niz: dete čvora n je children[2n + (x > prag)]
+            self.children = np.stack([arrays['left'], arrays['right']], axis=1).reshape(-1).astype(np.intp)
+        if self.kind == 'rnn':
+            self.cell = header['cell']
+            self.window_size = header['window_size']
+            # int8 težine se jednom vraćaju u float32; štedi se veličina fajla i
+            # preuzimanja, a množenje ostaje float32
+            self.layers = [_rnn_layer(arrays, index, self.cell, layer) for index, layer in enumerate(header['layers'])]
+            self.dense_kernel = _dequantized(arrays, 'dense_kernel')
+            self.dense_bias = np.asarray(arrays['dense_bias'], dtype=np.float32)
+            # Mreža je trenirana nad standardizovanim ulazima i ciljem
+            n_features = len(self.feature_names)
+            self.feature_mean = np.asarray(header.get('feature_mean', np.zeros(n_features)), dtype=np.float64)
+            self.feature_scale = np.asarray(header.get('feature_scale', np.ones(n_features)), dtype=np.float64)
+            self.target_mean = header.get('target_mean', 0.0)
+            self.target_scale = header.get('target_scale', 1.0)
+
+    # Ulaz je DataFrame (kolone se uzimaju po imenu) ili matrica u redosledu feature_names
+    def _matrix(self, X, dtype):
+        if hasattr(X, 'columns'):
+            X = X[self.feature_names].to_numpy(dtype=dtype)
+        X = np.asarray(X, dtype=dtype)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise ValueError(f"Očekivano {len(self.feature_names)} feature kolona, dobijeno {X.shape}")
+        return X
+
+    def predict(self, X):
+        if self.kind == 'linear':
+            X = self._matrix(X, np.float64)
+            return X @ self.arrays['coef'] + self.arrays['intercept'][0]
+        if self.kind == 'trees':
+            # scikit-learn stabla porede float32 ulaz sa float64 pragom
+            X = self._matrix(X, np.float32)
+            predictions = np.empty(len(X), dtype=np.float64)
+            for start in range(0, len(X), PREDICT_CHUNK_ROWS):
+                chunk = X[start:start + PREDICT_CHUNK_ROWS]
+                predictions[start:start + len(chunk)] = self._predict_trees(chunk)
+            return predictions
+        if self.kind == 'rnn':
+            X = (self._matrix(X, np.float64) - self.feature_mean) / self.feature_scale
+            return self._predict_rnn(X.astype(np.float32)) * self.target_scale + self.target_mean
+        raise ValueError(f"Nepoznata vrsta modela: {self.kind}")
+
+    # Prozori se prave kao u treneru: prozor redova [k, k + window_size) predviđa
+    # red k + window_size. Prvih window_size redova nema pun prozor pre sebe i
+    # dobija NaN.
+    def _predict_rnn(self, X):
+        predictions = np.full(len(X), np.nan)
+        count = len(X) - self.window_size
+        if count <= 0:
+            return predictions
+
+        # Ulazna projekcija prvog sloja zavisi samo od reda, pa se računa jednom
+        # po redu umesto jednom po prozoru (prozori se preklapaju window_size puta).
+        # Korak t bloka prozora [start, start + batch) je onda samo isečak
+        # projected[t:t + batch], bez kopiranja prozora.
+        first = self.layers[0]
+        for start in range(0, count, SEQUENCE_CHUNK_WINDOWS):
+            batch = min(SEQUENCE_CHUNK_WINDOWS, count - start)
+            projected = X[start:start + batch + self.window_size - 1] @ first['kernel'] + self._input_bias(first)
+            steps = [projected[step:step + batch] for step in range(self.window_size)]
+            for index, layer in enumerate(self.layers):
+                if index:
+                    # Izlazi prethodnog sloja su (koraci, prozori, jedinice), pa je
+                    # projekcija jedno 2D množenje
+                    units = steps.shape[-1]
+                    steps = (steps.reshape(-1, units) @ layer['kernel'] + self._input_bias(layer)).reshape(self.window_size, batch, -1)
+                steps = self._run_layer(steps, layer, batch)
+            output = steps @ self.dense_kernel + self.dense_bias
+            predictions[self.window_size + start:self.window_size + start + batch] = output[:, 0]
+        return predictions
+
+    # GRU (reset_after) ima odvojene biase ulaza i rekurentnog dela, (2, 3 * units)
+    def _input_bias(self, layer):
+        return layer['bias'][0] if self.cell == 'gru' else layer['bias']
+
+    # steps[t]: (prozori, gejtovi), ulaz koraka t sa već dodatim ulaznim biasom.
+    # Vraća sve izlaze (koraci, prozori, jedinice) za sledeći sloj ili samo
+    # poslednji, kao Keras return_sequences. Međurezultati koraka se pišu u
+    # bafere napravljene jednom po bloku, pa korak ne alocira memoriju.
+    def _run_layer(self, steps, layer, batch):
+        units = layer['units']
+        recurrent_kernel = layer['recurrent_kernel']
+        h = np.zeros((batch, units), dtype=np.float32)
+        outputs = np.empty((len(steps), batch, units), dtype=np.float32) if layer['return_sequences'] else None
+        buffer = np.empty((batch, units), dtype=np.float32)
+
+        if self.cell == 'lstm':
+            # Gejtovi su input, forget, output, cell (vidi _rnn_layer)
+            c = np.zeros_like(h)
+            z = np.empty((batch, 4 * units), dtype=np.float32)
+            i, f, o, g = (z[:, gate * units:(gate + 1) * units] for gate in range(4))
+            sigmoids = z[:, :3 * units]
+            for step, x in enumerate(steps):
+                np.matmul(h, recurrent_kernel, out=z)
+                z += x
+                np.tanh(z, out=z)
+                sigmoids *= 0.5
+                sigmoids += 0.5
+                c *= f
+                np.multiply(i, g, out=buffer)
+                c += buffer
+                np.tanh(c, out=buffer)
+                h = h if outputs is None else outputs[step]
+                np.multiply(o, buffer, out=h)
+        elif self.cell == 'gru':
+            # Keras redosled gejtova: update, reset, kandidat; reset se primenjuje
+            # posle rekurentnog množenja (reset_after)
+            recurrent_bias = layer['bias'][1]
+            r_h = np.empty((batch, 3 * units), dtype=np.float32)
+            zr = np.empty((batch, 2 * units), dtype=np.float32)
+            z, r = zr[:, :units], zr[:, units:]
+            for step, x in enumerate(steps):
+                np.matmul(h, recurrent_kernel, out=r_h)
+                r_h += recurrent_bias
+                np.add(x[:, :2 * units], r_h[:, :2 * units], out=zr)
+                np.tanh(zr, out=zr)
+                zr *= 0.5
+                zr += 0.5
+                np.multiply(r, r_h[:, 2 * units:], out=buffer)
+                buffer += x[:, 2 * units:]
+                np.tanh(buffer, out=buffer)
+                # z * h + (1 - z) * kandidat
+                previous, h = h, h if outputs is None else outputs[step]
+                np.subtract(previous, buffer, out=h)
+                h *= z
+                h += buffer
+        else:
+            raise ValueError(f"Nepoznata vrsta ćelije: {self.cell}")
+        return h if outputs is None else outputs
+
+    # Svi redovi i sva stabla se spuštaju istovremeno, jedan nivo po koraku
+    def _predict_trees(self, X):
+        feature = self.arrays['feature']
+        threshold = self.arrays['threshold']
+        flat = X.reshape(-1)
+        row_offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+
+        node = np.repeat(self.arrays['roots'][None, :].astype(np.intp), len(X), axis=0)
+        for _ in range(self.max_depth):
+            x = flat.take(row_offsets + feature.take(node))
+            node = self.children.take(2 * node + (x > threshold.take(node)))
+        return self.arrays['value'].take(node).mean(axis=1)
+
+
+def load(path):
+    with open(path, 'rb') as model_file:
+        if model_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} nije kompaktni model")
+        header_size, = struct.unpack('<Q', model_file.read(8))
+        header = json.loads(model_file.read(header_size))
+
+    data_start = _aligned(len(MAGIC) + 8 + header_size)
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, layout in header['arrays'].items():
+        dtype = np.dtype(layout['dtype'])
+        start = data_start + layout['offset']
+        end = start + dtype.itemsize * int(np.prod(layout['shape'], dtype=np.int64))
+        arrays[name] = buffer[start:end].view(dtype).reshape(layout['shape'])
+
+    return CompactModel(header, arrays)
+
+
+def is_compact_key(model_key):
+    return model_key.endswith('.compact')
@@ -1,53 +1,112 @@
 import json
 import boto3
-import joblib
-import pandas as pd
 import os
+import re
 import uuid
-from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO, BytesIO
+import model_cache
+import compact_model
+import partitions
+import metrics
 
-# Preuzimanje modela iz S3
-def download_model_from_s3(bucket_name, model_key):
-    s3_client = boto3.client('s3')
-    model_local_path = '/tmp/linear_regression_model.joblib'
-    
-    # Preuzmi model u privremeni direktorijum /tmp (Lambda ima pristup samo tom direktorijumu)
-    s3_client.download_file(bucket_name, model_key, model_local_path)
-    print(f"Model preuzet sa s3://{bucket_name}/{model_key}")
+# Klijent se pravi jednom po instanci i koristi se u toplim pozivima
+s3 = boto3.client('s3')
+
+# pandas, pyarrow i joblib (a preko unpickle-a i scikit-learn) se uvoze tek u
+# funkcijama koje ih koriste: neispravan zahtev ih ne učitava nikad, a .compact
+# model sa CSV skupom ne učitava ni joblib, ni scikit-learn, ni pyarrow.
+
+# Broj modela/skupova koji se paralelno učitavaju i izvršavaju u batch modu
+MAX_WORKERS = int(os.getenv('PREDICTION_MAX_WORKERS', '5'))
+
+# Feature kolone modela bez zapisanih imena kolona (originalni fiksni skup).
+# Ostali modeli nose svoje: kompaktni u zaglavlju, scikit-learn modeli
+# trenirani nad DataFrame-om u feature_names_in_.
+FEATURE_COLUMNS = ['open', 'high', 'low', 'volume', 'sma_14', 'ema_14', 'rsi', 'volatility']
+NON_FEATURE_COLUMNS = [partitions.TIME_COLUMN, 'date', 'close']
+
+def model_features(model):
+    names = getattr(model, 'feature_names', None)
+    if names is None:
+        names = getattr(model, 'feature_names_in_', None)
+    return FEATURE_COLUMNS if names is None else list(names)
+
+# Vreme barova za izlazne fajlove: pun UTC timestamp iz kolone 't', ili
+# YYYY-MM-DD datum skupova zapisanih pre nje
+def bar_times(test_data):
+    import pandas as pd
 
-    return model_local_path
+    if partitions.TIME_COLUMN in test_data.columns:
+        return pd.to_datetime(test_data[partitions.TIME_COLUMN], unit='ms')
+    return test_data['date']
 
-# Učitavanje modela iz lokalnog fajla
-def load_model(model_path):
-    model = joblib.load(model_path)
-    return model
+# Preuzimanje test skupa iz S3. Ključ manifesta (particionisan skup) čita samo
+# particije u opsegu [from_date, to_date]. Bez feature_columns čitaju se sve
+# kolone skupa (batch mod, gde modeli mogu imati različite feature-e). Kolone
+# stižu u tipovima processed skupa: 't' kao int64, ostalo kao float32.
+def download_test_data_from_s3(bucket_name, test_data_key, from_date=None, to_date=None, feature_columns=None):
+    columns = [partitions.TIME_COLUMN, 'date', 'close'] + feature_columns if feature_columns else None
+    if partitions.is_manifest_key(test_data_key):
+        test_data = partitions.load_partitioned(s3, bucket_name, test_data_key, columns, from_date, to_date)
+        features = feature_columns or [column for column in test_data.columns if column not in NON_FEATURE_COLUMNS]
+        return test_data[features], bar_times(test_data), test_data['close']
 
-# Preuzimanje test skupa iz S3
-def download_test_data_from_s3(bucket_name, test_data_key):
-    s3_client = boto3.client('s3')
-    csv_local_path = '/tmp/test_data.csv'
+    is_parquet = test_data_key.endswith('.parquet')
+    # Jedinstvena putanja, jer batch mod učitava više skupova paralelno
+    local_path = f'/tmp/test_data_{uuid.uuid4()}.{"parquet" if is_parquet else "csv"}'
     
     # Preuzmi test skup u privremeni direktorijum
-    s3_client.download_file(bucket_name, test_data_key, csv_local_path)
+    with metrics.stage('download_test_data', test_data_key=test_data_key) as stage:
+        s3.download_file(bucket_name, test_data_key, local_path)
+        stage.bytes = os.path.getsize(local_path)
     print(f"Test data preuzet sa s3://{bucket_name}/{test_data_key}")
     
-    # Učitaj podatke u DataFrame
-    test_data = pd.read_csv(csv_local_path)
+    # Učitaj samo kolone potrebne za predikciju u DataFrame
+    try:
+        with metrics.stage('read_test_data', test_data_key=test_data_key) as stage:
+            test_data = partitions.read_processed(local_path, test_data_key, columns)
+            stage.fields['rows'] = len(test_data)
+    finally:
+        os.remove(local_path)
     
-    # Ukloni kolone 'close' i 'date' iz test skupa za predikciju, ali ih zadrži za kasnije
-    date_column = test_data['date']
+    # Zadrži vreme i 'close' za kasnije, a za predikciju koristi samo feature kolone
+    date_column = bar_times(test_data)
     close_column = test_data['close']
-    test_data = test_data.drop(columns=['close', 'date'], errors='ignore')
+    test_data = test_data[feature_columns or [column for column in test_data.columns if column not in NON_FEATURE_COLUMNS]]
     
     return test_data, date_column, close_column
 
-# Funckija za predikciju
+def load_joblib(path):
+    import joblib
+
+    return joblib.load(path)
+
+# .compact modeli se mapiraju u memoriju i izvršavaju bez scikit-learn-a
+def model_loader(model_key):
+    if compact_model.is_compact_key(model_key):
+        return compact_model.load
+    return load_joblib
+
+# Funckija za predikciju; model dobija samo svoje feature kolone, redom kojim je treniran
 def predict(model, input_data):
-    return model.predict(input_data)
+    with metrics.stage('predict', model=type(model).__name__, rows=len(input_data)):
+        return model.predict(input_data[model_features(model)])
+
+# Model iz keša ili iz S3; bytes je veličina fajla modela
+def load_model(bucket_name, model_key):
+    with metrics.stage('model_load', model_key=model_key) as stage:
+        model, cache_hit = model_cache.get_model(s3, bucket_name, model_key, model_loader(model_key))
+        stage.fields['cache_hit'] = cache_hit
+        stage.bytes = model_cache.cache.get(model_key, {}).get('size')
+    return model, cache_hit
 
 # Čuvanje predikcija u S3
-def save_predictions_to_s3(bucket_name, dates, predictions, key_prefix='predictions/'):
-    s3_client = boto3.client('s3')
+# Predikcije i stvarne vrednosti jednog poziva dele run_id u imenu fajla,
+# pa ih evaluate.py može upariti
+def save_predictions_to_s3(bucket_name, dates, predictions, key_prefix='predictions/', run_id=None):
+    import pandas as pd
+
     csv_buffer = StringIO()
     
     # Kreiraj DataFrame sa predikcijama, datumima i stvarnim vrednostima
@@ -60,16 +119,20 @@ def save_predictions_to_s3(bucket_name, dates, predictions, key_prefix='predicti
     predictions_df.to_csv(csv_buffer, index=False)
     
     # Generiši jedinstveno ime fajla
-    file_key = f"{key_prefix}{uuid.uuid4()}.csv"
+    file_key = f"{key_prefix}{run_id or uuid.uuid4()}.csv"
     
     # Snimi fajl u S3
-    s3_client.put_object(Bucket=bucket_name, Key=file_key, Body=csv_buffer.getvalue())
+    body = csv_buffer.getvalue().encode('utf-8')
+    with metrics.stage('save_predictions') as stage:
+        s3.put_object(Bucket=bucket_name, Key=file_key, Body=body)
+        stage.bytes = len(body)
     print(f"Predictions saved to s3://{bucket_name}/{file_key}")
     return file_key
 
 # Čuvanje stvarnih podataka u S3
-def save_actuals_to_s3(bucket_name, dates, closes, key_prefix='actuals/'):
-    s3_client = boto3.client('s3')
+def save_actuals_to_s3(bucket_name, dates, closes, key_prefix='actuals/', run_id=None):
+    import pandas as pd
+
     csv_buffer = StringIO()
     
     # Kreiraj DataFrame sa stvarnim vrednostima
@@ -82,23 +145,133 @@ def save_actuals_to_s3(bucket_name, dates, closes, key_prefix='actuals/'):
     actuals_df.to_csv(csv_buffer, index=False)
     
     # Generiši jedinstveno ime fajla
-    file_key = f"{key_prefix}{uuid.uuid4()}.csv"
+    file_key = f"{key_prefix}{run_id or uuid.uuid4()}.csv"
     
     # Snimi fajl u S3
-    s3_client.put_object(Bucket=bucket_name, Key=file_key, Body=csv_buffer.getvalue())
+    body = csv_buffer.getvalue().encode('utf-8')
+    with metrics.stage('save_actuals') as stage:
+        s3.put_object(Bucket=bucket_name, Key=file_key, Body=body)
+        stage.bytes = len(body)
     print(f"Actuals saved to s3://{bucket_name}/{file_key}")
     return file_key
 
+# Test skup je zadat ključem fajla/manifesta ili simbolom i timespan-om
+# particionisanog skupa (manifest {data_set}/manifests/{simbol}/...)
+def test_data_key_for(input_data):
+    if input_data.get('stock_symbol'):
+        return partitions.manifest_key(
+            input_data.get('data_set', 'test'),
+            input_data['stock_symbol'],
+            input_data.get('multiplier', 1),
+            input_data.get('timespan', 'day')
+        )
+    return input_data.get('test_data_key')
+
+# Ime modela u batch rezultatu, npr. training/models/random_forest_model.joblib -> random_forest_model
+def model_name_for(model_key):
+    return re.sub(r'\.[^/]*$', '', model_key.split('/')[-1])
+
+def save_batch_results_to_s3(bucket_name, results, key_prefix='predictions/batch/'):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(results, preserve_index=False)
+    buffer = BytesIO()
+    pq.write_table(table, buffer, compression='zstd')
+
+    file_key = f"{key_prefix}{uuid.uuid4()}.parquet"
+    with metrics.stage('save_batch_results', rows=len(results)) as stage:
+        s3.put_object(Bucket=bucket_name, Key=file_key, Body=buffer.getvalue())
+        stage.bytes = buffer.tell()
+    print(f"Batch predictions saved to s3://{bucket_name}/{file_key}")
+    return file_key
+
+# Batch mod: svaki test skup se učitava jednom, svi traženi modeli se izvršavaju
+# nad njim paralelno, a rezultat je jedan Parquet fajl sa kolonama
+# dataset, date, actual, <model>..., i opciono ensemble (prosek modela).
+def batch_handler(input_data, bucket_name):
+    import pandas as pd
+
+    test_data_keys = input_data.get('test_data_keys') or [test_data_key_for(input_data)]
+    from_date = input_data.get('from')
+    to_date = input_data.get('to')
+    model_keys = input_data.get('model_keys') or [input_data.get('model_key', 'models/linear_regression_model.joblib')]
+    if isinstance(model_keys, dict):
+        models_by_name = dict(model_keys)
+    else:
+        models_by_name = {model_name_for(model_key): model_key for model_key in model_keys}
+    ensemble = bool(input_data.get('ensemble', False))
+    max_workers = max(1, min(int(input_data.get('max_workers', MAX_WORKERS)), MAX_WORKERS))
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        model_futures = {
+            name: executor.submit(load_model, bucket_name, model_key)
+            for name, model_key in models_by_name.items()
+        }
+        data_futures = {
+            test_data_key: executor.submit(download_test_data_from_s3, bucket_name, test_data_key, from_date, to_date)
+            for test_data_key in test_data_keys
+        }
+
+        models = {}
+        for name, future in model_futures.items():
+            try:
+                models[name], _ = future.result()
+            except Exception as e:
+                errors.append({'model': name, 'message': f"Error loading model: {e}"})
+
+        frames = []
+        for test_data_key, future in data_futures.items():
+            try:
+                test_data, dates, closes = future.result()
+            except Exception as e:
+                errors.append({'test_data_key': test_data_key, 'message': f"Error loading test data: {e}"})
+                continue
+
+            prediction_futures = {
+                name: executor.submit(predict, model, test_data) for name, model in models.items()
+            }
+            frame = pd.DataFrame({'dataset': test_data_key, 'date': dates.to_numpy(), 'actual': closes.to_numpy()})
+            for name, future in prediction_futures.items():
+                try:
+                    frame[name] = future.result()
+                except Exception as e:
+                    errors.append({'test_data_key': test_data_key, 'model': name, 'message': f"Error during prediction: {e}"})
+
+            predicted = [name for name in models if name in frame.columns]
+            if ensemble and predicted:
+                frame['ensemble'] = frame[predicted].mean(axis=1)
+            frames.append(frame)
+
+    if not frames:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'message': 'Nijedan test skup nije uspešno obrađen.', 'errors': errors})
+        }
+
+    results = pd.concat(frames, ignore_index=True)
+    results['dataset'] = results['dataset'].astype('category')
+    results_key = save_batch_results_to_s3(bucket_name, results)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'results_s3_key': results_key,
+            'datasets': len(frames),
+            'models': list(models),
+            'rows': len(results),
+            'errors': errors
+        })
+    }
+
 
 # Lambda handler funkcija
+@metrics.instrument('data_prediction')
 def handler(event, context):
     # S3 parametri (menjaj prema potrebi)
     bucket_name = os.getenv('BUCKET_NAME')
 
-    # Preuzmi i učitaj model
-    model_path = download_model_from_s3(bucket_name, model_key)
-    model = load_model(model_path)
-
     # Dobijanje input podataka iz API Gateway-a (u JSON formatu)
     try:
         input_data = json.loads(event['body'])
@@ -108,12 +281,26 @@ def handler(event, context):
             'body': json.dumps(f"Invalid input format: {e}")
         }
 
-    test_data_key = input_data.get('test_data_key')
+    if 'test_data_keys' in input_data or 'model_keys' in input_data:
+        return batch_handler(input_data, bucket_name)
+
+    test_data_key = test_data_key_for(input_data)
     model_key = input_data.get('model_key', 'models/linear_regression_model.joblib')
 
+    # Preuzmi i učitaj model, ili ga uzmi iz keša ako se u S3 nije menjao
+    try:
+        model, model_cache_hit = load_model(bucket_name, model_key)
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps(f"Error loading model: {e}")
+        }
+
     # Preuzmi test skup
     try:
-        test_data, dates, closes = download_test_data_from_s3(bucket_name, test_data_key)
+        test_data, dates, closes = download_test_data_from_s3(
+            bucket_name, test_data_key, input_data.get('from'), input_data.get('to'), model_features(model)
+        )
     except Exception as e:
         return {
             'statusCode': 500,
@@ -125,12 +312,14 @@ def handler(event, context):
         predictions = predict(model, test_data)
         
         # Sačuvaj predikcije i stvarne vrednosti u S3
-        predictions_key = save_predictions_to_s3(bucket_name, dates, predictions)
-        actuals_key = save_actuals_to_s3(bucket_name, dates, closes)
+        run_id = uuid.uuid4()
+        predictions_key = save_predictions_to_s3(bucket_name, dates, predictions, run_id=run_id)
+        actuals_key = save_actuals_to_s3(bucket_name, dates, closes, run_id=run_id)
         
         response = {
             'predictions_s3_key': predictions_key,
-            'actuals_s3_key': actuals_key
+            'actuals_s3_key': actuals_key,
+            'model_cache_hit': model_cache_hit
         }
         return {
             'statusCode': 200,
@@ -0,0 +1,149 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from functools import wraps
+
+# Merenje faza Lambda poziva: vreme, rast vršne memorije (RSS) i broj bajtova
+# po imenovanoj fazi. Svaka faza se ispisuje kao jedna JSON linija u log, a na
+# kraju poziva ide zbirna linija. benchmarks/aggregate_metrics.py iz takvih
+# logova računa percentile. Sa METRICS_ENABLED=0 stage() vraća prazan objekat,
+# pa merenje ne košta skoro ništa.
+#
+# Svaka Lambda ima svoju kopiju ovog fajla u src direktorijumu (slika se gradi
+# iz njega); kopije moraju ostati iste (tests/test_metrics.py).
+#
+#   {"metric": "stage", "function": "data_prediction", "stage": "predict", "seconds": 0.012, ...}
+
+ENABLED = os.getenv('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no', 'off')
+
+# ru_maxrss je u KB na Linuxu, a u bajtovima na macOS-u
+RSS_UNIT_BYTES = 1 if sys.platform == 'darwin' else 1024
+
+# Prvi poziv u instanci je hladan; modul se učitava samo jednom po instanci
+cold_start = True
+
+# Lambda instanca obrađuje jedan poziv u isto vreme, pa je stanje poziva
+# globalno i vidljivo i iz radnih niti ThreadPoolExecutor-a
+invocation = {}
+invocation_lock = threading.Lock()
+
+
+def peak_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT_BYTES
+
+
+def emit(record):
+    print(json.dumps(record, default=str), flush=True)
+
+
+class Stage:
+    __slots__ = ('name', 'fields', 'bytes', 'start', 'start_rss')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.bytes = None
+
+    def __enter__(self):
+        self.start_rss = peak_rss_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        rss = peak_rss_bytes()
+        record = {
+            'metric': 'stage',
+            'function': invocation.get('function'),
+            'request_id': invocation.get('request_id'),
+            'cold_start': invocation.get('cold_start'),
+            'stage': self.name,
+            'seconds': round(seconds, 6),
+            'peak_rss_mb': round(rss / 2 ** 20, 1),
+            'peak_rss_growth_mb': round((rss - self.start_rss) / 2 ** 20, 1),
+            'bytes': self.bytes,
+            'error': exc_type.__name__ if exc_type else None,
+            **self.fields,
+        }
+        with invocation_lock:
+            totals = invocation.setdefault('stages', {})
+            total = totals.setdefault(self.name, {'count': 0, 'seconds': 0.0, 'bytes': 0})
+            total['count'] += 1
+            total['seconds'] += seconds
+            total['bytes'] += self.bytes or 0
+        emit(record)
+        return False
+
+
+# Zamena za Stage kada je merenje isključeno; bytes i fields se mogu postaviti,
+# ali se nigde ne čitaju. Svaki poziv dobija svoju, jer faze iz više niti
+# upisuju u fields istovremeno.
+class NoopStage:
+    __slots__ = ('bytes', 'fields')
+
+    def __init__(self):
+        self.bytes = None
+        self.fields = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+# with metrics.stage('fetch', symbol='AAPL') as stage: ...; stage.bytes = len(body)
+def stage(name, **fields):
+    if not ENABLED:
+        return NoopStage()
+    return Stage(name, fields)
+
+
+# Dekorator Lambda handlera: označava hladan/topao poziv i na kraju ispisuje
+# ukupno trajanje, vršnu memoriju, status i zbir vremena po fazama
+def instrument(function_name):
+    def decorator(handler):
+        if not ENABLED:
+            return handler
+
+        @wraps(handler)
+        def wrapper(event, context):
+            global cold_start
+
+            with invocation_lock:
+                invocation.clear()
+                invocation.update({
+                    'function': function_name,
+                    'request_id': getattr(context, 'aws_request_id', None),
+                    'cold_start': cold_start,
+                })
+                cold_start = False
+
+            start = time.perf_counter()
+            status_code = None
+            try:
+                response = handler(event, context)
+                if isinstance(response, dict):
+                    status_code = response.get('statusCode')
+                return response
+            except Exception:
+                status_code = 500
+                raise
+            finally:
+                emit({
+                    'metric': 'invocation',
+                    'function': function_name,
+                    'request_id': invocation.get('request_id'),
+                    'cold_start': invocation.get('cold_start'),
+                    'seconds': round(time.perf_counter() - start, 6),
+                    'peak_rss_mb': round(peak_rss_bytes() / 2 ** 20, 1),
+                    'status_code': status_code,
+                    'remaining_ms': context.get_remaining_time_in_millis() if hasattr(context, 'get_remaining_time_in_millis') else None,
+                    'stages': invocation.get('stages', {}),
+                })
+
+        return wrapper
+    return decorator
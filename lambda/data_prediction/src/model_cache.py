@@ -0,0 +1,83 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Modeli ostaju u memoriji između toplih poziva iste Lambda instance
+MODEL_DIR = os.getenv('MODEL_CACHE_DIR', '/tmp/models')
+MAX_CACHE_BYTES = int(os.getenv('MODEL_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# model_key -> {'etag', 'model', 'size', 'path'}; najskorije korišćeni su na kraju
+cache = OrderedDict()
+cache_lock = threading.Lock()
+
+
+# Svaki model ima svoj direktorijum u /tmp, a fajl u njemu je nazvan po ETag-u
+def local_model_path(model_key, etag):
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', model_key)
+    return os.path.join(MODEL_DIR, name, etag)
+
+
+def cached_bytes():
+    return sum(entry['size'] for entry in cache.values())
+
+
+# Izbacivanje najdavnije korišćenih modela dok keš ne stane u budžet. Fajl u /tmp
+# ostaje, pa ponovno učitavanje preskače preuzimanje.
+def evict(max_bytes=None):
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    while len(cache) > 1 and cached_bytes() > max_bytes:
+        model_key, _ = cache.popitem(last=False)
+        print(f"Model {model_key} izbačen iz keša")
+
+
+def download_model(s3_client, bucket_name, model_key, etag):
+    model_local_path = local_model_path(model_key, etag)
+    if os.path.exists(model_local_path):
+        return model_local_path
+
+    model_dir = os.path.dirname(model_local_path)
+    os.makedirs(model_dir, exist_ok=True)
+    partial_path = f'{model_local_path}.part'
+    s3_client.download_file(bucket_name, model_key, partial_path)
+    os.replace(partial_path, model_local_path)
+    print(f"Model preuzet sa s3://{bucket_name}/{model_key}")
+
+    # Starije verzije istog modela više nisu potrebne
+    for file_name in os.listdir(model_dir):
+        path = os.path.join(model_dir, file_name)
+        if path != model_local_path:
+            os.remove(path)
+
+    return model_local_path
+
+
+# Vraća (model, cache_hit). HEAD zahtev proverava ETag, tako da se model ponovo
+# preuzima i učitava samo kada se objekat u S3 promenio.
+def get_model(s3_client, bucket_name, model_key, loader=None):
+    if loader is None:
+        import joblib
+        loader = joblib.load
+
+    etag = s3_client.head_object(Bucket=bucket_name, Key=model_key)['ETag'].strip('"')
+
+    with cache_lock:
+        entry = cache.get(model_key)
+        if entry is not None and entry['etag'] == etag:
+            cache.move_to_end(model_key)
+            return entry['model'], True
+
+    model_local_path = download_model(s3_client, bucket_name, model_key, etag)
+    model = loader(model_local_path)
+
+    with cache_lock:
+        cache[model_key] = {
+            'etag': etag,
+            'model': model,
+            'size': os.path.getsize(model_local_path),
+            'path': model_local_path,
+        }
+        cache.move_to_end(model_key)
+        evict()
+
+    return model, False
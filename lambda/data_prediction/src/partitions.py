@@ -0,0 +1,125 @@
+import io
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Čitanje particionisanog skupa (layout=partitioned u data_collection_and_processing).
+# Iz manifesta se biraju samo particije čiji se [min_date, max_date] preklapa sa
+# traženim opsegom, iz njih se čitaju samo potrebne kolone, a redovi izvan
+# opsega se odbacuju tek u graničnim particijama.
+
+# Particije se preuzimaju paralelno; unutardnevni skupovi imaju po fajl za svaki dan
+MAX_WORKERS = 16
+
+# Processed skup čuva početak bara kao 't' (epoch ms, int64), a cene, volumen i
+# feature-e kao float32. Stariji skupovi umesto 't' imaju YYYY-MM-DD kolonu
+# 'date' i float64 vrednosti, koje se pri čitanju svode na iste tipove.
+TIME_COLUMN = 't'
+DAY_MS = 24 * 60 * 60 * 1000
+CSV_DTYPES = defaultdict(lambda: 'float32', t='int64', date='object')
+
+
+def compact_dtypes(data):
+    return data.astype({column: 'float32' for column in data.columns if data[column].dtype == 'float64'})
+
+
+# Kolone koje skup zaista ima; čita se kolona vremena koju skup ima ('t' ili 'date')
+def present_columns(columns, available):
+    return [column for column in columns if column in available]
+
+
+def manifest_key(data_set, stock_symbol, multiplier, timespan):
+    return f'{data_set}/manifests/{stock_symbol}/{multiplier}_{timespan}.json'
+
+
+def is_manifest_key(key):
+    return '/manifests/' in key and key.endswith('.json')
+
+
+# Kompresija se prepoznaje po ekstenziji ključa (.gz, .zst)
+def compression_for(file_key):
+    if file_key.endswith('.gz'):
+        return 'gzip'
+    if file_key.endswith('.zst'):
+        return 'zstd'
+    return None
+
+
+# Datumi su YYYY-MM-DD stringovi, pa se porede leksički; None znači bez granice
+def select_partitions(manifest, from_date=None, to_date=None):
+    return [
+        partition for partition in manifest.get('partitions', [])
+        if (from_date is None or partition['max_date'] >= from_date)
+        and (to_date is None or partition['min_date'] <= to_date)
+    ]
+
+
+def read_processed(source, file_key, columns=None):
+    import pandas as pd
+
+    if file_key.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(source)
+        if columns is not None:
+            columns = present_columns(columns, parquet_file.schema_arrow.names)
+        return compact_dtypes(parquet_file.read(columns=columns).to_pandas())
+    wanted = None if columns is None else set(columns)
+    return pd.read_csv(
+        source, usecols=None if wanted is None else lambda column: column in wanted,
+        dtype=CSV_DTYPES, compression=compression_for(file_key)
+    )
+
+
+def read_partition(s3_client, bucket_name, file_key, columns=None):
+    body = s3_client.get_object(Bucket=bucket_name, Key=file_key)['Body'].read()
+    return read_processed(io.BytesIO(body), file_key, columns)
+
+
+def epoch_ms(day):
+    from datetime import datetime, timezone
+
+    return int(datetime.fromisoformat(day).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+# Granice opsega u koloni vremena skupa: datumi se porede leksički, a epoch
+# milisekunde obuhvataju ceo dan to_date
+def range_bounds(time_column, from_date, to_date):
+    if time_column == 'date':
+        return from_date, to_date
+    return (
+        epoch_ms(from_date) if from_date else None,
+        epoch_ms(to_date) + DAY_MS - 1 if to_date else None,
+    )
+
+
+def load_partitioned(s3_client, bucket_name, key, columns, from_date=None, to_date=None):
+    import pandas as pd
+
+    with metrics.stage('read_partitions', manifest_key=key) as stage:
+        manifest = json.loads(s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read())
+        selected = select_partitions(manifest, from_date, to_date)
+        stage.fields['partitions'] = len(selected)
+        stage.fields['pruned'] = len(manifest.get('partitions', [])) - len(selected)
+        stage.bytes = sum(partition['compressed_size'] for partition in selected)
+        if not selected:
+            raise ValueError(f"Nijedna particija u {key} nije u opsegu {from_date or '-'} - {to_date or '-'}")
+
+        time_column = manifest.get('time_column', 'date')
+        read_columns = None if columns is None else list(dict.fromkeys([time_column] + columns))
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(selected))) as executor:
+            frames = list(executor.map(
+                lambda partition: read_partition(s3_client, bucket_name, partition['key'], read_columns), selected
+            ))
+
+        data = pd.concat(frames, ignore_index=True)
+        low, high = range_bounds(time_column, from_date, to_date)
+        in_range = pd.Series(True, index=data.index)
+        if low is not None:
+            in_range &= data[time_column] >= low
+        if high is not None:
+            in_range &= data[time_column] <= high
+        columns = list(data.columns) if columns is None else present_columns(columns, data.columns)
+        return data.loc[in_range, columns].reset_index(drop=True)
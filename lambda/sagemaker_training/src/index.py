@@ -1,73 +1,379 @@
 import os
 import boto3
+import hashlib
 import json
 import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+from botocore.exceptions import ClientError
+import metrics
 
 sagemaker = boto3.client('sagemaker')
+s3 = boto3.client('s3')
 
-def handler(event, context):
-    s3_info = event['Records'][0]['s3']
-    bucket_name = s3_info['bucket']['name']
-    file_key = s3_info['object']['key']
+# Jedna slika koja trenira sve modele iz jednog preuzimanja podataka
+# (docker/multi_model). Ako nije podešena, pokreće se po jedan posao po modelu.
+MULTI_MODEL_IMAGE_URI = os.getenv('MULTI_MODEL_SAGEMAKER_IMAGE_URI')
+MULTI_MODEL_INSTANCE_TYPE = os.getenv('MULTI_MODEL_INSTANCE_TYPE', 'ml.m5.2xlarge')
+MODEL_INSTANCE_TYPE = 'ml.m5.large'
 
-    file_name = file_key.split("/")[-1]
-    unique_file_name = f'{file_name}_{uuid.uuid4()}'
-    cleaned_file_name = re.sub(r'[^a-zA-Z0-9-]', '-', unique_file_name)
-    
-    training_job_name_prefix = f'stock-data-training-{cleaned_file_name}'[:63]
+# Hiperparametri po modelu, prosleđuju se kontejneru kao env promenljive, npr.
+# {"random_forest": {"SEARCH_MODE": "walk_forward"}, "lstm": {"WINDOW_SIZE": "60"}}
+TRAINING_HYPERPARAMETERS = json.loads(os.getenv('TRAINING_HYPERPARAMETERS') or '{}')
+
+# Otisak poslednjeg pokrenutog posla za svaki model
+FINGERPRINTS_PREFIX = 'training/fingerprints/'
+# Manifest koji spaja više skupova iz jednog naleta upload-a. Nije ispod
+# training/manifests/, pa njegov upis ne pokreće ovu Lambdu ponovo.
+COMBINED_MANIFESTS_PREFIX = 'training/combined/manifests/'
+# Posao sa istim otiskom u ovim stanjima već ima ili upravo pravi model
+REUSABLE_JOB_STATUSES = ('InProgress', 'Completed')
+MAX_WORKERS = 16
+
+def is_manifest_key(file_key):
+    return '/manifests/' in file_key and file_key.endswith('.json')
+
+def load_manifest(bucket_name, file_key):
+    return json.loads(s3.get_object(Bucket=bucket_name, Key=file_key)['Body'].read())
+
+# JSON koji možda još ne postoji, ili None. Bez s3:ListBucket S3 za nepostojeći
+# ključ vraća 403 AccessDenied umesto 404, pa se i to čita kao da ga nema.
+MISSING_KEY_CODES = ('404', 'NoSuchKey', 'AccessDenied')
+
+def load_optional(bucket_name, file_key):
+    try:
+        return load_manifest(bucket_name, file_key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in MISSING_KEY_CODES:
+            return None
+        raise
+
+# training/processed/stock_data_AAPL_....csv.gz -> training/statistics/stock_data_AAPL_....csv.gz.json
+def stats_key(processed_key):
+    data_set, _, file_name = processed_key.partition('/processed/')
+    return f'{data_set}/statistics/{file_name}.json'
+
+# Podaci processed fajla iz JSON-a sa statistikama koji collection Lambda
+# upisuje uz njega: simbol, multiplier, timespan, opseg datuma i statistike
+def processed_file_info(bucket_name, file_key):
+    if '/processed/' not in file_key:
+        return {}
+    return load_optional(bucket_name, stats_key(file_key)) or {}
+
+# Skup kome ključ pripada, (data_set, simbol, multiplier, timespan, kolona
+# vremena), i particije nad kojima se trenira. Manifest particionisanog skupa
+# daje svoje particije; manifest inkrementalnog unosa sa fajl rasporedom ih
+# nema, a njegovi processed fajlovi već sami pokreću treniranje. Processed fajl
+# je jedna particija sa opsegom datuma i statistikama iz svog JSON-a. Fajl
+# upisan pre tih podataka je skup za sebe.
+def dataset_source(bucket_name, file_key):
+    data_set = file_key.split('/')[0]
+    if is_manifest_key(file_key):
+        manifest = load_manifest(bucket_name, file_key)
+        group = (data_set, manifest.get('stock_symbol'), manifest.get('multiplier'), manifest.get('timespan'), manifest.get('time_column', 'date'))
+        return group, manifest.get('partitions', [])
+
+    info = processed_file_info(bucket_name, file_key)
+    if 'timespan' not in info:
+        return ('file', file_key), [{'key': file_key}]
+    if not info['rows']:
+        return None, []
+    group = (data_set, info['stock_symbol'], info['multiplier'], info['timespan'], info['time_column'])
+    partition = {name: info[name] for name in ('rows', 'min_date', 'max_date', 'min_t', 'max_t', 'stats')}
+    return group, [{'key': file_key, **partition}]
+
+def content_type_for(file_key):
+    if file_key.endswith('.parquet'):
+        return 'application/vnd.apache.parquet'
+    if file_key.endswith('.json'):
+        return 'application/json'
+    return 'text/csv'
+
+def create_training_job(training_job_name, image_uri, bucket_name, file_key, output_name, instance_type, environment):
+    with metrics.stage('create_training_job', model=output_name, instance_type=instance_type):
+        return start_training_job(training_job_name, image_uri, bucket_name, file_key, output_name, instance_type, environment)
+
+def start_training_job(training_job_name, image_uri, bucket_name, file_key, output_name, instance_type, environment):
     s3_input_data = f's3://{bucket_name}/{file_key}'
+    content_type = content_type_for(file_key)
+
+    return sagemaker.create_training_job(
+        TrainingJobName=training_job_name,
+        AlgorithmSpecification={
+            'TrainingImage': image_uri,
+            'TrainingInputMode': 'File'
+        },
+        RoleArn=os.getenv('SAGEMAKER_ROLE_ARN'),
+        InputDataConfig=[
+            {
+                'ChannelName': 'training',
+                'DataSource': {
+                    'S3DataSource': {
+                        'S3DataType': 'S3Prefix',
+                        'S3Uri': s3_input_data,
+                        'S3DataDistributionType': 'FullyReplicated'
+                    }
+                },
+                'ContentType': content_type,
+                'InputMode': 'File'
+            }
+        ],
+        OutputDataConfig={
+            'S3OutputPath': f's3://{bucket_name}/model_output/{output_name}/'
+        },
+        ResourceConfig={
+            'InstanceType': instance_type,
+            'InstanceCount': 1,
+            'VolumeSizeInGB': 10
+        },
+        StoppingCondition={
+            'MaxRuntimeInSeconds': 3600
+        },
+        Environment={
+            'FILE_KEY': file_key,
+            'BUCKET_NAME': bucket_name,
+            **environment
+        }
+    )
 
-    models = {
+# Modeli bez podešene slike se ne treniraju
+def model_images():
+    images = {
         'linear_regression': os.getenv('LINEAR_REGRESSION_SAGEMAKER_IMAGE_URI'),
         'decision_tree': os.getenv('DECISION_TREE_REGRESSION_SAGEMAKER_IMAGE_URI'),
         'random_forest': os.getenv('RANDOM_FOREST_REGRESSION_SAGEMAKER_IMAGE_URI'),
         'lstm': os.getenv('LSTM_SAGEMAKER_IMAGE_URI'),
         'gru': os.getenv('GRU_SAGEMAKER_IMAGE_URI')
     }
-    
-    for model_name, image_uri in models.items():
-        training_job_name = f'{training_job_name_prefix}-{model_name}'
-        
-        response = sagemaker.create_training_job(
-            TrainingJobName=training_job_name,
-            AlgorithmSpecification={
-                'TrainingImage': image_uri,
-                'TrainingInputMode': 'File'
-            },
-            RoleArn=os.getenv('SAGEMAKER_ROLE_ARN'),
-            InputDataConfig=[
-                {
-                    'ChannelName': 'training',
-                    'DataSource': {
-                        'S3DataSource': {
-                            'S3DataType': 'S3Prefix',
-                            'S3Uri': s3_input_data,
-                            'S3DataDistributionType': 'FullyReplicated'
-                        }
-                    },
-                    'ContentType': 'text/csv',
-                    'InputMode': 'File'
-                }
-            ],
-            OutputDataConfig={
-                'S3OutputPath': f's3://{bucket_name}/model_output/{model_name}/'
-            },
-            ResourceConfig={
-                'InstanceType': 'ml.m5.large',
-                'InstanceCount': 1,
-                'VolumeSizeInGB': 10
-            },
-            StoppingCondition={
-                'MaxRuntimeInSeconds': 3600
-            },
-            Environment={
-                'FILE_KEY': file_key,
-                'BUCKET_NAME': bucket_name
-            }
+    return {model_name: image_uri for model_name, image_uri in images.items() if image_uri}
+
+def hyperparameters_for(model_name):
+    return {name: str(value) for name, value in TRAINING_HYPERPARAMETERS.get(model_name, {}).items()}
+
+# U zajedničkom poslu svih modela hiperparametri nose ime modela
+# (LSTM__WINDOW_SIZE), jer modeli mogu isto ime podesiti različito; multi_model
+# ih pre treniranja svakog modela vraća u obična imena
+def namespaced_hyperparameters(model_name):
+    return {f'{model_name.upper()}__{name}': value for name, value in hyperparameters_for(model_name).items()}
+
+# S3 događaj stiže direktno ili kroz SQS red, koji upload-e iz kratkog prozora
+# skuplja u jedan poziv (vidi CDK stek). Vraća (bucket, key) parove bez duplikata.
+def dataset_keys(event):
+    keys = []
+    for record in event.get('Records', []):
+        if 'body' in record:
+            keys.extend(dataset_keys(json.loads(record['body'])))
+        elif 's3' in record:
+            # Ključevi u S3 događaju su URL enkodovani (AAPL%3D -> AAPL=)
+            keys.append((record['s3']['bucket']['name'], unquote_plus(record['s3']['object']['key'])))
+    return list(dict.fromkeys(keys))
+
+def head_files(bucket_name, files):
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(files))) as executor:
+        return dict(zip(files, executor.map(lambda file_key: s3.head_object(Bucket=bucket_name, Key=file_key), files)))
+
+# Otisak sadržaja skupa: ETag i veličina svakog fajla, bez ključeva, jer svako
+# preuzimanje dobija novo ime fajla. Isti podaci daju iste bajtove (gzip se piše
+# sa mtime=0), pa i isti ETag.
+def dataset_digest(heads):
+    parts = sorted('{}:{}'.format(head['ETag'].strip('"'), head['ContentLength']) for head in heads)
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+# Dva preuzimanja istog opsega u jednom naletu daju dva fajla sa istim
+# barovima. Particije se ređaju po vremenu upload-a, a izostavlja se svaka čije
+# barove (min_t - max_t) ceo pokriva neki noviji upload. Barove koji se i dalje
+# preklapaju treneri čitaju jednom, iz particije koja je kasnije u manifestu.
+def drop_covered(partitions, heads):
+    ordered = sorted(partitions, key=lambda partition: heads[partition['key']]['LastModified'])
+    kept = []
+    for index, partition in enumerate(ordered):
+        covered = 'min_t' in partition and any(
+            'min_t' in newer and newer['min_t'] <= partition['min_t'] and partition['max_t'] <= newer['max_t']
+            for newer in ordered[index + 1:]
         )
-        
+        if not covered:
+            kept.append(partition)
+    return kept
+
+def job_fingerprint(dataset_digest_value, image_uri, instance_type, environment):
+    payload = json.dumps({
+        'dataset': dataset_digest_value,
+        'image': image_uri,
+        'instance_type': instance_type,
+        'environment': environment
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def fingerprint_key(output_name):
+    return f'{FINGERPRINTS_PREFIX}{output_name}.json'
+
+# Više ključeva istog skupa iz istog naleta treniraju se zajedno, preko
+# manifesta čije su particije njihovi fajlovi, po redosledu upload-a (vidi
+# drop_covered). Ima polja manifesta particionisanog skupa, pa trenerima
+# izgleda kao i svaki drugi.
+def save_combined_manifest(bucket_name, group, keys, partitions, dataset_digest_value):
+    _, stock_symbol, multiplier, timespan, time_column = group
+    combined_key = f'{COMBINED_MANIFESTS_PREFIX}{dataset_digest_value[:16]}.json'
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=combined_key,
+        Body=json.dumps({
+            'stock_symbol': stock_symbol,
+            'multiplier': multiplier,
+            'timespan': timespan,
+            'time_column': time_column,
+            'sources': keys,
+            'partitions': partitions
+        }),
+        ContentType='application/json'
+    )
+    return combined_key
+
+def training_jobs(file_key, dataset_digest_value):
+    if file_key.startswith(COMBINED_MANIFESTS_PREFIX):
+        file_name = f'combined-{dataset_digest_value[:12]}'
+    # training/manifests/AAPL/1_hour.json -> AAPL_1_hour.json
+    elif is_manifest_key(file_key):
+        file_name = '_'.join(file_key.split("/")[-2:])
+    else:
+        file_name = file_key.split("/")[-1]
+    unique_file_name = f'{file_name}_{uuid.uuid4()}'
+    cleaned_file_name = re.sub(r'[^a-zA-Z0-9-]', '-', unique_file_name)
+
+    training_job_name_prefix = f'stock-data-training-{cleaned_file_name}'[:63]
+
+    models = model_images()
+
+    # Jedan kontejner, jedno preuzimanje skupa, modeli se treniraju paralelno
+    if MULTI_MODEL_IMAGE_URI:
+        environment = {'MODELS': ','.join(models)}
+        for model_name in models:
+            environment.update(namespaced_hyperparameters(model_name))
+        jobs = [(f'{training_job_name_prefix}-all', MULTI_MODEL_IMAGE_URI, 'multi_model', MULTI_MODEL_INSTANCE_TYPE, environment)]
+    else:
+        jobs = [
+            (f'{training_job_name_prefix}-{model_name}', image_uri, model_name, MODEL_INSTANCE_TYPE, hyperparameters_for(model_name))
+            for model_name, image_uri in models.items()
+        ]
+
+    return [
+        {
+            'training_job_name': training_job_name,
+            'image_uri': image_uri,
+            'file_key': file_key,
+            'output_name': output_name,
+            'instance_type': instance_type,
+            'environment': environment,
+            'fingerprint': job_fingerprint(dataset_digest_value, image_uri, instance_type, environment)
+        }
+        for training_job_name, image_uri, output_name, instance_type, environment in jobs
+    ]
+
+# Posao se preskače ako je poslednji posao istog modela imao isti otisak i
+# završio se ili još traje. Neuspeli ili zaustavljeni poslovi se ponavljaju.
+def already_trained(bucket_name, job):
+    previous = load_optional(bucket_name, fingerprint_key(job['output_name']))
+    if previous is None or previous.get('fingerprint') != job['fingerprint']:
+        return False
+
+    try:
+        status = sagemaker.describe_training_job(TrainingJobName=previous['training_job_name'])['TrainingJobStatus']
+    except Exception as e:
+        print(f"Status posla {previous['training_job_name']} nije dostupan: {e}")
+        return False
+    return status in REUSABLE_JOB_STATUSES
+
+def submit_training_job(bucket_name, job):
+    if already_trained(bucket_name, job):
+        return 'skipped'
+
+    create_training_job(
+        job['training_job_name'],
+        job['image_uri'],
+        bucket_name,
+        job['file_key'],
+        job['output_name'],
+        job['instance_type'],
+        job['environment']
+    )
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=fingerprint_key(job['output_name']),
+        Body=json.dumps({
+            'fingerprint': job['fingerprint'],
+            'training_job_name': job['training_job_name'],
+            'file_key': job['file_key'],
+            'image_uri': job['image_uri'],
+            'created_at': datetime.now(timezone.utc).isoformat()
+        }),
+        ContentType='application/json'
+    )
+    return 'submitted'
+
+# Ključevi iz naleta se grupišu po skupu: svaka grupa je jedan trening, jer
+# fajlovi različitih simbola ili timespan-ova ne čine jedan vremenski niz
+def train_datasets(bucket_name, keys):
+    with metrics.stage('resolve_datasets', datasets=len(keys)) as stage:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(keys))) as executor:
+            sources = list(executor.map(lambda file_key: dataset_source(bucket_name, file_key), keys))
+        groups = {}
+        for file_key, (group, partitions) in zip(keys, sources):
+            if partitions:
+                groups.setdefault(group, []).append((file_key, partitions))
+        stage.fields['groups'] = len(groups)
+
+    return [train_group(bucket_name, group, members) for group, members in groups.items()]
+
+def train_group(bucket_name, group, members):
+    keys = [file_key for file_key, _ in members]
+    partitions = list({
+        partition['key']: partition for _, group_partitions in members for partition in group_partitions
+    }.values())
+    files = [partition['key'] for partition in partitions]
+
+    with metrics.stage('dataset_digest', files=len(files)) as stage:
+        heads = head_files(bucket_name, files)
+        if len(keys) > 1:
+            partitions = drop_covered(partitions, heads)
+            stage.fields['dropped'] = len(files) - len(partitions)
+        dataset_digest_value = dataset_digest([heads[partition['key']] for partition in partitions])
+
+    file_key = keys[0] if len(keys) == 1 else save_combined_manifest(bucket_name, group, keys, partitions, dataset_digest_value)
+    jobs = training_jobs(file_key, dataset_digest_value)
+
+    # Poslovi se prijavljuju paralelno, svaki je jedan CreateTrainingJob poziv;
+    # bez podešenih slika nema poslova
+    with ThreadPoolExecutor(max_workers=max(len(jobs), 1)) as executor:
+        outcomes = list(executor.map(lambda job: submit_training_job(bucket_name, job), jobs))
+
+    return {
+        'datasets': keys,
+        'file_key': file_key,
+        'dataset_digest': dataset_digest_value,
+        'submitted': [job['training_job_name'] for job, outcome in zip(jobs, outcomes) if outcome == 'submitted'],
+        'skipped': [job['output_name'] for job, outcome in zip(jobs, outcomes) if outcome == 'skipped']
+    }
+
+@metrics.instrument('sagemaker_training')
+def handler(event, context):
+    keys_by_bucket = {}
+    for bucket_name, file_key in dataset_keys(event):
+        keys_by_bucket.setdefault(bucket_name, []).append(file_key)
+
+    runs = [run for bucket_name, keys in keys_by_bucket.items() for run in train_datasets(bucket_name, keys)]
+    submitted = sum(len(run['submitted']) for run in runs)
+    skipped = sum(len(run['skipped']) for run in runs)
+
+    if not runs:
+        message = 'Nema novih podataka za treniranje, treniranje se ne pokreće.'
+    else:
+        message = f'Pokrenuto poslova: {submitted}, preskočeno (isti podaci i podešavanja): {skipped}.'
+
     return {
         'statusCode': 200,
-        'body': json.dumps(f'Training jobs created successfully for multiple models!')
+        'body': json.dumps({'message': message, 'runs': runs})
     }
@@ -6,6 +6,8 @@ import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as apigateway from 'aws-cdk-lib/aws-apigateway';
 import * as iam from "aws-cdk-lib/aws-iam";
 import * as s3n from 'aws-cdk-lib/aws-s3-notifications';
+import * as sqs from 'aws-cdk-lib/aws-sqs';
+import { SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources';
 
 export type StockDataStackProps = {
   lambdasMemory: number;
@@ -106,11 +108,32 @@ export class StockDataCdkStack extends cdk.Stack {
       ],
       resources: ['*']
     }));
+    // Includes s3:ListBucket, so a fingerprint or statistics file not written yet is a 404, not a 403
+    bucket.grantReadWrite(sagemakerLambda);
 
-    bucket.addEventNotification(s3.EventType.OBJECT_CREATED_PUT, new s3n.LambdaDestination(sagemakerLambda), {
+    const trainingTriggerQueue = new sqs.Queue(this, 'TrainingTriggerQueue', {
+      visibilityTimeout: cdk.Duration.seconds(720),
+      retentionPeriod: cdk.Duration.days(1),
+    });
+
+    // Every way an object is created: processed files written by the stream and
+    // compressed writers end with CompleteMultipartUpload once they outgrow one
+    // part, not with a PUT
+    bucket.addEventNotification(s3.EventType.OBJECT_CREATED, new s3n.SqsDestination(trainingTriggerQueue), {
       prefix: 'training/processed/',
     });
 
+    bucket.addEventNotification(s3.EventType.OBJECT_CREATED, new s3n.SqsDestination(trainingTriggerQueue), {
+      prefix: 'training/manifests/',
+      suffix: '.json',
+    });
+
+    sagemakerLambda.addEventSource(new SqsEventSource(trainingTriggerQueue, {
+      batchSize: 100,
+      maxBatchingWindow: cdk.Duration.seconds(60),
+      maxConcurrency: 2,
+    }));
+
     const stockDataApi = new apigateway.RestApi(this, 'StockDataApi', {
       restApiName: 'Stock Data Service',
       description: 'API Gateway for trigerring Collection and Processing Lambda function',
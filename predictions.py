@@ -1,3 +1,6 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -21,11 +24,65 @@ bucket_name = 'stock-data-607282882839-us-east-1'
 predictions_file_key = 'predictions/predictions_1a2cba20-8f22-42f9-9793-b2c41b652337.csv'
 actuals_file_key = 'actuals/actuals_39d793b2-485d-493c-b36f-9b4ba84f6b7a.csv'
 
+# Stvarne vrednosti mogu doći i iz particionisanog skupa (layout=partitioned):
+# zadaje se manifest simbola i timespan-a, a čitaju se samo particije u opsegu
+# datuma predikcija (ili u opsegu from_date - to_date, ako je zadat)
+#actuals_manifest_key = 'test/manifests/AAPL/1_week.json'
+actuals_manifest_key = None
+from_date = None
+to_date = None
+
+# Kompresija se prepoznaje po ekstenziji ključa (.gz, .zst)
+def compression_for(file_key):
+    if file_key.endswith('.gz'):
+        return 'gzip'
+    if file_key.endswith('.zst'):
+        return 'zstd'
+    return None
+
 # Funkcija za preuzimanje CSV fajla sa S3
 def download_csv_from_s3(bucket_name, file_key):
     s3_client = boto3.client('s3')
     obj = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-    return pd.read_csv(obj['Body'])
+    return pd.read_csv(obj['Body'], compression=compression_for(file_key))
+
+# Particije čiji se [min_date, max_date] preklapa sa opsegom; datumi su YYYY-MM-DD
+def select_partitions(manifest, from_date=None, to_date=None):
+    return [
+        partition for partition in manifest.get('partitions', [])
+        if (from_date is None or partition['max_date'] >= from_date)
+        and (to_date is None or partition['min_date'] <= to_date)
+    ]
+
+def read_partition(s3_client, bucket_name, file_key, columns):
+    body = s3_client.get_object(Bucket=bucket_name, Key=file_key)['Body'].read()
+    if file_key.endswith('.parquet'):
+        return pd.read_parquet(io.BytesIO(body), columns=columns)
+    return pd.read_csv(io.BytesIO(body), usecols=columns, dtype={'t': 'int64'}, compression=compression_for(file_key))
+
+# Funkcija za preuzimanje opsega datuma iz particionisanog skupa. Vreme bara je
+# u koloni 't' (epoch ms) ili, kod starijih particija, u YYYY-MM-DD koloni
+# 'date'; rezultat ga uvek ima kao 'date'.
+def download_partitioned_from_s3(bucket_name, manifest_key, columns, from_date=None, to_date=None):
+    s3_client = boto3.client('s3')
+    manifest = json.loads(s3_client.get_object(Bucket=bucket_name, Key=manifest_key)['Body'].read())
+    selected = select_partitions(manifest, from_date, to_date)
+    print(f"Čitanje {len(selected)} od {len(manifest.get('partitions', []))} particija")
+
+    time_column = manifest.get('time_column', 'date')
+    read_columns = [time_column] + columns
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        frames = list(executor.map(lambda partition: read_partition(s3_client, bucket_name, partition['key'], read_columns), selected))
+    data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=read_columns)
+    if time_column == 't':
+        data['date'] = pd.to_datetime(data.pop('t').astype('int64'), unit='ms')
+    dates = pd.to_datetime(data['date']).dt.strftime('%Y-%m-%d')
+    in_range = pd.Series(True, index=data.index)
+    if from_date:
+        in_range &= dates >= from_date
+    if to_date:
+        in_range &= dates <= to_date
+    return data.loc[in_range, ['date'] + columns].reset_index(drop=True)
 
 # Funkcija za evaluaciju modela
 def evaluate_model(actuals, predictions):
@@ -42,7 +99,14 @@ def evaluate_model(actuals, predictions):
 
 # Preuzimanje podataka sa S3
 predictions_df = download_csv_from_s3(bucket_name, predictions_file_key)
-actuals_df = download_csv_from_s3(bucket_name, actuals_file_key)
+if actuals_manifest_key:
+    # Predikcije nose pun timestamp bara, a opseg particija je u danima
+    actuals_df = download_partitioned_from_s3(
+        bucket_name, actuals_manifest_key, ['close'],
+        from_date or str(predictions_df['date'].min())[:10], to_date or str(predictions_df['date'].max())[:10]
+    )
+else:
+    actuals_df = download_csv_from_s3(bucket_name, actuals_file_key)
 
 # Konvertujte 'date' kolonu u datetime format
 predictions_df['date'] = pd.to_datetime(predictions_df['date'])
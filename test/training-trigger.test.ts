@@ -0,0 +1,27 @@
+import * as cdk from 'aws-cdk-lib';
+import { Template } from 'aws-cdk-lib/assertions';
+import { StockDataCdkStack } from '../lib/stock-data-cdk-stack';
+
+// Processed files are written by the stream and compressed (gzip/zstd) writers,
+// which switch to a multipart upload once a file outgrows one part, so the
+// training trigger has to fire on CompleteMultipartUpload as well as on PUT
+test('Training trigger covers multipart processed uploads', () => {
+  const app = new cdk.App();
+  const stack = new StockDataCdkStack(app, 'TestStack', {
+    env: { account: '123456789012', region: 'us-east-1' },
+    lambdasMemory: 1024,
+  });
+  const template = Template.fromStack(stack);
+
+  const notifications = Object.values(template.findResources('Custom::S3BucketNotifications'));
+  expect(notifications).toHaveLength(1);
+  const queueConfigurations = notifications[0].Properties.NotificationConfiguration.QueueConfigurations;
+
+  const prefixes = queueConfigurations.map((configuration: any) =>
+    configuration.Filter.Key.FilterRules.find((rule: any) => rule.Name === 'prefix').Value);
+  expect(prefixes.sort()).toEqual(['training/manifests/', 'training/processed/']);
+
+  for (const configuration of queueConfigurations) {
+    expect(configuration.Events).toEqual(['s3:ObjectCreated:*']);
+  }
+});
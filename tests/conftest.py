@@ -0,0 +1,13 @@
+import os
+import sys
+
+# The Lambdas and trainers are loaded from their src directories the way the
+# benchmarks do it (benchmarks/common.py), and the tests share the benchmarks'
+# stand-ins for S3, SageMaker and synthetic data
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+if BENCHMARKS_DIR not in sys.path:
+    sys.path.insert(0, BENCHMARKS_DIR)
+
+# The Lambdas read their configuration at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('METRICS_ENABLED', '0')
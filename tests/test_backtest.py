@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from common import load_source
+from synthetic import processed_frame
+
+backtest = load_source('backtest', 'backtest.py')
+
+
+def test_walk_forward_folds():
+    train_start, train_end, test_end = backtest.walk_forward_folds(10, 4, 2, 2)
+    np.testing.assert_array_equal(train_start, [0, 2, 4])
+    np.testing.assert_array_equal(train_end, [4, 6, 8])
+    np.testing.assert_array_equal(test_end, [6, 8, 10])
+    train_start, _, _ = backtest.walk_forward_folds(10, 4, 2, 2, expanding=True)
+    np.testing.assert_array_equal(train_start, [0, 0, 0])
+
+
+@pytest.mark.parametrize('train_window, test_window, step', [(0, 2, 2), (4, 0, 2), (4, 2, 0), (-1, 2, 2)])
+def test_empty_windows_and_steps_are_rejected(train_window, test_window, step):
+    with pytest.raises(ValueError):
+        backtest.walk_forward_folds(10, train_window, test_window, step)
+
+
+@pytest.mark.parametrize('argument', ['--train-window', '--test-window', '--step', '--refit-every'])
+def test_cli_rejects_values_below_one(argument, monkeypatch):
+    arguments = {'--train-window': '4', '--test-window': '2', argument: '0'}
+    monkeypatch.setattr('sys.argv', ['backtest.py', '--dataset', 'data.csv', *[item for pair in arguments.items() for item in pair]])
+    with pytest.raises(SystemExit) as exit_info:
+        backtest.main()
+    assert exit_info.value.code == 2
+
+
+# Per-fold reference: least squares on each training window, metrics from the
+# fold's own test rows
+def reference_folds(X, y, train_start, train_end, test_end):
+    metrics = {name: [] for name in ('rmse', 'mae', 'r2', 'directional_accuracy')}
+    for start, end, stop in zip(train_start, train_end, test_end):
+        design = np.hstack([np.ones((end - start, 1)), X[start:end]])
+        coef, *_ = np.linalg.lstsq(design, y[start:end], rcond=None)
+        predicted = coef[0] + X[end:stop] @ coef[1:]
+        actual, previous = y[end:stop], y[end - 1:stop - 1]
+        errors = predicted - actual
+        metrics['rmse'].append(np.sqrt(np.mean(errors ** 2)))
+        metrics['mae'].append(np.mean(np.abs(errors)))
+        metrics['r2'].append(1 - np.sum(errors ** 2) / np.sum((actual - actual.mean()) ** 2))
+        metrics['directional_accuracy'].append(np.mean(np.sign(predicted - previous) == np.sign(actual - previous)))
+    return metrics
+
+
+@pytest.mark.parametrize('expanding', [False, True])
+def test_linear_folds_match_per_fold_least_squares(expanding):
+    data = processed_frame(600, seed=3)
+    X = data[backtest.feature_columns(data)].to_numpy(dtype=np.float64)
+    y = data[backtest.TARGET_COLUMN].to_numpy(dtype=np.float64)
+    train_start, train_end, test_end = backtest.walk_forward_folds(len(X), 200, 20, 30, expanding)
+
+    intercept, weights = backtest.fit_linear_folds(X, y, train_start, train_end)
+    for fold, (start, end) in enumerate(zip(train_start, train_end)):
+        design = np.hstack([np.ones((end - start, 1)), X[start:end]])
+        coef, *_ = np.linalg.lstsq(design, y[start:end], rcond=None)
+        np.testing.assert_allclose(intercept[fold] + X[start:end] @ weights[fold], design @ coef, rtol=1e-7)
+
+    folds, _ = backtest.run_backtest(data, LinearRegression(), 200, 20, 30, expanding)
+    expected = reference_folds(X, y, train_start, train_end, test_end)
+    assert folds['rows'].tolist() == [20] * len(train_end)
+    for name, values in expected.items():
+        np.testing.assert_allclose(folds[name], values, rtol=1e-6, err_msg=name)
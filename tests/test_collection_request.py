@@ -0,0 +1,26 @@
+import json
+
+import pytest
+
+from common import api_event, load_source
+from local_s3 import LocalS3
+
+
+@pytest.fixture(scope='module')
+def collection(tmp_path_factory):
+    s3 = LocalS3(str(tmp_path_factory.mktemp('s3')))
+    return load_source('collection_index', 'lambda/data_collection_and_processing/src/index.py', s3)
+
+
+# Invalid options are rejected before anything is fetched from Polygon
+@pytest.mark.parametrize('body, message', [
+    ({'output_format': 'orc'}, 'Nepodržan format'),
+    ({'layout': 'daily'}, 'Nepodržan raspored'),
+    ({'codec': 'brotli'}, 'Nepodržan codec'),
+    ({'output_format': 'parquet', 'compression': 'snappy'}, 'Nepodržana kompresija'),
+    ({'features': {'sma': [0]}}, 'Neispravan feature set'),
+])
+def test_invalid_request_is_rejected(collection, body, message):
+    response = collection.handler(api_event(body), None)
+    assert response['statusCode'] == 400
+    assert json.loads(response['body']).startswith(message)
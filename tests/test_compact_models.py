@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from common import load_source
+from synthetic import FEATURE_COLUMNS, processed_frame
+
+compact_model = load_source('compact_model', 'lambda/data_prediction/src/compact_model.py')
+
+TRAINERS = {
+    'linear_regression': 'docker/linear_regression/src/train.py',
+    'decision_tree': 'docker/decision_tree_regression/src/train.py',
+    'random_forest': 'docker/random_forest_regression/src/train.py',
+}
+
+
+@pytest.fixture(scope='module')
+def data():
+    return processed_frame(1500, seed=1), processed_frame(3000, seed=2)
+
+
+# The prediction Lambda's NumPy evaluation of an exported model gives the
+# predictions of the scikit-learn model it came from
+@pytest.mark.parametrize('name', list(TRAINERS))
+def test_compact_model_matches_sklearn(name, data, tmp_path):
+    train_data, test_data = data
+    trainer = load_source(f'{name}_train', TRAINERS[name])
+    model = trainer.fit_model(train_data[FEATURE_COLUMNS], train_data['close'])
+    if hasattr(model, 'n_jobs'):
+        model.n_jobs = 1
+    path = str(tmp_path / f'{name}.compact')
+    trainer.export_compact_model(model, path)
+    loaded = compact_model.load(path)
+
+    expected = model.predict(test_data[FEATURE_COLUMNS])
+    assert loaded.feature_names == FEATURE_COLUMNS
+    np.testing.assert_allclose(loaded.predict(test_data[FEATURE_COLUMNS]), expected, rtol=1e-9, atol=1e-9)
+    # Columns are taken by name from a DataFrame, in any order
+    np.testing.assert_allclose(loaded.predict(test_data[FEATURE_COLUMNS[::-1]]), expected, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(loaded.predict(test_data[FEATURE_COLUMNS].to_numpy()), expected, rtol=1e-9, atol=1e-9)
+
+    with pytest.raises(ValueError):
+        loaded.predict(test_data[FEATURE_COLUMNS].to_numpy()[:, 1:])
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common import load_source
+
+evaluate = load_source('evaluate', 'evaluate.py')
+
+
+def test_summarize_runs():
+    runs = pd.DataFrame({
+        'run': ['a', 'a', 'a', 'b', 'b'],
+        'date': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-01', '2024-01-02']),
+        'predicted': [1.0, 2.5, 2.0, 5.0, np.nan],
+        'actual': [1.0, 2.0, 3.0, 4.0, 4.5],
+    })
+    summary = evaluate.summarize(runs).set_index('run')
+    assert list(summary.columns) == evaluate.SUMMARY_COLUMNS[1:]
+    assert summary.loc['a', 'rows'] == 3
+    assert summary.loc['a', 'mse'] == pytest.approx((0.25 + 1.0) / 3)
+    assert summary.loc['a', 'directional_accuracy'] == pytest.approx(0.5)
+    assert summary.loc['b', 'rows'] == 1
+    assert summary.loc['b', 'unmatched_actuals'] == 1
+
+
+# load_runs returns an empty frame when no prediction pairs with its actuals
+def test_summarize_without_runs():
+    summary = evaluate.summarize(pd.DataFrame(columns=['run', 'date', 'predicted', 'actual']))
+    assert summary.empty
+    assert list(summary.columns) == evaluate.SUMMARY_COLUMNS
+
+
+def test_cli_on_empty_bucket(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr('sys.argv', ['evaluate.py', '--bucket', 'empty', '--local-s3', str(tmp_path), '--output', str(tmp_path / 'summary.csv')])
+    evaluate.main()
+    assert '0 parova' in capsys.readouterr().out
+    assert list(pd.read_csv(tmp_path / 'summary.csv').columns) == evaluate.SUMMARY_COLUMNS
@@ -0,0 +1,75 @@
+import json
+
+import pandas as pd
+import pytest
+
+from common import api_event, load_source
+from fake_polygon import FakePolygon
+from local_s3 import LocalS3
+
+BUCKET = 'stock-data-test'
+
+
+@pytest.fixture
+def collection(tmp_path, monkeypatch):
+    with FakePolygon() as polygon:
+        monkeypatch.setenv('POLYGON_API_URL', polygon.url)
+        monkeypatch.setenv('POLYGON_API_KEY', 'test')
+        monkeypatch.setenv('S3_BUCKET', BUCKET)
+        s3 = LocalS3(str(tmp_path))
+        yield load_source('collection_incremental', 'lambda/data_collection_and_processing/src/index.py', s3), s3, polygon
+
+
+def manifest_of(s3):
+    key = 'training/manifests/SYM0/1_minute.json'
+    return json.loads(s3.get_object(Bucket=BUCKET, Key=key)['Body'].read())
+
+
+# Five days of minute bars are 7200 bars: more than Polygon's default page of
+# 5000, and four pages of the requested 2000, without a stream request. The
+# stored range has to hold all of them, since it is never fetched again.
+def test_incremental_range_is_fetched_through_every_page(collection):
+    handler, s3, polygon = collection
+    body = {'stock_symbol': 'SYM0', 'timespan': 'minute', 'from': '2024-01-02', 'to': '2024-01-06', 'incremental': True, 'limit': 2000}
+
+    response = handler.handler(api_event(body), None)
+    assert response['statusCode'] == 200
+    result = json.loads(response['body'])
+    assert [(item['from'], item['to']) for item in result['ranges']] == [('2024-01-02', '2024-01-06')]
+    assert result['ranges'][0]['pages'] == 4
+    # The first 13 bars are the indicators' warm-up
+    assert result['rows'] == 7200 - 13
+    assert manifest_of(s3)['ranges'][0]['rows'] == 7200 - 13
+
+    requests = polygon.requests
+    response = handler.handler(api_event(body), None)
+    assert json.loads(response['body'])['ranges'] == []
+    assert polygon.requests == requests
+
+
+# [a, b] and then [b, c] continue every indicator from the saved state: the
+# rows of both runs are the rows of a single [a, c] ingest, warm-up included
+@pytest.mark.parametrize('features', [None, {
+    'sma': [5, 14, 50], 'ema': [12, 26], 'rsi': [14], 'volatility': [14, 30], 'macd': [[12, 26, 9]],
+    'bollinger': [[20, 2]], 'atr': [14], 'obv': True, 'vwap': [20], 'stochastic': [[14, 3]],
+}])
+def test_incremental_ranges_match_single_ingest(collection, features):
+    handler, s3, _ = collection
+    training_data = load_source('training_data', 'docker/shared/training_data.py')
+
+    def ingest(from_date, to_date, **options):
+        body = {'stock_symbol': 'SYM0', 'timespan': 'minute', 'from': from_date, 'to': to_date, 'features': features, **options}
+        response = handler.handler(api_event(body), None)
+        assert response['statusCode'] == 200
+        return json.loads(response['body'])
+
+    ingest('2024-01-02', '2024-01-03', incremental=True)
+    second = ingest('2024-01-03', '2024-01-05', incremental=True)
+    assert [(item['from'], item['to']) for item in second['ranges']] == [('2024-01-04', '2024-01-05')]
+    incremental = pd.concat([
+        training_data.load_dataset(s3, BUCKET, item['processed_file']) for item in manifest_of(s3)['ranges']
+    ], ignore_index=True)
+
+    single = ingest('2024-01-02', '2024-01-05', data_set='reference', stream=True)
+    expected = training_data.load_dataset(s3, BUCKET, single['processed_file_key'])
+    pd.testing.assert_frame_equal(incremental, expected, check_exact=False, rtol=1e-6)
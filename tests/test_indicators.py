@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common import load_source
+from synthetic import ohlcv_arrays
+
+indicators = load_source('indicators', 'lambda/data_collection_and_processing/src/indicators.py')
+
+
+# The pandas indicators the collection Lambda used before compute_features
+def calculate_sma(data, window):
+    return data['close'].rolling(window=window).mean()
+
+def calculate_ema(data, window):
+    return data['close'].ewm(span=window, adjust=False).mean()
+
+def calculate_rsi(data, window):
+    delta = data['close'].diff(1)
+    gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+def calculate_volatility(data, window):
+    return data['close'].rolling(window=window).std()
+
+
+def expected_columns(data):
+    return {
+        'sma_14': calculate_sma(data, 14).to_numpy(),
+        'ema_14': calculate_ema(data, 14).to_numpy(),
+        'rsi': calculate_rsi(data, 14).to_numpy(),
+        'volatility': calculate_volatility(data, 14).to_numpy(),
+    }
+
+
+def assert_columns_match(actual, expected):
+    assert list(actual) == list(expected)
+    for column, values in expected.items():
+        np.testing.assert_allclose(actual[column], values, rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=column)
+
+
+@pytest.fixture(scope='module')
+def bars():
+    arrays = ohlcv_arrays(3000, seed=7)
+    return pd.DataFrame({column: arrays[column] for column in ['open', 'high', 'low', 'close', 'volume']})
+
+
+def test_default_features_match_pandas(bars):
+    columns, _ = indicators.compute_features(bars)
+    assert_columns_match(columns, expected_columns(bars))
+
+
+# Chunks continue from the state of the previous chunk, including chunks
+# shorter than the window and an empty one
+@pytest.mark.parametrize('bounds', [[1000, 2000], [5, 13, 14, 600, 600, 2999]])
+def test_chunked_features_match_pandas(bars, bounds):
+    state = None
+    chunks = []
+    for start, end in zip([0] + bounds, bounds + [len(bars)]):
+        columns, state = indicators.compute_features(bars.iloc[start:end], state=state)
+        chunks.append(columns)
+    combined = {column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]}
+    assert_columns_match(combined, expected_columns(bars))
+
+
+# State saved before feature sets existed ({'window', 'closes', 'ema'}) continues
+# the same series
+def test_legacy_state_continues_series(bars):
+    head, tail = bars.iloc[:500], bars.iloc[500:]
+    _, state = indicators.compute_features(head)
+    legacy = {'window': 14, 'closes': state['bars']['close'], 'ema': state['ema']['14']}
+    columns, _ = indicators.compute_features(tail, state=legacy)
+    expected = {column: values[500:] for column, values in expected_columns(bars).items()}
+    assert_columns_match(columns, expected)
+
+
+# The feature set of the README example: every indicator, several windows
+FULL_FEATURES = {
+    'sma': [5, 14, 50], 'ema': [12, 26], 'rsi': [14], 'volatility': [14, 30], 'macd': [[12, 26, 9]],
+    'bollinger': [[20, 2]], 'atr': [14], 'obv': True, 'vwap': [20], 'stochastic': [[14, 3]],
+}
+
+
+def calculate_macd(data, fast, slow, signal):
+    line = calculate_ema(data, fast) - calculate_ema(data, slow)
+    signal_line = line.ewm(span=signal, adjust=False).mean()
+    return line, signal_line, line - signal_line
+
+def calculate_bollinger(data, window, num_std):
+    middle = calculate_sma(data, window)
+    spread = num_std * calculate_volatility(data, window)
+    return middle + spread, middle - spread
+
+def calculate_atr(data, window):
+    previous = data['close'].shift(1).fillna(data['close'])
+    true_range = pd.concat([
+        data['high'] - data['low'], (data['high'] - previous).abs(), (data['low'] - previous).abs()
+    ], axis=1).max(axis=1)
+    return true_range.rolling(window=window).mean()
+
+def calculate_obv(data):
+    return (np.sign(data['close'].diff(1).fillna(0)) * data['volume']).cumsum()
+
+def calculate_vwap(data, window):
+    typical = (data['high'] + data['low'] + data['close']) / 3
+    return (typical * data['volume']).rolling(window=window).sum() / data['volume'].rolling(window=window).sum()
+
+def calculate_stochastic(data, window, smoothing):
+    highest = data['high'].rolling(window=window).max()
+    lowest = data['low'].rolling(window=window).min()
+    k = (100 * (data['close'] - lowest) / (highest - lowest)).where(highest != lowest, 50.0).where(highest.notna())
+    return k, k.rolling(window=smoothing).mean()
+
+
+def expected_full_columns(data):
+    macd, macd_signal, macd_hist = calculate_macd(data, 12, 26, 9)
+    upper, lower = calculate_bollinger(data, 20, 2)
+    stoch_k, stoch_d = calculate_stochastic(data, 14, 3)
+    columns = {
+        'sma_5': calculate_sma(data, 5), 'sma_14': calculate_sma(data, 14), 'sma_50': calculate_sma(data, 50),
+        'ema_12': calculate_ema(data, 12), 'ema_26': calculate_ema(data, 26),
+        'rsi': calculate_rsi(data, 14),
+        'volatility': calculate_volatility(data, 14), 'volatility_30': calculate_volatility(data, 30),
+        'macd_12_26_9': macd, 'macd_signal_12_26_9': macd_signal, 'macd_hist_12_26_9': macd_hist,
+        'bollinger_upper_20_2': upper, 'bollinger_lower_20_2': lower,
+        'atr_14': calculate_atr(data, 14),
+        'obv': calculate_obv(data),
+        'vwap_20': calculate_vwap(data, 20),
+        'stoch_k_14_3': stoch_k, 'stoch_d_14_3': stoch_d,
+    }
+    return {column: values.to_numpy() for column, values in columns.items()}
+
+
+# None is one pass; otherwise the bars are split at the bounds and every chunk
+# continues from the previous chunk's state, including chunks shorter than the
+# longest window and an empty one
+@pytest.mark.parametrize('bounds', [None, [1500], [3, 20, 49, 50, 50, 777, 2990]])
+def test_full_feature_set_matches_pandas(bars, bounds):
+    if bounds is None:
+        combined, _ = indicators.compute_features(bars, FULL_FEATURES)
+    else:
+        state = None
+        chunks = []
+        for start, end in zip([0] + bounds, bounds + [len(bars)]):
+            columns, state = indicators.compute_features(bars.iloc[start:end], FULL_FEATURES, state)
+            chunks.append(columns)
+        combined = {column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]}
+    expected = expected_full_columns(bars)
+    assert list(combined) == list(expected)
+    for column, values in expected.items():
+        # OBV is a running sum of volumes in the millions
+        np.testing.assert_allclose(combined[column], values, rtol=1e-9, atol=1e-6, equal_nan=True, err_msg=column)
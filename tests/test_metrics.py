@@ -0,0 +1,51 @@
+import os
+import importlib.util
+
+from common import REPO_ROOT
+
+COPIES = [
+    'lambda/data_collection_and_processing/src/metrics.py',
+    'lambda/data_prediction/src/metrics.py',
+    'lambda/sagemaker_training/src/metrics.py',
+]
+
+
+def load_metrics(monkeypatch, enabled):
+    monkeypatch.setenv('METRICS_ENABLED', '1' if enabled else '0')
+    spec = importlib.util.spec_from_file_location('metrics_under_test', os.path.join(REPO_ROOT, COPIES[0]))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Every Lambda image is built from its own src directory, so each has a copy
+def test_copies_are_identical():
+    contents = {}
+    for path in COPIES:
+        with open(os.path.join(REPO_ROOT, path), 'rb') as metrics_file:
+            contents[path] = metrics_file.read()
+    assert len(set(contents.values())) == 1, f'metrics.py copies differ: {COPIES}'
+
+
+def test_disabled_stages_do_not_share_fields(monkeypatch):
+    metrics = load_metrics(monkeypatch, enabled=False)
+    with metrics.stage('a') as first, metrics.stage('b') as second:
+        first.fields['rows'] = 1
+        assert first is not second
+        assert second.fields == {}
+
+
+def test_enabled_stage_is_totalled(monkeypatch, capsys):
+    metrics = load_metrics(monkeypatch, enabled=True)
+
+    @metrics.instrument('test_function')
+    def handler(event, context):
+        with metrics.stage('work', rows=3) as stage:
+            stage.bytes = 10
+        return {'statusCode': 200}
+
+    assert handler({}, None) == {'statusCode': 200}
+    lines = capsys.readouterr().out.splitlines()
+    assert '"stage": "work"' in lines[0] and '"rows": 3' in lines[0]
+    assert '"metric": "invocation"' in lines[1] and '"status_code": 200' in lines[1]
+    assert '"cold_start": true' in lines[1]
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from common import api_event, load_source
+from fake_polygon import FakePolygon
+from local_s3 import LocalS3
+
+BUCKET = 'stock-data-test'
+MANIFEST_KEY = 'training/manifests/SYM0/1_day.json'
+
+
+@pytest.fixture
+def collection(tmp_path, monkeypatch):
+    with FakePolygon() as polygon:
+        monkeypatch.setenv('POLYGON_API_URL', polygon.url)
+        monkeypatch.setenv('POLYGON_API_KEY', 'test')
+        monkeypatch.setenv('S3_BUCKET', BUCKET)
+        s3 = LocalS3(str(tmp_path))
+        yield load_source('collection_partitions', 'lambda/data_collection_and_processing/src/index.py', s3), s3
+
+
+def partition(min_date, max_date):
+    return {'key': f'{min_date}.csv.gz', 'min_date': min_date, 'max_date': max_date}
+
+
+def test_add_partitions_replaces_every_overlapping_partition():
+    manifest = load_source('collection_manifest', 'lambda/data_collection_and_processing/src/manifest.py')
+    current = {'partitions': [partition('2023-01-02', '2023-12-29'), partition('2024-01-02', '2024-12-31')]}
+
+    replaced = manifest.add_partitions(current, '2024-06-01', '2024-12-31', [partition('2024-06-03', '2024-12-31')])
+
+    assert replaced == [partition('2024-01-02', '2024-12-31')]
+    assert [p['min_date'] for p in current['partitions']] == ['2023-01-02', '2024-06-03']
+
+
+# Daily bars fall into one partition per year, so re-ingesting June onwards only
+# partly covers the 2024 partition. Its January-May rows are kept in a rewritten
+# file and every bar is read back exactly once. The old partition is read in the
+# format it was written in, whatever the re-ingest asks for.
+@pytest.mark.parametrize('first_format, second_format', [
+    ({'output_format': 'csv', 'codec': 'gzip'}, {'output_format': 'csv', 'codec': 'gzip'}),
+    ({'output_format': 'parquet'}, {'output_format': 'csv', 'codec': 'zstd'}),
+])
+def test_reingest_rewrites_partly_covered_partition(collection, first_format, second_format):
+    handler, s3 = collection
+    body = {'stock_symbol': 'SYM0', 'timespan': 'day', 'layout': 'partitioned'}
+
+    first = handler.handler(api_event({**body, **first_format, 'from': '2024-01-01', 'to': '2024-12-31'}), None)
+    assert first['statusCode'] == 200
+    old_key = json.loads(s3.get_object(Bucket=BUCKET, Key=MANIFEST_KEY)['Body'].read())['partitions'][0]['key']
+
+    second = handler.handler(api_event({**body, **second_format, 'from': '2024-06-01', 'to': '2024-12-31'}), None)
+    assert second['statusCode'] == 200
+    result = json.loads(second['body'])
+    assert result['replaced_partitions'] == 1
+    assert result['rewritten_partitions'] == 1
+
+    stored = json.loads(s3.get_object(Bucket=BUCKET, Key=MANIFEST_KEY)['Body'].read())
+    assert [(p['min_date'], p['max_date']) for p in stored['partitions']] == [
+        ('2024-01-14', '2024-05-31'), ('2024-06-14', '2024-12-31')
+    ]
+    assert old_key not in [p['key'] for p in stored['partitions']]
+    with pytest.raises(s3.exceptions.NoSuchKey):
+        s3.get_object(Bucket=BUCKET, Key=old_key)
+
+    partitions = load_source('prediction_partitions', 'lambda/data_prediction/src/partitions.py')
+    data = partitions.load_partitioned(s3, BUCKET, MANIFEST_KEY, ['t', 'close'])
+    # 152 days to the end of May and 214 after it, each less the 13 warm-up bars
+    assert len(data) == (152 - 13) + (214 - 13)
+    assert data['t'].is_unique
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from common import load_source
+from synthetic import FEATURE_COLUMNS, processed_frame
+
+pytest.importorskip('tensorflow')
+
+compact_model = load_source('compact_model', 'lambda/data_prediction/src/compact_model.py')
+
+TRAINERS = {
+    'lstm': 'docker/lstm/src/train.py',
+    'gru': 'docker/gru/src/train.py',
+}
+WINDOW_SIZE = 10
+
+
+@pytest.fixture(scope='module')
+def data():
+    return processed_frame(400, seed=1, timespan='minute'), processed_frame(300, seed=2, timespan='minute')
+
+
+# The prediction Lambda's NumPy forward pass over an exported LSTM/GRU gives
+# Keras' predictions: it standardizes the features and builds the windows
+# itself, and undoes the target scaling. Deviations are relative to the largest
+# prediction: within 1e-6 for float32 weights and 1e-3 for int8.
+@pytest.mark.parametrize('name', list(TRAINERS))
+def test_compact_rnn_matches_keras(name, data, tmp_path):
+    train_data, test_data = data
+    trainer = load_source(f'{name}_inference_train', TRAINERS[name])
+    trainer.WINDOW_SIZE = WINDOW_SIZE
+    trainer.EPOCHS = 1
+    model = trainer.fit_model(train_data[FEATURE_COLUMNS], train_data['close'])
+
+    X = test_data[FEATURE_COLUMNS].to_numpy(dtype=np.float32)
+    windows = trainer.sliding_windows(trainer.standardize(X, model.scaler['feature_mean'], model.scaler['feature_scale']), WINDOW_SIZE)
+    expected = model.predict(windows, verbose=0)[:, 0] * model.scaler['target_scale'] + model.scaler['target_mean']
+    scale = np.abs(expected).max()
+
+    for quantized, tolerance in ((False, 1e-6), (True, 1e-3)):
+        path = str(tmp_path / f'{name}_{quantized}.compact')
+        trainer.export_compact_model(model, path, quantized=quantized)
+        predictions = compact_model.load(path).predict(test_data[FEATURE_COLUMNS])
+
+        assert len(predictions) == len(test_data)
+        # The first window_size bars have no full window before them
+        assert np.isnan(predictions[:WINDOW_SIZE]).all()
+        np.testing.assert_allclose(predictions[WINDOW_SIZE:], expected, rtol=0, atol=tolerance * scale)
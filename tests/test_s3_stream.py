@@ -0,0 +1,41 @@
+import pytest
+
+from common import load_source
+from local_s3 import LocalS3
+
+s3_stream = load_source('s3_stream', 'lambda/data_collection_and_processing/src/s3_stream.py')
+
+BUCKET = 'stock-data-test'
+
+
+class FailingCompletionS3(LocalS3):
+    def complete_multipart_upload(self, **kwargs):
+        raise OSError('connection reset')
+
+
+def test_multipart_upload_is_written_in_parts(tmp_path):
+    s3 = LocalS3(str(tmp_path))
+    writer = s3_stream.S3StreamWriter(s3, BUCKET, 'data.csv', 'text/csv', part_size=10, concurrency=2)
+    for index in range(10):
+        writer.write(f'row {index:03d}\n'.encode())
+    writer.close()
+    assert s3.get_object(Bucket=BUCKET, Key='data.csv')['Body'].read() == b''.join(
+        f'row {index:03d}\n'.encode() for index in range(10)
+    )
+    assert s3.uploads == {}
+
+
+# A failed completion aborts the upload, and the writer is closed either way
+def test_failed_completion_aborts_the_upload(tmp_path):
+    s3 = FailingCompletionS3(str(tmp_path))
+    writer = s3_stream.S3CompressedWriter(s3, BUCKET, 'data.csv', 'text/csv', codec='none')
+    writer.target.part_size = 10
+    writer.write(b'0123456789' * 3)
+    assert writer.target.upload_id in s3.uploads
+
+    with pytest.raises(OSError):
+        writer.close()
+    assert s3.uploads == {}
+    assert writer.closed and writer.target.closed
+    with pytest.raises(s3.exceptions.NoSuchKey):
+        s3.get_object(Bucket=BUCKET, Key='data.csv')
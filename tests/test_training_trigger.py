@@ -0,0 +1,176 @@
+import json
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+from common import api_event, load_source
+from fake_polygon import FakePolygon
+from local_s3 import LocalS3
+from local_sagemaker import LocalSageMaker
+
+BUCKET = 'stock-data-test'
+MODELS = ('linear_regression', 'lstm')
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    with FakePolygon() as polygon:
+        monkeypatch.setenv('POLYGON_API_URL', polygon.url)
+        monkeypatch.setenv('POLYGON_API_KEY', 'test')
+        monkeypatch.setenv('S3_BUCKET', BUCKET)
+        monkeypatch.setenv('LINEAR_REGRESSION_SAGEMAKER_IMAGE_URI', 'local/linear_regression')
+        monkeypatch.setenv('LSTM_SAGEMAKER_IMAGE_URI', 'local/lstm')
+        s3 = LocalS3(str(tmp_path))
+        collection = load_source('collection_trigger', 'lambda/data_collection_and_processing/src/index.py', s3)
+        training = load_source('training_trigger', 'lambda/sagemaker_training/src/index.py', s3)
+        training.sagemaker = LocalSageMaker()
+        yield collection, training, s3
+
+
+# S3 as a role without s3:ListBucket sees it: a missing key is 403 AccessDenied
+class NoListS3(LocalS3):
+    def get_object(self, Bucket, Key, **kwargs):
+        try:
+            return super().get_object(Bucket=Bucket, Key=Key, **kwargs)
+        except LocalS3.exceptions.NoSuchKey:
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'GetObject')
+
+
+def collect(collection, stock_symbol, from_date, to_date):
+    body = {'stock_symbol': stock_symbol, 'timespan': 'day', 'from': from_date, 'to': to_date}
+    response = collection.handler(api_event(body), None)
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])['processed_file_key']
+
+
+# Uploads as the SQS queue delivers them: one S3 notification per message
+def sqs_event(keys):
+    return {'Records': [
+        {'eventSource': 'aws:sqs', 'body': json.dumps({'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}}]})}
+        for key in keys
+    ]}
+
+
+def trigger(training, keys):
+    response = training.handler(sqs_event(keys), None)
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])['runs']
+
+
+# Two uploads of SYM0 are trained together over a combined manifest; SYM1 is a
+# dataset of its own, even though it arrived in the same batch
+def test_batch_is_coalesced_per_dataset(pipeline):
+    collection, training, s3 = pipeline
+    first = collect(collection, 'SYM0', '2024-01-01', '2024-03-31')
+    second = collect(collection, 'SYM0', '2024-04-01', '2024-06-30')
+    other = collect(collection, 'SYM1', '2024-01-01', '2024-06-30')
+
+    runs = trigger(training, [first, second, other, first])
+    assert sorted(run['datasets'] for run in runs) == sorted([[first, second], [other]])
+    assert len(training.sagemaker.jobs) == 2 * len(MODELS)
+
+    combined = next(run for run in runs if len(run['datasets']) == 2)
+    manifest = json.loads(s3.get_object(Bucket=BUCKET, Key=combined['file_key'])['Body'].read())
+    assert (manifest['stock_symbol'], manifest['multiplier'], manifest['timespan'], manifest['time_column']) == ('SYM0', 1, 'day', 't')
+    assert [(p['key'], p['min_date'], p['max_date']) for p in manifest['partitions']] == [
+        (first, '2024-01-14', '2024-03-31'), (second, '2024-04-14', '2024-06-30')
+    ]
+
+    # Trainers select partitions of the combined manifest by date like any other
+    training_data = load_source('training_data', 'docker/shared/training_data.py')
+    data = training_data.load_dataset(s3, BUCKET, combined['file_key'], ['t', 'close'], '2024-05-01', '2024-05-31')
+    assert len(data) == 31
+    assert training_data.load_statistics(s3, BUCKET, combined['file_key'])['close']['count'] == len(
+        training_data.load_dataset(s3, BUCKET, combined['file_key'], ['close'])
+    )
+
+
+# Identical data, even under new keys, is not trained again while its jobs run
+# or after they complete; a failed job is retried
+def test_identical_data_is_skipped_until_a_job_fails(pipeline):
+    collection, training, s3 = pipeline
+    keys = [collect(collection, 'SYM0', '2024-01-01', '2024-06-30')]
+    trigger(training, keys)
+    assert len(training.sagemaker.jobs) == len(MODELS)
+
+    training.sagemaker.set_status('Completed')
+    reingested = [collect(collection, 'SYM0', '2024-01-01', '2024-06-30')]
+    assert reingested != keys
+    runs = trigger(training, reingested)
+    assert runs[0]['submitted'] == []
+    assert sorted(runs[0]['skipped']) == sorted(MODELS)
+
+    training.sagemaker.set_status('Failed')
+    runs = trigger(training, reingested)
+    assert len(runs[0]['submitted']) == len(MODELS)
+    assert len(training.sagemaker.jobs) == 2 * len(MODELS)
+
+
+def test_batch_without_data_starts_nothing(pipeline):
+    _, training, _ = pipeline
+    assert trigger(training, []) == []
+    assert training.sagemaker.jobs == {}
+
+
+# One job trains every model, so each model's hyperparameters carry its name;
+# the multi-model job sets them under their plain names while it trains it
+def test_multi_model_hyperparameters_are_namespaced(pipeline, monkeypatch):
+    _, training, _ = pipeline
+    monkeypatch.setattr(training, 'MULTI_MODEL_IMAGE_URI', 'local/multi_model')
+    monkeypatch.setattr(training, 'TRAINING_HYPERPARAMETERS', {'lstm': {'SEARCH_MODE': 'grid'}, 'linear_regression': {'SEARCH_MODE': 'random'}})
+    [job] = training.training_jobs('training/processed/SYM0.csv', 'digest')
+    assert job['environment'] == {
+        'MODELS': 'linear_regression,lstm', 'LINEAR_REGRESSION__SEARCH_MODE': 'random', 'LSTM__SEARCH_MODE': 'grid'
+    }
+
+    for name, value in job['environment'].items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv('SEARCH_MODE', raising=False)
+    multi_model = load_source('multi_model_train', 'docker/multi_model/src/train.py')
+    with multi_model.model_environment('lstm'):
+        assert multi_model.walk_forward_search.SEARCH_MODE == 'grid'
+    with multi_model.model_environment('linear_regression'):
+        assert multi_model.walk_forward_search.SEARCH_MODE == 'random'
+    assert 'SEARCH_MODE' not in os.environ
+    assert multi_model.walk_forward_search.SEARCH_MODE == ''
+
+
+# An upload whose bars a later one in the same batch covers is left out of the
+# combined manifest; bars two uploads share are read once, from the later one
+def test_combined_manifest_reads_overlapping_uploads_once(pipeline):
+    collection, training, s3 = pipeline
+    first = collect(collection, 'SYM0', '2024-01-01', '2024-03-31')
+    repeated = collect(collection, 'SYM0', '2024-01-01', '2024-03-31')
+    overlapping = collect(collection, 'SYM0', '2024-03-01', '2024-06-30')
+
+    [run] = trigger(training, [first, repeated, overlapping])
+    manifest = json.loads(s3.get_object(Bucket=BUCKET, Key=run['file_key'])['Body'].read())
+    assert manifest['sources'] == [first, repeated, overlapping]
+    assert [p['key'] for p in manifest['partitions']] == [repeated, overlapping]
+
+    training_data = load_source('training_data', 'docker/shared/training_data.py')
+    data = training_data.load_dataset(s3, BUCKET, run['file_key'], ['t', 'close'])
+    whole = training_data.load_dataset(s3, BUCKET, collect(collection, 'SYM0', '2024-01-01', '2024-06-30'), ['t', 'close'])
+    assert data['t'].is_unique and data['t'].is_monotonic_increasing
+    assert data['t'].tolist() == whole['t'].tolist()
+
+
+# Without s3:ListBucket a fingerprint not recorded yet, or a processed file
+# written before its statistics JSON, reads as 403; both count as absent
+def test_access_denied_reads_as_missing(pipeline, tmp_path):
+    collection, training, s3 = pipeline
+    keys = [collect(collection, 'SYM0', '2024-01-01', '2024-06-30')]
+    s3.delete_object(Bucket=BUCKET, Key=training.stats_key(keys[0]))
+    training.s3 = NoListS3(str(tmp_path))
+
+    runs = trigger(training, keys)
+    assert runs[0]['file_key'] == keys[0]
+    assert len(runs[0]['submitted']) == len(MODELS)
+
+    # Other errors are not taken for a missing key
+    def throttled(**kwargs):
+        raise ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'}}, 'GetObject')
+    training.s3.get_object = throttled
+    with pytest.raises(ClientError):
+        training.already_trained(BUCKET, training.training_jobs(keys[0], 'digest')[0])
@@ -0,0 +1,37 @@
+import pytest
+
+from common import load_source
+from synthetic import FEATURE_COLUMNS, processed_frame
+
+walk_forward_search = load_source('walk_forward_search', 'docker/shared/walk_forward_search.py')
+trainer = load_source('decision_tree_search_train', 'docker/decision_tree_regression/src/train.py')
+
+
+def test_walk_forward_splits_expand_in_time_order():
+    assert walk_forward_search.walk_forward_splits(60, 5) == [(10, 20), (20, 30), (30, 40), (40, 50), (50, 60)]
+    with pytest.raises(ValueError):
+        walk_forward_search.walk_forward_splits(4, 5)
+
+
+def test_random_candidates_are_a_sample_of_the_grid():
+    grid = {'max_depth': [2, 4, 8], 'min_samples_leaf': [1, 5]}
+    assert len(walk_forward_search.candidate_params(grid, 'grid')) == 6
+    sample = walk_forward_search.candidate_params(grid, 'random', 3)
+    assert len(sample) == 3
+    assert all(candidate in walk_forward_search.candidate_params(grid, 'grid') for candidate in sample)
+
+
+# The search picks the same configuration in this process (one worker, as in
+# the multi-model job) and with a forked pool
+@pytest.mark.parametrize('workers', [1, 2])
+def test_search_picks_best_complete_configuration(workers):
+    data = processed_frame(1200, seed=3)
+    candidates = [{'max_depth': 1}, {'max_depth': 8}]
+    best, results = walk_forward_search.search_hyperparameters(
+        data[FEATURE_COLUMNS], data['close'], trainer.build_model, candidates, n_splits=3, workers=workers
+    )
+    assert best == {'max_depth': 8}
+    assert results.loc[0, 'param_max_depth'] == 8
+    assert results.loc[0, 'status'] == 'complete'
+    assert set(results['status']) <= {'complete', 'abandoned'}
+    assert not walk_forward_search.search_data